@@ -0,0 +1,289 @@
+
+# coding: utf-8
+
+###
+# bulk administration of learner progress - deletes and puts go through BatchWriteItem, a mode migration
+# and the move from the table keyed by device_id only through conditional writes of single items
+#
+# python teachme_admin.py reset --devices classroom.txt
+# python teachme_admin.py reset --all                  # every item of the table
+# python teachme_admin.py seed --devices classroom.txt --corpus restaurant_corpus --step 3 --mode keywords
+# python teachme_admin.py migrate-mode --from-mode sentence --to-mode full
+# python teachme_admin.py copy-progress --from-table Conversation   # from the table keyed by device_id only
+###
+
+import os
+import sys
+import time
+import random
+import argparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from botocore.exceptions import ClientError
+
+from teachme_state_codec import decode_item, encode_item, encode_value, item_key, KEY_NAMES, MODE_IDS, \
+    DEFAULT_MAIN_COURSE
+
+BATCH_SIZE = 25 # BatchWriteItem limit
+
+
+def request_key(write_request):
+    if "PutRequest" in write_request:
+        return tuple(write_request["PutRequest"]["Item"][name] for name in KEY_NAMES)
+    return tuple(write_request["DeleteRequest"]["Key"][name] for name in KEY_NAMES)
+
+# batches of distinct keys, BatchWriteItem rejects a batch with two requests for the same key -
+# the last request for a key wins
+def batches(write_requests, size):
+    batch = {}
+    for write_request in write_requests:
+        batch[request_key(write_request)] = write_request
+        if len(batch) == size:
+            yield list(batch.values())
+            batch = {}
+    if batch:
+        yield list(batch.values())
+
+
+# one device id per line, blank lines and "#" comments are ignored
+def read_devices(path):
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                yield line
+
+
+# the keys of every scenario of a device
+def query_keys(table, device_id):
+    from boto3.dynamodb.conditions import Key
+    kwargs = {"KeyConditionExpression": Key("device_id").eq(device_id), "ProjectionExpression": "device_id, scenario"}
+    while True:
+        response = table.query(**kwargs)
+        for item in response["Items"]:
+            yield {name: item[name] for name in KEY_NAMES}
+        if "LastEvaluatedKey" not in response:
+            return
+        kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+# scan the table for the items matching the filters, e.g. {"corpus_name": "restaurant_corpus"}
+# the items are in either encoding, so the filters are applied to the decoded state, a scan
+# filter expression would read (and cost) the same items anyway
+def scan_items(table, filters):
+    filters = {field: value for field, value in filters.items() if value is not None}
+    kwargs = {}
+    while True:
+        response = table.scan(**kwargs)
+        for item in response["Items"]:
+            state = decode_item(item)
+            if all(state.get(field) == value for field, value in filters.items()):
+                yield item
+        if "LastEvaluatedKey" not in response:
+            return
+        kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+# write one batch, unprocessed items are retried with exponential backoff, returns (written, failed)
+# a batch that still fails is logged and skipped, the other batches go on
+def write_batch(dynamodb, table_name, write_requests, max_retries=8):
+    pending = {table_name: write_requests}
+    try:
+        for attempt in range(max_retries + 1):
+            response = dynamodb.batch_write_item(RequestItems=pending)
+            pending = response.get("UnprocessedItems") or {}
+            if not pending:
+                return len(write_requests), 0
+            time.sleep(min(0.05 * 2 ** attempt, 5) * random.uniform(0.5, 1.5))
+        error = "still unprocessed after {} retries".format(max_retries)
+    except ClientError as e:
+        error = e.response["Error"]["Message"]
+    failed = pending.get(table_name, write_requests)
+    log_failure("batch of {} items failed, first key {}: {}".format(len(failed), request_key(failed[0]), error))
+    return len(write_requests) - len(failed), len(failed)
+
+
+def log_failure(message, stream=sys.stderr):
+    stream.write("\n{}\n".format(message))
+    stream.flush()
+
+
+class Progress:
+    def __init__(self, label, stream=sys.stderr):
+        self.label = label
+        self.stream = stream
+        self.done = 0
+        self.failed = 0
+        self.start = time.time()
+        self.last_report = 0
+
+    def add(self, count, failed=0):
+        self.done += count
+        self.failed += failed
+        now = time.time()
+        if now - self.last_report < 0.5: # report at most twice a second
+            return
+        self.last_report = now
+        self.report()
+
+    def report(self):
+        elapsed = time.time() - self.start
+        self.stream.write("\r{}: {} items, {:.0f} items/s, {} failed".format(
+            self.label, self.done, self.done / max(elapsed, 1e-6), self.failed))
+        self.stream.flush()
+
+    def finish(self):
+        self.report()
+        self.stream.write("\n")
+        return self.done
+
+
+# run function(task) -> (done, failed) for every task with at most `workers` tasks in flight
+def run_tasks(function, tasks, workers=8, label="write"):
+    progress = Progress(label)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        in_flight = set()
+        for task in tasks:
+            if len(in_flight) >= workers * 2:
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    progress.add(*future.result())
+            in_flight.add(executor.submit(function, task))
+        for future in in_flight:
+            progress.add(*future.result())
+    progress.finish()
+    return progress
+
+# send the write requests in batches of 25
+def run_batches(dynamodb, table_name, write_requests, workers=8, label="write"):
+    return run_tasks(lambda batch: write_batch(dynamodb, table_name, batch), batches(write_requests, BATCH_SIZE),
+                     workers, label)
+
+
+###
+# operations
+###
+
+def reset_requests(keys):
+    for key in keys:
+        yield {"DeleteRequest": {"Key": key}}
+
+# put every device at the given step of a corpus, as if the learner had reached it - the restaurant
+# scenario gets the default main course, as when the skill starts a learner at a step
+def seed_requests(device_ids, corpus, step, mode_name):
+    meta_data = corpus.get_meta_data(str(step))
+    state = {"intent_id": meta_data["intent_id"], "corpus_name": meta_data["corpus_name"], "mode_name": mode_name}
+    if state["corpus_name"] == "restaurant_corpus":
+        state["main_course_name"] = DEFAULT_MAIN_COURSE
+    for device_id in device_ids:
+        yield {"PutRequest": {"Item": encode_item(device_id, state)}}
+
+# only the mode attribute of an item is updated, in the encoding of the item, and only if it still has the
+# mode it was scanned with - a learner who changed it (or moved on) since the scan keeps their progress
+def migrate_mode(table, item, to_mode):
+    from boto3.dynamodb.conditions import Attr
+    attribute_name = "m" if "v" in item else "mode_name"
+    value = encode_value(MODE_IDS, to_mode) if attribute_name == "m" else to_mode
+    try:
+        table.update_item(Key={name: item[name] for name in KEY_NAMES}, UpdateExpression="set #m = :to",
+                          ConditionExpression=Attr(attribute_name).eq(item[attribute_name]),
+                          ExpressionAttributeNames={"#m": attribute_name}, ExpressionAttributeValues={":to": value})
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+            return 0, 0
+        log_failure("{} failed: {}".format(item_key(item["device_id"], item["scenario"]),
+                                           e.response["Error"]["Message"]))
+        return 0, 1
+    return 1, 0
+
+# move an item of the table keyed by device_id only to (device_id, scenario) - it is only written if the device
+# has no progress in that scenario yet, so progress made in the skill since the deploy is kept, and the old item is
+# deleted so the skill does not move it again (it moves the item of a device on its first read)
+def move_progress(table, legacy_table, item):
+    from boto3.dynamodb.conditions import Attr
+    state = decode_item(item)
+    moved = 0
+    try:
+        if "corpus_name" in state and "intent_id" in state:
+            table.put_item(Item=encode_item(item["device_id"], state),
+                           ConditionExpression=Attr("device_id").not_exists())
+            moved = 1
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            log_failure("{} failed: {}".format(item["device_id"], e.response["Error"]["Message"]))
+            return 0, 1
+    try:
+        legacy_table.delete_item(Key={"device_id": item["device_id"]})
+    except ClientError as e:
+        log_failure("{} copied, not deleted: {}".format(item["device_id"], e.response["Error"]["Message"]))
+        return moved, 1
+    return moved, 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk operations on learner progress.")
+    parser.add_argument("--table", default="ConversationProgress")
+    parser.add_argument("--region", default="eu-west-2")
+    parser.add_argument("--endpoint-url", default="https://dynamodb.eu-west-2.amazonaws.com")
+    parser.add_argument("--workers", type=int, default=8, help="batches in flight")
+    subparsers = parser.add_subparsers(dest="operation", required=True)
+
+    reset = subparsers.add_parser("reset", help="delete the progress of the devices")
+    reset.add_argument("--devices", help="file with one device id per line, otherwise the filters are used")
+    reset.add_argument("--corpus", help="only this scenario, otherwise every scenario of the devices")
+    reset.add_argument("--mode")
+    reset.add_argument("--all", action="store_true", help="delete every item of the table, needed without a filter")
+
+    seed = subparsers.add_parser("seed", help="put the devices at a step of a corpus")
+    seed.add_argument("--devices", required=True)
+    seed.add_argument("--corpus", required=True, help="e.g. restaurant_corpus")
+    seed.add_argument("--step", type=int, default=0)
+    seed.add_argument("--mode", default="keywords")
+    seed.add_argument("--locale", default="en-GB")
+    seed.add_argument("--locale-dir", default="locales")
+
+    migrate = subparsers.add_parser("migrate-mode", help="rename a mode_name on every matching item")
+    migrate.add_argument("--from-mode", required=True)
+    migrate.add_argument("--to-mode", required=True)
+    migrate.add_argument("--corpus")
+
+    copy = subparsers.add_parser("copy-progress", help="move the progress from the table keyed by device_id only")
+    copy.add_argument("--from-table", default="Conversation")
+
+    args = parser.parse_args(argv)
+    if args.operation == "reset" and not (args.devices or args.corpus or args.mode or args.all):
+        parser.error("reset needs --devices, --corpus or --mode, or --all to delete every item")
+
+    import boto3
+    dynamodb = boto3.resource("dynamodb", region_name=args.region, endpoint_url=args.endpoint_url)
+    table = dynamodb.Table(args.table)
+
+    if args.operation == "reset":
+        if args.devices and args.corpus:
+            keys = (item_key(device_id, args.corpus) for device_id in read_devices(args.devices))
+        elif args.devices:
+            keys = (key for device_id in read_devices(args.devices) for key in query_keys(table, device_id))
+        else:
+            items = scan_items(table, {"corpus_name": args.corpus, "mode_name": args.mode})
+            keys = ({name: item[name] for name in KEY_NAMES} for item in items)
+        write_requests = reset_requests(keys)
+    elif args.operation == "seed":
+        from teachme_corpus import Corpus
+        corpus = Corpus(os.path.join(args.locale_dir, args.locale, args.corpus))
+        write_requests = seed_requests(read_devices(args.devices), corpus, args.step, args.mode)
+    elif args.operation == "migrate-mode":
+        items = scan_items(table, {"mode_name": args.from_mode, "corpus_name": args.corpus})
+        progress = run_tasks(lambda item: migrate_mode(table, item, args.to_mode), items, args.workers, args.operation)
+        return 1 if progress.failed else 0
+    else:
+        legacy_table = dynamodb.Table(args.from_table)
+        progress = run_tasks(lambda item: move_progress(table, legacy_table, item), scan_items(legacy_table, {}),
+                             args.workers, args.operation)
+        return 1 if progress.failed else 0
+
+    progress = run_batches(dynamodb, args.table, write_requests, workers=args.workers, label=args.operation)
+    return 1 if progress.failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
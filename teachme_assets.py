@@ -0,0 +1,166 @@
+
+# coding: utf-8
+
+###
+# card image assets - small and large variants of every corpus image, with content-hashed names
+#
+# python teachme_assets.py --bucket echo.learn.image.bucket
+# python teachme_assets.py --bucket test --endpoint-url http://localhost:9000   # s3-compatible local server
+# python teachme_assets.py --output-dir build/assets --base-url http://localhost:8080/ --source-dir images/
+###
+
+import io
+import os
+import sys
+import json
+import hashlib
+import argparse
+import posixpath
+from urllib.parse import urlparse
+from urllib.request import urlopen
+from concurrent.futures import ThreadPoolExecutor
+
+from teachme_corpus import corpus_filenames, iter_records
+
+# alexa card sizes, images are scaled down to fit and never scaled up
+VARIANTS = {"small": (720, 480), "large": (1200, 800)}
+JPEG_QUALITY = 80
+CONTENT_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png"}
+EXTENSIONS = {"JPEG": ".jpg", "PNG": ".png"}
+
+
+# every Img_url:: of every corpus under the locale directory
+def corpus_image_urls(locale_dir):
+    urls = set()
+    for locale_name in sorted(os.listdir(locale_dir)):
+        if not os.path.isdir(os.path.join(locale_dir, locale_name)):
+            continue
+        for corpus_filename in corpus_filenames(os.path.join(locale_dir, locale_name)):
+            with open(corpus_filename) as f:
+                for line_number, record in iter_records(f, corpus_filename):
+                    urls.add(record["Img_url"])
+    return sorted(urls)
+
+
+# the image from a local copy (file named like the url) if there is one, otherwise downloaded
+def read_source(url, source_dir=None):
+    if source_dir is not None:
+        path = os.path.join(source_dir, posixpath.basename(urlparse(url).path))
+        if os.path.isfile(path):
+            with open(path, "rb") as f:
+                return f.read()
+    with urlopen(url) as response:
+        return response.read()
+
+
+# scaled and recompressed copy of the image, returns (bytes, pillow format)
+def render_variant(source, size):
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(source))
+    image_format = "PNG" if image.format == "PNG" else "JPEG"
+    image.thumbnail(size, Image.LANCZOS)
+    output = io.BytesIO()
+    if image_format == "JPEG":
+        image.convert("RGB").save(output, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+    else:
+        image.save(output, "PNG", optimize=True)
+    return output.getvalue(), image_format
+
+
+def hashed_name(url, variant, data, image_format):
+    stem = posixpath.splitext(posixpath.basename(urlparse(url).path))[0]
+    return "{}-{}-{}{}".format(stem, variant, hashlib.sha256(data).hexdigest()[:12], EXTENSIONS[image_format])
+
+
+# where the variants go - an s3 (or s3-compatible) bucket, or a local directory
+class S3Target:
+    def __init__(self, bucket, prefix, base_url, endpoint_url=None, region="eu-west-2"):
+        import boto3
+        self.client = boto3.client("s3", region_name=region, endpoint_url=endpoint_url)
+        self.bucket = bucket
+        self.prefix = prefix
+        self.base_url = base_url or "{}/{}/".format(endpoint_url or "https://s3.{}.amazonaws.com".format(region), bucket)
+
+    def put(self, name, data, content_type):
+        key = self.prefix + name
+        # the name changes with the content, so the object can be cached forever
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=data, ContentType=content_type,
+                               CacheControl="public, max-age=31536000, immutable")
+        return self.base_url + key
+
+
+class DirectoryTarget:
+    def __init__(self, output_dir, base_url):
+        self.output_dir = output_dir
+        self.base_url = base_url
+        os.makedirs(output_dir, exist_ok=True)
+
+    def put(self, name, data, content_type):
+        with open(os.path.join(self.output_dir, name), "wb") as f:
+            f.write(data)
+        return self.base_url + name
+
+
+# build the variants of one image, skipped when the source is unchanged since the last manifest
+def build_image(url, target, previous, source_dir=None):
+    source = read_source(url, source_dir)
+    source_hash = hashlib.sha256(source).hexdigest()
+    if previous.get("source_sha256") == source_hash and all(variant in previous for variant in VARIANTS):
+        return previous
+    entry = {"source_sha256": source_hash}
+    for variant, size in VARIANTS.items():
+        data, image_format = render_variant(source, size)
+        entry[variant] = target.put(hashed_name(url, variant, data, image_format), data, CONTENT_TYPES[image_format])
+    return entry
+
+# what the variants are rendered with, a manifest written with other settings is not reused
+def render_settings():
+    return {"variants": {variant: list(size) for variant, size in VARIANTS.items()}, "jpeg_quality": JPEG_QUALITY}
+
+def build_manifest(urls, target, manifest_path, source_dir=None, workers=8):
+    previous = {}
+    if os.path.isfile(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if {key: manifest.get(key) for key in render_settings()} == render_settings():
+            previous = manifest["images"]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        entries = executor.map(lambda url: build_image(url, target, previous.get(url, {}), source_dir), urls)
+        images = dict(zip(urls, entries))
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump(dict(render_settings(), images=images), f, indent=4, sort_keys=True)
+    os.replace(manifest_path + ".tmp", manifest_path)
+    return images
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build small and large card image variants and the asset manifest.")
+    parser.add_argument("--locale-dir", default="locales")
+    parser.add_argument("--manifest", default="assets.json")
+    parser.add_argument("--source-dir", help="local copies of the images, named like the last part of the url")
+    parser.add_argument("--bucket", help="upload to this s3 bucket")
+    parser.add_argument("--prefix", default="cards/")
+    parser.add_argument("--endpoint-url", help="s3-compatible server, e.g. http://localhost:9000")
+    parser.add_argument("--region", default="eu-west-2")
+    parser.add_argument("--output-dir", help="write to this directory instead of s3")
+    parser.add_argument("--base-url", help="public url of the uploaded variants")
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    if args.output_dir:
+        target = DirectoryTarget(args.output_dir, args.base_url or "")
+    elif args.bucket:
+        target = S3Target(args.bucket, args.prefix, args.base_url, args.endpoint_url, args.region)
+    else:
+        parser.error("either --bucket or --output-dir is needed")
+
+    urls = corpus_image_urls(args.locale_dir)
+    images = build_manifest(urls, target, args.manifest, args.source_dir, args.workers)
+    for url, entry in sorted(images.items()):
+        print("{}\n  small: {}\n  large: {}".format(url, entry["small"], entry["large"]))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,183 @@
+
+# coding: utf-8
+
+###
+# microbenchmarks of the building blocks in teachme_learn_v1.py
+#
+# python teachme_benchmark.py --save-baseline    # record the baseline of this machine
+# python teachme_benchmark.py --threshold 0.2    # fail when a benchmark is 20% slower than its baseline
+###
+
+import os
+import sys
+import json
+import timeit
+import argparse
+import tempfile
+
+# in-memory store, no warm up thread, no capacity summaries - the state mode is set per benchmark
+os.environ.setdefault("TEACHME_STORE", "local")
+os.environ.setdefault("TEACHME_STATE_SECRET", "teachme-benchmark")
+os.environ.setdefault("TEACHME_WARM_UP", "0")
+os.environ.setdefault("TEACHME_CAPACITY_SUMMARY_INTERVAL", "0")
+
+import teachme_learn_v1 as teachme
+
+CORPUS_SIZES = [10, 100, 1000, 10000, 100000] # steps
+DEFAULT_BASELINE = "benchmark_baseline.json"
+
+
+def default_corpus(corpus_name):
+    return teachme.get_locale(teachme.DEFAULT_LOCALE).get_corpus(corpus_name)
+
+# a corpus of `steps` steps, made by repeating the records of the restaurant corpus
+def write_corpus(path, steps):
+    corpus_path = os.path.join(teachme.LOCALE_DIR, teachme.DEFAULT_LOCALE, "restaurant_corpus")
+    with open(corpus_path) as f:
+        lines = f.read().split("\n")
+    records = [lines[i:i + 7] for i in range(0, len(lines) - 6, 7)]
+    with open(path, "w") as f:
+        for step in range(steps):
+            record = list(records[step % len(records)])
+            record[0] = "Meta:: {}, step_{}_intent, benchmark_corpus".format(step, step)
+            f.write("\n".join(record))
+            f.write("\n")
+
+def card_texts():
+    texts = []
+    for corpus_name in ["restaurant_corpus", "symptom_corpus"]:
+        corpus = default_corpus(corpus_name)
+        texts.extend(corpus.data[intent_id]["card_text"] for intent_id in corpus.data)
+    return texts
+
+
+###
+# benchmarks - name -> (function, calls per measurement)
+###
+
+def corpus_benchmarks(directory):
+    benchmarks = {}
+    for steps in CORPUS_SIZES:
+        path = os.path.join(directory, "corpus_{}".format(steps))
+        write_corpus(path, steps)
+        benchmarks["load_corpus[{}]".format(steps)] = (lambda path=path: teachme.Corpus(path), max(1, 10000 // steps))
+    return benchmarks
+
+def keyword_benchmarks():
+    texts = card_texts()
+    # the uncached functions, otherwise only the lru cache lookup is measured
+    extract_keywords = teachme.extract_keywords.__wrapped__
+    ignore_keywords = teachme.ignore_keywords.__wrapped__
+    return {
+        "extract_keywords": (lambda: [extract_keywords(text) for text in texts], 200),
+        "ignore_keywords": (lambda: [ignore_keywords(text) for text in texts], 200),
+    }
+
+def card_benchmarks():
+    corpus = default_corpus("restaurant_corpus")
+    def build_cards():
+        teachme.extract_keywords.cache_clear()
+        teachme.ignore_keywords.cache_clear()
+        for intent_id in corpus.data:
+            teachme.build_card_content(corpus, intent_id, "keywords")
+            teachme.build_card_content(corpus, intent_id, "sentence")
+    return {"build_card_content": (build_cards, 200)}
+
+# an alexa intent request of a session, the slots a handler does not take are ignored
+def alexa_request(session_id, intent_name, attributes, new):
+    slots = {"mode_name": {"name": "mode_name", "value": "keywords"},
+             "food_name": {"name": "food_name", "value": "chicken noodle soup"}}
+    return json.dumps({
+        "version": "1.0",
+        "session": {"new": new, "sessionId": session_id, "attributes": attributes,
+                    "application": {"applicationId": "benchmark"}, "user": {"userId": "benchmark-user"}},
+        "context": {"System": {"device": {"deviceId": "benchmark-device"},
+                               "application": {"applicationId": "benchmark"}, "user": {"userId": "benchmark-user"}}},
+        "request": {"type": "IntentRequest", "requestId": "benchmark-request", "locale": teachme.DEFAULT_LOCALE,
+                    "timestamp": "2026-01-01T00:00:00Z", "intent": {"name": intent_name, "slots": slots}}})
+
+# a whole restaurant conversation through the app against the in-memory store, in both state modes -
+# dynamodb mode reads and writes the table on every turn, session mode carries the state in the
+# session attributes and writes a checkpoint every TEACHME_CHECKPOINT_INTERVAL turns
+def state_benchmarks():
+    corpus = default_corpus("restaurant_corpus")
+    intent_names = [corpus.meta_data[str(i)]["intent_name"] for i in range(len(corpus.meta_data))]
+    teachme.app.config["ASK_VERIFY_REQUESTS"] = False
+    client = teachme.app.test_client()
+    def conversation(state_mode):
+        teachme.STATE_MODE = state_mode
+        attributes = {}
+        for step, intent_name in enumerate(intent_names):
+            response = client.post("/", data=alexa_request("benchmark-session", intent_name, attributes, step == 0),
+                                   content_type="application/json")
+            if response.status_code != 200:
+                raise RuntimeError("{} answered {}".format(intent_name, response.status_code))
+            attributes = json.loads(response.get_data(as_text=True)).get("sessionAttributes", {})
+            response.close()
+    return {"conversation_state[{}]".format(state_mode): (lambda state_mode=state_mode: conversation(state_mode), 20)
+            for state_mode in ["dynamodb", "session"]}
+
+
+# best time per call of `repeat` measurements, the minimum is the least noisy estimate
+def measure(function, number, repeat):
+    return min(timeit.repeat(function, number=number, repeat=repeat)) / number
+
+def run(selected=None, repeat=5):
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        benchmarks = {}
+        benchmarks.update(corpus_benchmarks(directory))
+        benchmarks.update(keyword_benchmarks())
+        benchmarks.update(card_benchmarks())
+        benchmarks.update(state_benchmarks())
+        for name, (function, number) in benchmarks.items():
+            if selected and not any(part in name for part in selected):
+                continue
+            results[name] = measure(function, number, repeat)
+            print("{:<28} {:>12.1f} us".format(name, results[name] * 1e6))
+    return results
+
+# names of the benchmarks slower than baseline * (1 + threshold)
+def regressions(results, baseline, threshold):
+    slower = []
+    for name, seconds in sorted(results.items()):
+        if name in baseline and seconds > baseline[name] * (1 + threshold):
+            slower.append((name, baseline[name], seconds))
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks with regression thresholds.")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown, 0.2 = 20%%")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", nargs="*", help="run the benchmarks whose name contains one of these")
+    args = parser.parse_args()
+
+    results = run(args.only, args.repeat)
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=4, sort_keys=True)
+        print("baseline saved to {}".format(args.baseline))
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("no baseline at {}, run with --save-baseline first".format(args.baseline))
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    slower = regressions(results, baseline, args.threshold)
+    for name, before, after in slower:
+        print("REGRESSION {}: {:.1f} us -> {:.1f} us ({:+.0%})".format(name, before * 1e6, after * 1e6, after / before - 1))
+    return 1 if slower else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
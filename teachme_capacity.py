@@ -0,0 +1,88 @@
+
+# coding: utf-8
+
+###
+# consumed dynamodb capacity, aggregated per intent, corpus, device cohort and time window
+###
+
+import time
+import zlib
+import threading
+import collections
+
+
+def device_cohort(device_id, cohorts):
+    return zlib.crc32(str(device_id).encode()) % cohorts
+
+
+class CapacityAccounting:
+    def __init__(self, window_seconds=60, windows=60, cohorts=16):
+        self.window_seconds = window_seconds
+        self.windows = windows # number of recent windows kept
+        self.cohorts = cohorts
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.requests = 0
+        self.totals = [0.0, 0.0] # read units, write units since startup
+        self.by_intent = collections.defaultdict(lambda: [0.0, 0.0, 0])
+        self.by_corpus = collections.defaultdict(lambda: [0.0, 0.0, 0])
+        self.by_cohort = collections.defaultdict(lambda: [0.0, 0.0, 0])
+        self.by_window = collections.OrderedDict() # window start -> [read, write, requests]
+
+    # consumed units of one request
+    def add(self, intent_name, corpus_name, device_id, read_units, write_units, now=None):
+        now = time.time() if now is None else now
+        window = int(now // self.window_seconds) * self.window_seconds
+        with self.lock:
+            self.requests += 1
+            self.totals[0] += read_units
+            self.totals[1] += write_units
+            for table, key in [(self.by_intent, intent_name), (self.by_corpus, corpus_name or "-"),
+                               (self.by_cohort, device_cohort(device_id, self.cohorts))]:
+                self.add_units(table[key], read_units, write_units)
+            if window not in self.by_window:
+                self.by_window[window] = [0.0, 0.0, 0]
+                while len(self.by_window) > self.windows:
+                    self.by_window.popitem(last=False)
+            self.add_units(self.by_window[window], read_units, write_units)
+
+    @staticmethod
+    def add_units(entry, read_units, write_units):
+        entry[0] += read_units
+        entry[1] += write_units
+        entry[2] += 1
+
+    @staticmethod
+    def rows(table):
+        return {str(key): {"read_units": read, "write_units": write, "requests": requests,
+                           "units_per_request": (read + write) / requests if requests else 0.0}
+                for key, (read, write, requests) in table.items()}
+
+    def snapshot(self):
+        with self.lock:
+            return {"since": self.started,
+                    "requests": self.requests,
+                    "read_units": self.totals[0],
+                    "write_units": self.totals[1],
+                    "by_intent": self.rows(self.by_intent),
+                    "by_corpus": self.rows(self.by_corpus),
+                    "by_cohort": self.rows(self.by_cohort),
+                    "by_window": self.rows(self.by_window)}
+
+    # the intents that cost the most since startup, for the periodic summary
+    def summary(self, limit=5):
+        snapshot = self.snapshot()
+        top = sorted(snapshot["by_intent"].items(), key=lambda row: row[1]["read_units"] + row[1]["write_units"],
+                     reverse=True)[:limit]
+        return {"requests": snapshot["requests"], "read_units": snapshot["read_units"],
+                "write_units": snapshot["write_units"],
+                "top_intents": {name: round(row["read_units"] + row["write_units"], 2) for name, row in top}}
+
+    def start_summary_thread(self, interval, log):
+        def run():
+            while True:
+                time.sleep(interval)
+                log.info("consumed capacity", extra={"fields": self.summary()})
+        thread = threading.Thread(target=run, name="capacity-summary", daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,153 @@
+
+# coding: utf-8
+
+###
+# opt-in capture of the incoming skill requests, anonymised, with their timing - replayed by teachme_replay.py
+###
+
+import io
+import os
+import time
+import json
+import hmac
+import queue
+import hashlib
+import threading
+
+from werkzeug.wsgi import ClosingIterator
+
+# ids replaced by a keyed hash, the same id always gets the same pseudonym so sessions and devices still line up
+PSEUDONYMISED_KEYS = frozenset(["userId", "deviceId", "sessionId", "requestId", "personId"])
+# credentials, never written
+DROPPED_KEYS = frozenset(["accessToken", "apiAccessToken", "consentToken"])
+# slots the learner fills with their own words, the value is replaced by a pseudonym and the entity
+# resolutions (which repeat it) are dropped
+FREE_TEXT_SLOTS = frozenset(["scenario_query", "food_name"])
+DROPPED_SLOT_KEYS = frozenset(["resolutions", "slotValue"])
+
+
+def pseudonym(value, secret):
+    return "anon." + hmac.new(secret, value.encode(), hashlib.sha256).hexdigest()[:32]
+
+def anonymize(value, secret):
+    if isinstance(value, dict):
+        result = {}
+        for key, item in value.items():
+            if key in DROPPED_KEYS:
+                continue
+            if key in PSEUDONYMISED_KEYS and isinstance(item, str):
+                item = pseudonym(item, secret)
+            elif key == "slots" and isinstance(item, dict):
+                item = {name: anonymize_slot(slot, secret) if name in FREE_TEXT_SLOTS else slot
+                        for name, slot in item.items()}
+            result[key] = anonymize(item, secret)
+        return result
+    if isinstance(value, list):
+        return [anonymize(item, secret) for item in value]
+    return value
+
+def anonymize_slot(slot, secret):
+    if not isinstance(slot, dict):
+        return slot
+    slot = {key: value for key, value in slot.items() if key not in DROPPED_SLOT_KEYS}
+    if isinstance(slot.get("value"), str):
+        slot["value"] = pseudonym(slot["value"], secret)
+    return slot
+
+
+# writes the captured requests as json lines from a background thread, a file is rotated at max_bytes and
+# only the newest max_files files of this process are kept
+class CaptureWriter:
+    def __init__(self, directory, secret, max_bytes=64 * 1024 * 1024, max_files=20, queue_size=10000):
+        self.directory = directory
+        self.secret = secret
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.queue = queue.Queue(queue_size)
+        self.prefix = "capture-{}-".format(os.getpid())
+        self.sequence = 0
+        self.f = None
+        self.dropped = 0 # requests not captured because the writer fell behind
+        os.makedirs(directory, exist_ok=True)
+        self.thread = threading.Thread(target=self.run, name="capture-writer", daemon=True)
+        self.thread.start()
+
+    # never blocks the request, a full queue drops the entry
+    def record(self, arrived, elapsed, status, body):
+        try:
+            self.queue.put_nowait((arrived, elapsed, status, body))
+        except queue.Full:
+            self.dropped += 1
+
+    def run(self):
+        while True:
+            entry = self.queue.get()
+            if entry is None:
+                break
+            arrived, elapsed, status, body = entry
+            try:
+                request_json = anonymize(json.loads(body.decode("utf-8")), self.secret)
+            except ValueError:
+                continue
+            if self.f is None or self.f.tell() >= self.max_bytes:
+                self.rotate()
+            self.f.write(json.dumps({"time": arrived, "elapsed": elapsed, "status": status,
+                                     "request": request_json}) + "\n")
+            if self.queue.empty():
+                self.f.flush()
+        if self.f is not None:
+            self.f.close()
+
+    def rotate(self):
+        if self.f is not None:
+            self.f.close()
+        self.sequence += 1
+        name = "{}{}-{:04d}.jsonl".format(self.prefix, time.strftime("%Y%m%dT%H%M%S"), self.sequence)
+        self.f = open(os.path.join(self.directory, name), "w")
+        own_files = sorted(name for name in os.listdir(self.directory) if name.startswith(self.prefix))
+        for old_name in own_files[:-self.max_files]:
+            os.remove(os.path.join(self.directory, old_name))
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+
+# wsgi middleware, times every skill request and hands the body to the writer
+class CaptureMiddleware:
+    def __init__(self, wsgi_app, writer, path="/"):
+        self.wsgi_app = wsgi_app
+        self.writer = writer
+        self.path = path
+
+    def __call__(self, environ, start_response):
+        if environ.get("REQUEST_METHOD") != "POST" or environ.get("PATH_INFO") != self.path:
+            return self.wsgi_app(environ, start_response)
+
+        arrived = time.time()
+        start = time.perf_counter()
+        body = read_body(environ)
+        environ["wsgi.input"] = io.BytesIO(body) # the app reads the body again
+        environ["CONTENT_LENGTH"] = str(len(body))
+        status = []
+
+        def capture_start_response(status_line, headers, exc_info=None):
+            status.append(int(status_line.split(" ", 1)[0]))
+            return start_response(status_line, headers, exc_info)
+
+        # recorded once the server has sent the response and closed it, so the response building is timed as well
+        def record():
+            self.writer.record(arrived, time.perf_counter() - start, status[0] if status else None, body)
+
+        return ClosingIterator(self.wsgi_app(environ, capture_start_response), record)
+
+
+# the request body - a chunked request has no content length, it is read to the end when the server marks
+# the input as terminated (reading an input that is not terminated to the end could block)
+def read_body(environ):
+    stream = environ["wsgi.input"]
+    if environ.get("CONTENT_LENGTH"):
+        return stream.read(int(environ["CONTENT_LENGTH"]))
+    if environ.get("wsgi.input_terminated"):
+        return stream.read()
+    return b""
@@ -0,0 +1,135 @@
+
+# coding: utf-8
+
+###
+# model of corpus - a streaming parser, and parallel loading of a directory of corpora
+#
+# python teachme_corpus.py locales/en-GB    # parse and check every corpus of a directory
+###
+
+import os
+import re
+import sys
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+# each conversational step is these 6 lines, steps are separated by blank lines
+FIELDS = ["Meta", "Y", "A", "C", "Context", "Img_url"]
+DATA_FIELDS = {"Y": "user_response", "A": "alexa_response", "C": "card_text", "Context": "context", "Img_url": "img_url"}
+# the keywords of a card sentence are in parentheses
+KEYWORD_PATTERN = re.compile(r"\(([a-zA-Z0-9 \']+)\)")
+TOKEN_PATTERN = re.compile(r"[a-z0-9']+")
+
+
+# lower case words of a sentence, shared by the grader and the scenario search
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class CorpusError(ValueError):
+    def __init__(self, corpus_filename, line_number, message):
+        super().__init__("{}:{}: {}".format(corpus_filename, line_number, message))
+        self.corpus_filename = corpus_filename
+        self.line_number = line_number
+        self.message = message
+
+    # an error raised in a worker process of load_corpora is pickled with its fields, not only the text
+    def __reduce__(self):
+        return type(self), (self.corpus_filename, self.line_number, self.message)
+
+
+# yield (line number, {field: value}) for every step while reading, one step is held in memory at a time
+def iter_records(lines, corpus_filename="<corpus>"):
+    record = {}
+    start_line = None
+    for line_number, line in enumerate(lines, 1):
+        if not line.strip():
+            if record:
+                raise CorpusError(corpus_filename, line_number, "blank line inside the step starting at line {}".format(start_line))
+            continue
+        name, separator, value = line.partition("::")
+        expected = FIELDS[len(record)]
+        if not separator or name.strip() != expected:
+            raise CorpusError(corpus_filename, line_number, "expected a '{}::' line".format(expected))
+        if not record:
+            start_line = line_number
+        record[expected] = value.strip().replace("\\n", "\n")
+        if len(record) == len(FIELDS):
+            if record["Meta"].count(",") < 2:
+                raise CorpusError(corpus_filename, start_line, "expected 'Meta:: <id>, <intent name>, <corpus name>'")
+            yield start_line, record
+            record = {}
+    if record:
+        raise CorpusError(corpus_filename, start_line, "incomplete step, missing '{}::'".format(FIELDS[len(record)]))
+
+
+class Corpus:
+    def __init__(self, corpus_filename, asset_manifest=None):
+        self.meta_data = {}
+        self.data = {}
+        self.intent_ids = {} # intent name -> intent id
+        self.asset_manifest = asset_manifest or {} # image url -> {"small": url, "large": url}
+
+        self.load_corpus(corpus_filename)
+
+    def load_corpus(self, corpus_filename):
+        with open(corpus_filename) as f:
+            for step, (line_number, record) in enumerate(iter_records(f, corpus_filename)):
+                intent_id = str(step)
+                meta = record["Meta"].split(",")
+                self.meta_data[intent_id] = {"intent_id": intent_id,
+                                             "intent_name": meta[1].strip(),
+                                             "corpus_name": meta[-1].strip()}
+                self.intent_ids[meta[1].strip()] = intent_id
+                self.data[intent_id] = {DATA_FIELDS[name]: record[name] for name in DATA_FIELDS}
+                # the original image is used for both card fields until the assets are built
+                variants = self.asset_manifest.get(record["Img_url"], {})
+                self.data[intent_id]["small_img_url"] = variants.get("small", record["Img_url"])
+                self.data[intent_id]["large_img_url"] = variants.get("large", record["Img_url"])
+
+    def get_meta_data(self, intent_id): # return dict
+        return self.meta_data[intent_id]
+
+    def get_data(self, intent_id):
+        return self.data[intent_id] # return dict
+
+    def get_intent_id(self, intent_name): # None if the intent is not a step of this corpus
+        return self.intent_ids.get(intent_name)
+
+    def get_end_id(self):
+        return len(self.meta_data)
+
+
+# every file of a directory except the json files is a corpus
+def corpus_filenames(directory):
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                  if not name.endswith(".json") and os.path.isfile(os.path.join(directory, name)))
+
+# parse the corpora of a directory across a process pool, returns {corpus file name: Corpus}
+def load_corpora(directory, processes=None):
+    filenames = corpus_filenames(directory)
+    if processes == 1 or len(filenames) < 2:
+        corpora = [Corpus(filename) for filename in filenames]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            corpora = list(executor.map(Corpus, filenames))
+    return {os.path.basename(filename): corpus for filename, corpus in zip(filenames, corpora)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parse and check every corpus of a directory.")
+    parser.add_argument("directory")
+    parser.add_argument("--processes", type=int, default=None, help="default: one per core")
+    args = parser.parse_args()
+    try:
+        corpora = load_corpora(args.directory, args.processes)
+    except CorpusError as e:
+        print(e)
+        return 1
+    for name, corpus in sorted(corpora.items()):
+        print("{}: {} steps".format(name, corpus.get_end_id()))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
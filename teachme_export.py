@@ -0,0 +1,219 @@
+
+# coding: utf-8
+
+###
+# export of the conversation table - parallel segmented scan, streamed to compressed part files
+#
+# every part file is written under a temporary name and only counted once it is closed and renamed,
+# the checkpoint lists the finished files and the scan position after them, so a resumed export
+# deletes whatever an interrupted run left behind and continues from the last finished file
+#
+# python teachme_export.py --output export/
+# python teachme_export.py --output export/ --endpoint-url http://localhost:8000 # dynamodb local
+###
+
+import os
+import re
+import json
+import gzip
+import base64
+import argparse
+import threading
+import decimal
+from concurrent.futures import ThreadPoolExecutor
+
+PART_PATTERN = re.compile(r"^part-\d+-\d+\.")
+
+
+# dynamodb numbers are Decimal, binary attributes (the schedule entries) are base64
+def to_json(value):
+    from boto3.dynamodb.types import Binary
+    if isinstance(value, Binary):
+        value = value.value
+    if isinstance(value, (bytes, bytearray)):
+        return base64.b64encode(value).decode("ascii")
+    if isinstance(value, decimal.Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    raise TypeError("cannot export {!r}".format(value))
+
+
+# progress of every segment, saved after each finished part file so an interrupted export can be resumed
+class Checkpoint:
+    def __init__(self, path, total_segments):
+        self.path = path
+        self.lock = threading.Lock()
+        self.segments = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                saved = json.load(f)
+            if saved["total_segments"] != total_segments:
+                raise ValueError("checkpoint {} was written with {} segments".format(path, saved["total_segments"]))
+            self.segments = {int(segment): progress for segment, progress in saved["segments"].items()}
+        self.total_segments = total_segments
+
+    def get(self, segment):
+        return self.segments.get(segment, {"last_key": None, "done": False, "items": 0, "files": []})
+
+    def files(self):
+        with self.lock:
+            return set(name for progress in self.segments.values() for name in progress.get("files", []))
+
+    def update(self, segment, last_key, items, files):
+        with self.lock:
+            self.segments[segment] = {"last_key": last_key, "done": last_key is None, "items": items,
+                                      "files": list(files)}
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w") as f:
+                json.dump({"total_segments": self.total_segments, "segments": self.segments}, f, default=to_json)
+            os.replace(temp_path, self.path)
+
+
+# jsonl.gz
+class JsonlWriter:
+    extension = ".jsonl.gz"
+
+    def __init__(self, path):
+        self.f = gzip.open(path, "wt", encoding="utf-8")
+
+    def write(self, items):
+        for item in items:
+            self.f.write(json.dumps(item, default=to_json))
+            self.f.write("\n")
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+
+# the attributes of the conversation items in every encoding (see teachme_state_codec.py) and of the schedule
+# items, an item without an attribute has a null - m and c hold an id, or the name of a mode or corpus without
+# one, so they are strings
+PARQUET_COLUMNS = [("device_id", "string"), ("scenario", "string"), ("v", "int64"), ("i", "int64"), ("m", "string"),
+                   ("mc", "string"), ("u", "int64"), ("c", "string"), ("intent_id", "string"),
+                   ("intent_name", "string"), ("corpus_name", "string"), ("mode_name", "string"),
+                   ("main_course_name", "string"), ("corpora", "string"), ("entries", "string"),
+                   ("version", "int64")]
+
+# parquet - one row group per scanned page, needs pyarrow
+# every file has the same columns, attributes outside PARQUET_COLUMNS are kept as json in the "other" column
+class ParquetWriter:
+    extension = ".parquet"
+
+    def __init__(self, path):
+        import pyarrow
+        import pyarrow.parquet
+        self.pyarrow = pyarrow
+        self.schema = pyarrow.schema([(name, getattr(pyarrow, kind)()) for name, kind in PARQUET_COLUMNS] +
+                                     [("other", pyarrow.string())])
+        self.path = path
+        self.writer = None
+
+    @staticmethod
+    def column_value(value, kind):
+        if value is None:
+            return None
+        return int(value) if kind == "int64" else str(value)
+
+    def write(self, items):
+        if not items:
+            return
+        rows = [json.loads(json.dumps(item, default=to_json)) for item in items]
+        columns = {name: [self.column_value(row.pop(name, None), kind) for row in rows]
+                   for name, kind in PARQUET_COLUMNS}
+        columns["other"] = [json.dumps(row, sort_keys=True) if row else None for row in rows]
+        if self.writer is None:
+            self.writer = self.pyarrow.parquet.ParquetWriter(self.path, self.schema)
+        self.writer.write_table(self.pyarrow.Table.from_pydict(columns, schema=self.schema))
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+WRITERS = {"jsonl": JsonlWriter, "parquet": ParquetWriter}
+
+
+# scan one segment page by page, items are written as soon as a page arrives, every pages_per_file pages
+# the part file is closed, renamed to its final name and recorded in the checkpoint
+def export_segment(table, segment, total_segments, output_dir, writer_class, checkpoint, page_size,
+                   pages_per_file=10):
+    progress = checkpoint.get(segment)
+    if progress["done"]:
+        return progress["items"]
+
+    last_key = progress["last_key"]
+    items = progress["items"]
+    files = list(progress["files"])
+    while True:
+        name = "part-{:05d}-{:06d}{}".format(segment, len(files), writer_class.extension)
+        temp_path = os.path.join(output_dir, name + ".tmp")
+        writer = writer_class(temp_path)
+        file_items = 0
+        try:
+            for _ in range(pages_per_file):
+                kwargs = {"Segment": segment, "TotalSegments": total_segments, "Limit": page_size}
+                if last_key is not None:
+                    kwargs["ExclusiveStartKey"] = last_key
+                response = table.scan(**kwargs)
+                writer.write(response["Items"])
+                file_items += len(response["Items"])
+                last_key = response.get("LastEvaluatedKey")
+                if last_key is None:
+                    break
+        finally:
+            writer.close()
+        if os.path.exists(temp_path): # parquet writes no file without items
+            os.replace(temp_path, os.path.join(output_dir, name))
+            files.append(name)
+        items += file_items
+        checkpoint.update(segment, last_key, items, files)
+        if last_key is None:
+            return items
+
+# part files that no checkpoint entry lists, left by an interrupted run
+def remove_unfinished_parts(output_dir, checkpoint):
+    finished = checkpoint.files()
+    for name in os.listdir(output_dir):
+        if PART_PATTERN.match(name) and name not in finished:
+            os.remove(os.path.join(output_dir, name))
+
+
+def export_table(table, output_dir, total_segments=8, workers=8, output_format="jsonl", page_size=1000,
+                 pages_per_file=10):
+    os.makedirs(output_dir, exist_ok=True)
+    checkpoint = Checkpoint(os.path.join(output_dir, "checkpoint.json"), total_segments)
+    remove_unfinished_parts(output_dir, checkpoint)
+    writer_class = WRITERS[output_format]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(export_segment, table, segment, total_segments, output_dir,
+                                   writer_class, checkpoint, page_size, pages_per_file)
+                   for segment in range(total_segments)]
+        return sum(future.result() for future in futures)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the conversation table to compressed part files.")
+    parser.add_argument("--output", required=True, help="output directory, also holds the resume checkpoint")
+    parser.add_argument("--table", default="ConversationProgress")
+    parser.add_argument("--region", default="eu-west-2")
+    parser.add_argument("--endpoint-url", default="https://dynamodb.eu-west-2.amazonaws.com",
+                        help="e.g. http://localhost:8000 for dynamodb local")
+    parser.add_argument("--segments", type=int, default=8, help="parallel scan segments")
+    parser.add_argument("--workers", type=int, default=8, help="scanning threads")
+    parser.add_argument("--format", choices=sorted(WRITERS), default="jsonl")
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--pages-per-file", type=int, default=10)
+    args = parser.parse_args()
+
+    import boto3
+    dynamodb = boto3.resource("dynamodb", region_name=args.region, endpoint_url=args.endpoint_url)
+    items = export_table(dynamodb.Table(args.table), args.output, total_segments=args.segments,
+                         workers=args.workers, output_format=args.format, page_size=args.page_size,
+                         pages_per_file=args.pages_per_file)
+    print("exported {} items to {}".format(items, args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+
+# coding: utf-8
+
+###
+# offline grading of recorded learner utterances - keyword recall and similarity to the expected sentence
+#
+# python teachme_grader.py transcripts/*.jsonl.gz --report report.csv
+# python teachme_grader.py week42.jsonl --scores scores.csv.gz --cohort-field classroom
+#
+# every input line is one recorded turn:
+#   {"corpus_name": "restaurant_corpus", "intent_id": "1", "utterance": "...", "cohort": "2026-W42"}
+# the utterance of step n is graded against the Y:: sentence of step n and the keywords in
+# parentheses of the C:: line of step n - 1 (the card the learner was reading)
+###
+
+import os
+import sys
+import csv
+import gzip
+import json
+import argparse
+import itertools
+
+import numpy as np
+
+from teachme_corpus import Corpus, corpus_filenames, tokenize, KEYWORD_PATTERN
+
+
+# the expected sentences and keywords of every step as sparse (target, token) arrays over a shared vocabulary
+class Targets:
+    def __init__(self, corpora):
+        self.vocabulary = {}
+        self.index = {} # (corpus name, intent id) -> target
+        expected = [] # (target, token, count)
+        keywords = [] # (target, phrase, token), the tokens of a phrase are consecutive
+        phrase_counts = []
+        phrase_id = 0
+        for corpus in corpora:
+            previous_card = ""
+            for step in range(corpus.get_end_id()):
+                intent_id = str(step)
+                target = len(self.index)
+                self.index[(corpus.get_meta_data(intent_id)["corpus_name"], intent_id)] = target
+                data = corpus.get_data(intent_id)
+                tokens = [self.token_id(token) for token in tokenize(data["user_response"])]
+                for token, count in zip(*np.unique(np.array(tokens, dtype=np.int64), return_counts=True)):
+                    expected.append((target, token, count))
+                phrases = [tokenize(phrase) for phrase in KEYWORD_PATTERN.findall(previous_card)]
+                phrases = [phrase for phrase in phrases if phrase]
+                for phrase in phrases:
+                    phrase_id += 1
+                    keywords.extend((target, phrase_id, self.token_id(token)) for token in phrase)
+                phrase_counts.append(len(phrases))
+                previous_card = data["card_text"]
+
+        self.size = len(self.vocabulary)
+        expected = np.array(expected, dtype=np.int64).reshape(-1, 3)
+        self.expected_keys = expected[:, 0] * self.size + expected[:, 1]
+        order = np.argsort(self.expected_keys, kind="stable")
+        self.expected_keys = self.expected_keys[order]
+        self.expected_counts = expected[order, 2].astype(np.float64)
+        self.expected_norms = np.sqrt(np.bincount(expected[:, 0], weights=expected[:, 2] ** 2.0,
+                                                  minlength=len(self.index)))
+
+        keywords = np.array(keywords, dtype=np.int64).reshape(-1, 3)
+        self.keyword_tokens = keywords[:, 2]
+        self.keyword_phrase_start = np.ones(len(keywords), dtype=bool)
+        self.keyword_phrase_start[1:] = keywords[1:, 1] != keywords[:-1, 1]
+        self.keyword_offsets = np.searchsorted(keywords[:, 0], np.arange(len(self.index) + 1))
+        self.phrase_counts = np.array(phrase_counts, dtype=np.float64)
+
+    def token_id(self, token):
+        return self.vocabulary.setdefault(token, len(self.vocabulary))
+
+
+# similarity (cosine of token counts) and keyword recall of a chunk of utterances, targets are all known
+def grade(targets, utterances, target_ids):
+    rows = len(utterances)
+    size = targets.size
+    unknown = {} # tokens outside the vocabulary only count towards the length of the utterance
+    row_ids = []
+    token_ids = []
+    for row, utterance in enumerate(utterances):
+        token_ids.extend(targets.vocabulary[token] if token in targets.vocabulary
+                         else unknown.setdefault(token, size + len(unknown)) for token in tokenize(utterance))
+        row_ids.extend(itertools.repeat(row, len(token_ids) - len(row_ids)))
+    row_ids = np.array(row_ids, dtype=np.int64)
+    token_ids = np.array(token_ids, dtype=np.int64)
+    target_ids = np.asarray(target_ids, dtype=np.int64)
+
+    # counts of every distinct (utterance, token)
+    width = size + len(unknown)
+    keys, counts = np.unique(row_ids * width + token_ids, return_counts=True)
+    key_rows = keys // width
+    key_tokens = keys % width
+    counts = counts.astype(np.float64)
+    norms = np.sqrt(np.bincount(key_rows, weights=counts ** 2, minlength=rows))
+
+    known = key_tokens < size
+    key_rows = key_rows[known]
+    key_tokens = key_tokens[known]
+    present_keys = key_rows * size + key_tokens # sorted, as keys were
+
+    expected = lookup(targets.expected_keys, target_ids[key_rows] * size + key_tokens, targets.expected_counts)
+    dots = np.bincount(key_rows, weights=counts[known] * expected, minlength=rows)
+    denominators = norms * targets.expected_norms[target_ids]
+    similarity = np.divide(dots, denominators, out=np.zeros(rows), where=denominators > 0)
+
+    # the keyword tokens of every utterance's target, one run per utterance, a phrase is recalled
+    # when all its tokens were said
+    starts = targets.keyword_offsets[target_ids]
+    lengths = targets.keyword_offsets[target_ids + 1] - starts
+    pair_rows = np.repeat(np.arange(rows), lengths)
+    pairs = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+    said = lookup(present_keys, pair_rows * size + targets.keyword_tokens[pairs], np.ones(len(present_keys))) > 0
+    phrase_starts = np.flatnonzero(targets.keyword_phrase_start[pairs])
+    recalled = np.zeros(rows)
+    if len(phrase_starts):
+        recalled = np.bincount(pair_rows[phrase_starts], weights=np.logical_and.reduceat(said, phrase_starts),
+                               minlength=rows)
+    phrase_counts = targets.phrase_counts[target_ids]
+    recall = np.divide(recalled, phrase_counts, out=np.full(rows, np.nan), where=phrase_counts > 0)
+    return similarity, recall
+
+
+# values of the sorted keys at the queries, 0 where a query is not a key
+def lookup(sorted_keys, queries, values):
+    positions = np.minimum(np.searchsorted(sorted_keys, queries), max(len(sorted_keys) - 1, 0))
+    if not len(sorted_keys):
+        return np.zeros(len(queries))
+    return np.where(sorted_keys[positions] == queries, values[positions], 0.0)
+
+
+def read_turns(paths):
+    for path in paths:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# sums per (cohort, target), grown as new groups turn up
+class Report:
+    def __init__(self):
+        self.groups = {}
+        self.sums = np.zeros((0, 4)) # utterances, similarity, graded for keywords, keyword recall
+
+    def add(self, cohorts, target_ids, similarity, recall):
+        group_ids = np.array([self.groups.setdefault(group, len(self.groups))
+                              for group in zip(cohorts, target_ids.tolist())], dtype=np.int64)
+        if len(self.groups) > len(self.sums):
+            self.sums = np.vstack([self.sums, np.zeros((len(self.groups) - len(self.sums), 4))])
+        graded = ~np.isnan(recall)
+        for column, weights in enumerate([np.ones(len(group_ids)), similarity, graded, np.where(graded, recall, 0.0)]):
+            self.sums[:, column] += np.bincount(group_ids, weights=weights, minlength=len(self.sums))
+
+    def rows(self, targets):
+        names = {target: name for name, target in targets.index.items()}
+        for (cohort, target), group in sorted(self.groups.items(), key=lambda item: (item[0][0], item[0][1])):
+            utterances, similarity, graded, recall = self.sums[group]
+            corpus_name, intent_id = names[target]
+            yield {"cohort": cohort, "corpus_name": corpus_name, "intent_id": intent_id,
+                   "utterances": int(utterances), "similarity": round(similarity / utterances, 4),
+                   "keyword_recall": round(recall / graded, 4) if graded else ""}
+
+
+def open_output(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "wt", encoding="utf-8", newline="")
+    return open(path, "w", newline="")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Grade recorded learner utterances against the corpora.")
+    parser.add_argument("transcripts", nargs="+", help="jsonl files, optionally gzipped")
+    parser.add_argument("--corpus-dir", default=os.path.join("locales", "en-GB"))
+    parser.add_argument("--cohort-field", default="cohort")
+    parser.add_argument("--chunk-size", type=int, default=100000, help="utterances graded at once")
+    parser.add_argument("--scores", help="write the score of every utterance to this csv (.gz to compress)")
+    parser.add_argument("--report", help="write the per cohort and step report to this csv instead of stdout")
+    args = parser.parse_args()
+
+    targets = Targets(Corpus(filename) for filename in corpus_filenames(args.corpus_dir))
+    report = Report()
+    skipped = 0
+    scores_file = open_output(args.scores) if args.scores else None
+    scores = csv.writer(scores_file) if scores_file else None
+    if scores:
+        scores.writerow(["cohort", "corpus_name", "intent_id", "similarity", "keyword_recall"])
+    try:
+        for chunk in chunks(read_turns(args.transcripts), args.chunk_size):
+            turns = [turn for turn in chunk
+                     if (turn.get("corpus_name"), str(turn.get("intent_id"))) in targets.index]
+            skipped += len(chunk) - len(turns)
+            if not turns:
+                continue
+            target_ids = np.array([targets.index[(turn["corpus_name"], str(turn["intent_id"]))] for turn in turns],
+                                  dtype=np.int64)
+            cohorts = [str(turn.get(args.cohort_field, "-")) for turn in turns]
+            similarity, recall = grade(targets, [turn.get("utterance", "") for turn in turns], target_ids)
+            report.add(cohorts, target_ids, similarity, recall)
+            if scores:
+                scores.writerows(zip(cohorts, (turn["corpus_name"] for turn in turns),
+                                     (str(turn["intent_id"]) for turn in turns), np.round(similarity, 4),
+                                     ["" if np.isnan(value) else round(value, 4) for value in recall]))
+    finally:
+        if scores_file:
+            scores_file.close()
+
+    fields = ["cohort", "corpus_name", "intent_id", "utterances", "similarity", "keyword_recall"]
+    report_file = open_output(args.report) if args.report else sys.stdout
+    writer = csv.DictWriter(report_file, fields)
+    writer.writeheader()
+    writer.writerows(report.rows(targets))
+    if args.report:
+        report_file.close()
+    if skipped:
+        print("skipped {} utterances of unknown corpus steps".format(skipped), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,9 +4,18 @@
 # In[1]:
 
 
+import os
+import json
+import hmac
+import time
+import hashlib
 import logging
-from flask import Flask
-from flask_ask import Ask, statement, question, context
+import threading
+import functools
+import collections
+from flask import Flask, jsonify, request, g, has_request_context
+from flask_ask import Ask, statement, question, context, session
+from flask_ask import request as ask_request
 
 import boto3
 from boto3.dynamodb.conditions import Key, Attr
@@ -20,22 +29,126 @@ from botocore.exceptions import ClientError
 # framework set up
 ###
 
-# add debug logs
-# log = logging.getLogger()
-# log.addHandler(logging.StreamHandler())
-# log.setLevel(logging.DEBUG)
-logging.getLogger("flask_ask").setLevel(logging.DEBUG)
+# structured logs, written by a background listener, never on the request thread
+# e.g. TEACHME_LOG_LEVELS="root=INFO,flask_ask=DEBUG" and TEACHME_LOG_SAMPLE_RATE=0.01
+from teachme_logging import setup_logging, parse_levels
+from teachme_scheduler import Schedule
+from teachme_corpus import Corpus, corpus_filenames, KEYWORD_PATTERN
+from teachme_search import ScenarioIndex
+from teachme_state_codec import update_expression, decode_item, encode_item, item_key, DEFAULT_MAIN_COURSE, \
+    SCHEDULE_SCENARIO
+from teachme_capacity import CapacityAccounting
+LOG_LEVELS = parse_levels(os.environ.get("TEACHME_LOG_LEVELS", "root=INFO,flask_ask=INFO,teachme=INFO"))
+LOG_SAMPLE_RATE = float(os.environ.get("TEACHME_LOG_SAMPLE_RATE", "0.01")) # fraction of the flask-ask request dumps
+log_listener = setup_logging(LOG_LEVELS, sampled_loggers={"flask_ask": LOG_SAMPLE_RATE})
+log = logging.getLogger("teachme")
 
 # initialise flask-ask
 app = Flask(__name__)
 ask = Ask(app, "/")
 
+###
+# request verification set up
+###
+
+# the signing certificates are downloaded and validated once per url, not on every request
+CERT_CACHE_SIZE = int(os.environ.get("TEACHME_CERT_CACHE_SIZE", "16"))
+CERT_CACHE_TTL = int(os.environ.get("TEACHME_CERT_CACHE_TTL", "3600")) # seconds
+
+from flask_ask import verifier
+from teachme_verification import CertificateCache
+certificate_cache = CertificateCache(max_size=CERT_CACHE_SIZE, ttl=CERT_CACHE_TTL)
+verifier.load_certificate = certificate_cache.get
+
+###
+# profiling set up
+###
+
+# profile a sampled fraction of requests, off by default
+PROFILE_ENABLED = os.environ.get("TEACHME_PROFILE", "0") == "1"
+PROFILE_SAMPLE_RATE = float(os.environ.get("TEACHME_PROFILE_SAMPLE_RATE", "0.1"))
+PROFILE_DIR = os.environ.get("TEACHME_PROFILE_DIR", "profiles")
+# /profile answers only requests with this token (X-Profile-Token header), it is off without one
+PROFILE_TOKEN = os.environ.get("TEACHME_PROFILE_TOKEN", "")
+
+profiler = None
+if PROFILE_ENABLED:
+    from teachme_profiling import ProfilerMiddleware
+    profiler = ProfilerMiddleware(app.wsgi_app, sample_rate=PROFILE_SAMPLE_RATE, output_dir=PROFILE_DIR)
+    app.wsgi_app = profiler
+
+# top hot functions since startup, e.g. /profile?limit=30&sort=own
+@app.route("/profile", methods=["GET"])
+def profile_endpoint():
+    if profiler is None or not PROFILE_TOKEN:
+        return jsonify({"error": "profiling is disabled, set TEACHME_PROFILE=1 and TEACHME_PROFILE_TOKEN"}), 404
+    if not hmac.compare_digest(request.headers.get("X-Profile-Token", ""), PROFILE_TOKEN):
+        return jsonify({"error": "invalid profile token"}), 403
+    profiler.dump()
+    return jsonify(profiler.top_functions(limit=int(request.args.get("limit", 20)),
+                                          sort_by=request.args.get("sort", "cumulative")))
+
+###
+# traffic capture set up
+###
+
+# anonymised skill requests with their timing, written to rotated files for teachme_replay.py, off by default
+CAPTURE_DIR = os.environ.get("TEACHME_CAPTURE_DIR", "") # e.g. captures
+CAPTURE_MAX_BYTES = int(os.environ.get("TEACHME_CAPTURE_MAX_BYTES", str(64 * 1024 * 1024))) # per file
+CAPTURE_MAX_FILES = int(os.environ.get("TEACHME_CAPTURE_MAX_FILES", "20")) # per worker process
+# the ids of the requests are replaced by keyed hashes, use the same secret on every worker
+CAPTURE_SECRET = os.environ.get("TEACHME_CAPTURE_SECRET", "")
+
+capture_writer = None
+if CAPTURE_DIR:
+    from teachme_capture import CaptureWriter, CaptureMiddleware
+    capture_writer = CaptureWriter(CAPTURE_DIR, (CAPTURE_SECRET or os.urandom(16).hex()).encode(),
+                                   max_bytes=CAPTURE_MAX_BYTES, max_files=CAPTURE_MAX_FILES)
+    app.wsgi_app = CaptureMiddleware(app.wsgi_app, capture_writer)
+
 ###
 # database set up
 ###
 
-dynamodb = boto3.resource("dynamodb", region_name="eu-west-2", endpoint_url="https://dynamodb.eu-west-2.amazonaws.com")
-table = dynamodb.Table("Conversation") # the key is device_id
+# "dynamodb" or "local" - an in-memory table for local runs, benchmarks and replays
+STORE = os.environ.get("TEACHME_STORE", "dynamodb")
+
+# the table keyed by device_id only, the progress of a device is moved from it on its first read -
+# set to "" once teachme_admin.py copy-progress has moved every item
+LEGACY_TABLE = os.environ.get("TEACHME_LEGACY_CONVERSATION_TABLE", "Conversation")
+
+# the progress of every scenario of a device, the key is device_id and scenario (the corpus name),
+# and the practice schedule of the device under the scenario "#schedule"
+CONVERSATION_TABLE = os.environ.get("TEACHME_CONVERSATION_TABLE", "ConversationProgress")
+
+if STORE == "local":
+    from teachme_local_store import LocalTable, LocalDatabase
+    table = LocalTable("device_id", "scenario", name=CONVERSATION_TABLE)
+    legacy_table = LocalTable("device_id", name=LEGACY_TABLE) if LEGACY_TABLE else None
+    dynamodb = LocalDatabase(table)
+else:
+    dynamodb = boto3.resource("dynamodb", region_name="eu-west-2", endpoint_url="https://dynamodb.eu-west-2.amazonaws.com")
+    table = dynamodb.Table(CONVERSATION_TABLE)
+    legacy_table = dynamodb.Table(LEGACY_TABLE) if LEGACY_TABLE else None
+
+# consumed capacity of every call, per intent, corpus, device cohort and time window - see /metrics
+CAPACITY_WINDOW = int(os.environ.get("TEACHME_CAPACITY_WINDOW", "60")) # seconds
+CAPACITY_SUMMARY_INTERVAL = int(os.environ.get("TEACHME_CAPACITY_SUMMARY_INTERVAL", "300")) # seconds, 0 - off
+capacity = CapacityAccounting(window_seconds=CAPACITY_WINDOW)
+if CAPACITY_SUMMARY_INTERVAL > 0:
+    capacity.start_summary_thread(CAPACITY_SUMMARY_INTERVAL, log)
+
+###
+# conversation state set up
+###
+
+# "session" - carry the state in signed session attributes, dynamodb is only written for resume
+# "dynamodb" - read and write dynamodb on every turn
+STATE_MODE = os.environ.get("TEACHME_STATE_MODE", "session")
+STATE_SECRET = os.environ.get("TEACHME_STATE_SECRET", "") # signs the session state, the same on every worker
+if STATE_MODE == "session" and not STATE_SECRET:
+    raise RuntimeError("TEACHME_STATE_SECRET must be set when TEACHME_STATE_MODE is session")
+CHECKPOINT_INTERVAL = int(os.environ.get("TEACHME_CHECKPOINT_INTERVAL", "3")) # turns between dynamodb writes
 
 
 # In[41]:
@@ -45,47 +158,342 @@ table = dynamodb.Table("Conversation") # the key is device_id
 # database utils
 ###
 
-# get data from dynomodb, key error - no item found
-def get_item(key): # key - device id
-    key_dict = {"device_id": key}
+# keep the consumed capacity of a call, it is added to the totals at the end of the request
+def record_capacity(kind, response): # kind - "read" or "write"
+    consumed = response.get("ConsumedCapacity", {})
+    if isinstance(consumed, list): # batch calls, one entry per table
+        units = sum(entry.get("CapacityUnits", 0.0) for entry in consumed)
+    else:
+        units = consumed.get("CapacityUnits", 0.0)
+    read_units, write_units = (units, 0.0) if kind == "read" else (0.0, units)
+    if has_request_context():
+        consumed = g.setdefault("consumed_capacity", [0.0, 0.0])
+        consumed[0] += read_units
+        consumed[1] += write_units
+    else: # e.g. the warm up
+        capacity.add("background", None, "-", read_units, write_units)
+
+# get data of a scenario from dynomodb, None - no item found
+def get_item(key, corpus_name): # key - device id
+    key_dict = item_key(key, corpus_name)
     try:
-        response = table.get_item(Key=key_dict)
+        response = table.get_item(Key=key_dict, ReturnConsumedCapacity="TOTAL")
     except ClientError as e:
-        print(e.response["Error"]["Message"])
+        log.error("dynamodb error", extra={"fields": {"key": key, "error": e.response["Error"]["Message"]}})
     else:
-        item = response["Item"]
-        return item
-
-# put/update data to dynamodb
-def update_item(key, intent_id, intent_name, corpus_name, mode_name):
-    key_dict = {"device_id": key}
-    expression ="set intent_id = :a, intent_name = :b, corpus_name = :c, mode_name = :d"
-    expression_values = {":a": intent_id, ":b": intent_name, ":c": corpus_name, ":d": mode_name}
+        record_capacity("read", response)
+        return response.get("Item")
+
+# the items of every scenario of a device, in a single query
+def query_items(key): # key - device id
+    kwargs = {"KeyConditionExpression": Key("device_id").eq(key), "ReturnConsumedCapacity": "TOTAL"}
+    items = []
+    try:
+        while True:
+            response = table.query(**kwargs)
+            record_capacity("read", response)
+            items.extend(response["Items"])
+            if "LastEvaluatedKey" not in response:
+                return items
+            kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+    except ClientError as e:
+        log.error("dynamodb error", extra={"fields": {"key": key, "error": e.response["Error"]["Message"]}})
+        return items
+
+# put/update the whole state of a scenario to dynamodb
+# the item is written in the compact encoding, see teachme_state_codec.py
+def update_item(key, state):
+    key_dict = item_key(key, state["corpus_name"])
+    expression, expression_names, expression_values = update_expression(dict(state, updated=int(time.time())))
     try:
         response = table.update_item(Key=key_dict, UpdateExpression=expression, 
+                                     ExpressionAttributeNames=expression_names,
                                      ExpressionAttributeValues=expression_values,
-                                     ReturnValues="UPDATED_NEW")
+                                     ReturnValues="NONE",
+                                     ReturnConsumedCapacity="TOTAL")
     except ClientError as e:
-        print(e.response["Error"]["Message"])
+        log.error("dynamodb error", extra={"fields": {"key": key, "error": e.response["Error"]["Message"]}})
+    else:
+        record_capacity("write", response)
         
-def update_item_attribute(key, attribute_name, attribute_value):
-    key_dict = {"device_id": key}
-    expression ="set {} = :a".format(attribute_name)
-    expression_values = {":a": attribute_value}
+# add an attribute to the saved state of a scenario, a scenario without a saved state is left without an item
+def update_item_attribute(key, corpus_name, attribute_name, attribute_value):
+    key_dict = item_key(key, corpus_name)
+    expression, expression_names, expression_values = update_expression({attribute_name: attribute_value}, whole_state=False)
+    values = {"ExpressionAttributeValues": expression_values} if expression_values else {} # None only removes
     try:
         response = table.update_item(Key=key_dict, UpdateExpression=expression, 
-                                     ExpressionAttributeValues=expression_values,
-                                     ReturnValues="UPDATED_NEW")
+                                     ExpressionAttributeNames=expression_names,
+                                     ConditionExpression=Attr("i").exists(),
+                                     ReturnValues="NONE",
+                                     ReturnConsumedCapacity="TOTAL", **values)
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+            return
+        log.error("dynamodb error", extra={"fields": {"key": key, "error": e.response["Error"]["Message"]}})
+    else:
+        record_capacity("write", response)
+
+# move the progress of a device from the legacy table, it is only written if the device has no progress in that
+# scenario yet - the legacy item is deleted, so progress cleared later is not read from it again
+# returns the state, None if the device has no legacy progress
+def move_legacy_item(key): # key - device id
+    if legacy_table is None:
+        return None
+    try:
+        response = legacy_table.get_item(Key={"device_id": key}, ReturnConsumedCapacity="TOTAL")
+        record_capacity("read", response)
+        item = response.get("Item")
+        if item is None:
+            return None
+        state = decode_item(item, intent_name_of)
+        if "corpus_name" not in state or "intent_id" not in state:
+            state = None
+        else:
+            try:
+                response = table.put_item(Item=encode_item(key, state),
+                                          ConditionExpression=Attr("device_id").not_exists(),
+                                          ReturnConsumedCapacity="TOTAL")
+                record_capacity("write", response)
+            except ClientError as e:
+                if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                    raise
+                state = None # the progress made since is newer
+        response = legacy_table.delete_item(Key={"device_id": key}, ReturnConsumedCapacity="TOTAL")
+        record_capacity("write", response)
     except ClientError as e:
-        print(e.response["Error"]["Message"])
+        log.error("dynamodb error", extra={"fields": {"key": key, "error": e.response["Error"]["Message"]}})
+        return None
+    return state
 
 # delete data from dynamodb, delete non-exiting item will not throw an error
-def delete_item(key):
-    key_dict = {"device_id": key}
+def delete_item(key, corpus_name):
+    key_dict = item_key(key, corpus_name)
+    try:
+        response = table.delete_item(Key=key_dict, ReturnConsumedCapacity="TOTAL")
+    except ClientError as e:
+        log.error("dynamodb error", extra={"fields": {"key": key, "error": e.response["Error"]["Message"]}})
+    else:
+        record_capacity("write", response)
+
+# delete the items of several scenarios of a device, in batches of up to 25 deletes - unprocessed deletes are
+# sent again a few times
+def delete_items(key, corpus_names, attempts=4):
+    write_requests = [{"DeleteRequest": {"Key": item_key(key, corpus_name)}} for corpus_name in corpus_names]
     try:
-        response = table.delete_item(Key=key_dict)
+        for start in range(0, len(write_requests), 25):
+            pending = {table.name: write_requests[start:start + 25]}
+            for attempt in range(attempts):
+                response = dynamodb.batch_write_item(RequestItems=pending, ReturnConsumedCapacity="TOTAL")
+                record_capacity("write", response)
+                pending = response.get("UnprocessedItems")
+                if not pending:
+                    break
+                time.sleep(0.05 * 2 ** attempt)
+            else:
+                log.warning("items not deleted", extra={"fields": {"key": key, "items": len(pending[table.name])}})
     except ClientError as e:
-        print(e.response["Error"]["Message"])
+        log.error("dynamodb error", extra={"fields": {"key": key, "error": e.response["Error"]["Message"]}})
+
+
+###
+# conversation state utils
+###
+
+# signature of the state, so a tampered session attribute is not trusted
+def sign_state(state):
+    payload = json.dumps(state, sort_keys=True)
+    return hmac.new(STATE_SECRET.encode(), payload.encode(), hashlib.sha256).hexdigest()
+
+# get the conversation state of the scenario of the intent, from the session attributes if the session is in
+# that scenario, otherwise from dynamodb - without progress in that scenario the intent is out of order in the
+# scenario of the session, or the scenario starts at its first step if the session has none
+def get_state(key, corpus_name): # key - device id
+    current = session_state() if STATE_MODE == "session" else None
+    if current is not None and current.get("corpus_name") == corpus_name:
+        g.corpus_name = corpus_name
+        return dict(current)
+    
+    item = get_item(key, corpus_name)
+    state = decode_item(item, intent_name_of) if item is not None else move_legacy_item(key)
+    if state is None or state.get("corpus_name") != corpus_name:
+        state = dict(current) if current is not None else start_state(corpus_name)
+        g.corpus_name = state["corpus_name"]
+        return state
+    g.corpus_name = corpus_name
+    if STATE_MODE == "session":
+        flush_session_state(key) # the unsaved turns of the scenario the session was in
+        set_session_state(state, 0)
+    return state
+
+# the first step of a scenario, it is only saved once the learner moves on
+def start_state(corpus_name):
+    return {"intent_id": "0", "intent_name": intent_name_of(corpus_name, "0"), "corpus_name": corpus_name,
+            "mode_name": None}
+
+# the intent name of a step is not stored, it comes from the corpus
+def intent_name_of(corpus_name, intent_id):
+    return get_locale(DEFAULT_LOCALE).get_corpus(corpus_name).get_meta_data(intent_id)["intent_name"]
+
+# the state of every scenario of a device, the most recently practised first, and its practice schedule -
+# from a single query, a device without progress may still have it in the legacy table
+def get_progress(key): # key - device id
+    progress = []
+    schedule = Schedule()
+    for item in query_items(key):
+        if item["scenario"] == SCHEDULE_SCENARIO:
+            schedule = Schedule.decode(item)
+        else:
+            progress.append(decode_item(item, intent_name_of))
+    if not progress:
+        state = move_legacy_item(key)
+        progress = [state] if state is not None else []
+    progress.sort(key=lambda state: state.get("updated", 0), reverse=True)
+    return progress, schedule
+
+# continue a scenario from its saved state, the session state is newer if the session is in that scenario
+def resume_state(key, state):
+    if STATE_MODE == "session":
+        current = session_state()
+        if current is not None and current.get("corpus_name") == state["corpus_name"]:
+            state = current
+        else:
+            flush_session_state(key) # the unsaved turns of the scenario of this session
+            set_session_state(state, 0)
+    g.corpus_name = state["corpus_name"]
+    return state
+
+# the state in the session attributes, None if there is none or its signature does not match
+def session_state():
+    state = session.attributes.get("state")
+    signature = session.attributes.get("state_signature", "")
+    if state is None or not hmac.compare_digest(sign_state(state), signature):
+        return None
+    return state
+
+def set_session_state(state, unsaved_turns):
+    session.attributes["state"] = state
+    session.attributes["state_signature"] = sign_state(state)
+    session.attributes["unsaved_turns"] = unsaved_turns
+
+# write the conversation state, dynamodb is only written on a checkpoint in session mode
+def save_state(key, intent_id, intent_name, corpus_name, mode_name, checkpoint=False):
+    g.corpus_name = corpus_name
+    if STATE_MODE != "session":
+        update_item(key, {"intent_id": intent_id, "intent_name": intent_name,
+                          "corpus_name": corpus_name, "mode_name": mode_name})
+        return
+    
+    state = dict(session_state() or {})
+    if state.get("corpus_name") != corpus_name: # a new scenario does not keep the old attributes
+        flush_session_state(key) # the progress of the other scenario is kept
+        state = {}
+    state.update({"intent_id": intent_id, "intent_name": intent_name,
+                  "corpus_name": corpus_name, "mode_name": mode_name})
+    
+    unsaved_turns = session.attributes.get("unsaved_turns", 0) + 1
+    if checkpoint or unsaved_turns >= CHECKPOINT_INTERVAL:
+        flush_state(key, state)
+        unsaved_turns = 0
+    set_session_state(state, unsaved_turns)
+
+# add a single attribute to the saved state of a scenario, it is saved with the next checkpoint in session mode -
+# without a state of the scenario (e.g. an out-of-order intent in a new scenario) there is nothing to add it to
+def save_state_attribute(key, corpus_name, attribute_name, attribute_value):
+    if STATE_MODE != "session":
+        update_item_attribute(key, corpus_name, attribute_name, attribute_value)
+        return
+    
+    state = session_state()
+    if state is None or state.get("corpus_name") != corpus_name:
+        return
+    state = dict(state)
+    state[attribute_name] = attribute_value
+    set_session_state(state, max(session.attributes.get("unsaved_turns", 0), 1))
+
+# write the whole state to dynamodb in one write, so the conversation could be resumed by continue_intent
+def flush_state(key, state):
+    update_item(key, state)
+    flush_outcomes(key)
+
+# write the session state to dynamodb if there are turns not saved yet
+def flush_session_state(key):
+    flush_outcomes(key)
+    if STATE_MODE != "session":
+        return
+    state = session_state()
+    if state is None:
+        return
+    if session.attributes.get("unsaved_turns", 0) > 0:
+        flush_state(key, state)
+        set_session_state(state, 0)
+
+# delete the state of a scenario at the end of its conversation, or of every scenario of the device
+def clear_state(key, corpus_name=None):
+    if corpus_name:
+        delete_item(key, corpus_name)
+    else:
+        delete_items(key, [item["scenario"] for item in query_items(key) if item["scenario"] != SCHEDULE_SCENARIO])
+    flush_outcomes(key)
+    if STATE_MODE == "session":
+        session.attributes.pop("state", None)
+        session.attributes.pop("state_signature", None)
+        session.attributes.pop("unsaved_turns", None)
+
+
+###
+# practice schedule utils - an item of its own, so it survives the end of a conversation
+###
+
+def get_schedule(key): # key - device id
+    try:
+        response = table.get_item(Key=item_key(key, SCHEDULE_SCENARIO), ReturnConsumedCapacity="TOTAL")
+    except ClientError as e:
+        log.error("dynamodb error", extra={"fields": {"key": key, "error": e.response["Error"]["Message"]}})
+        return Schedule()
+    record_capacity("read", response)
+    item = response.get("Item")
+    return Schedule.decode(item) if item else Schedule()
+
+# conditional on the version the schedule was read at, False if another turn wrote it in between
+def save_schedule(key, schedule):
+    item = schedule.encode()
+    item.update(item_key(key, SCHEDULE_SCENARIO))
+    item["version"] = schedule.version + 1
+    condition = Attr("version").not_exists() | Attr("version").eq(schedule.version)
+    try:
+        response = table.put_item(Item=item, ConditionExpression=condition, ReturnConsumedCapacity="TOTAL")
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+            return False
+        log.error("dynamodb error", extra={"fields": {"key": key, "error": e.response["Error"]["Message"]}})
+        return True
+    record_capacity("write", response)
+    schedule.version += 1
+    return True
+
+# outcome of a practised step, it waits in the session and the schedule is written once for the whole batch -
+# on a checkpoint or the end of the session, and every CHECKPOINT_INTERVAL outcomes in dynamodb mode
+def record_outcome(key, corpus_name, intent_id, success):
+    outcomes = session.attributes.setdefault("outcomes", [])
+    outcomes.append([corpus_name, int(intent_id), success])
+    if STATE_MODE != "session" and len(outcomes) >= CHECKPOINT_INTERVAL:
+        flush_outcomes(key)
+
+def flush_outcomes(key):
+    apply_outcomes(key, session.attributes.pop("outcomes", []))
+
+# read, update and write the schedule, read again and retry when a concurrent turn wrote it first
+def apply_outcomes(key, outcomes, attempts=3):
+    if not outcomes:
+        return
+    for _ in range(attempts):
+        schedule = get_schedule(key)
+        for corpus_name, step, success in outcomes:
+            schedule.record(corpus_name, step, success)
+        if save_schedule(key, schedule):
+            return
+    log.warning("schedule not saved", extra={"fields": {"key": key, "outcomes": len(outcomes)}})
 
 
 # In[28]:
@@ -95,72 +503,167 @@ def delete_item(key):
 # functional utils
 ###
 
+# card texts come from the corpora, so the rendered texts are cached
+@functools.lru_cache(maxsize=4096)
 def extract_keywords(raw_sentence): # input card sentence, return str
-    import re
-    pattern = re.compile(r"\(([a-zA-Z0-9 \']+)\)")
+    pattern = KEYWORD_PATTERN
     if pattern.search(raw_sentence):
         return "Keywords:\n" + ", ".join(pattern.findall(raw_sentence))
     else:
         return "No keywords listed"
     
+@functools.lru_cache(maxsize=4096)
 def ignore_keywords(raw_sentence):
-    import re
-    pattern = re.compile(r"\(([a-zA-Z0-9 \']+)\)")
+    pattern = KEYWORD_PATTERN
     if pattern.search(raw_sentence):
         raw_sentence = raw_sentence.replace("(", "")
         raw_sentence = raw_sentence.replace(")", "")
     return raw_sentence
 
+# the small and large card image of a step, the sized variants from the asset manifest if it was built
+def card_images(corpus, intent_id):
+    data = corpus.data[intent_id]
+    return data["small_img_url"], data["large_img_url"]
+
+# context of the step and the card sentence, only the keywords are shown in keywords mode
+def build_card_content(corpus, intent_id, mode_name):
+    card_content = corpus.data[intent_id]["context"]
+    card_content += "\n"
+    card_content += " "
+    card_content += "\n"
+    
+    # choose what to display according to the mode
+    if mode_name == "keywords":
+        card_content += extract_keywords(corpus.data[intent_id]["card_text"])
+    else:
+        card_content += ignore_keywords(corpus.data[intent_id]["card_text"])
+    return card_content
+
+# move the conversation one step on if the previous intent is the step before this one,
+# otherwise (e.g. an out-of-order intent) stay at the current step without updating the state
+def advance_state(device_id, previous_data, previous_intent_name, intent_name):
+    if previous_data["intent_name"] == previous_intent_name:
+        intent_id = str(int(previous_data["intent_id"]) + 1)
+        corpus_name = previous_data["corpus_name"]
+        mode_name = previous_data["mode_name"]
+        record_outcome(device_id, corpus_name, intent_id, True)
+        save_state(device_id, intent_id, intent_name, corpus_name, mode_name)
+        return intent_id, intent_name, corpus_name, mode_name
+    # the learner said the sentence of another step - only that step is scored, a repeat of the current
+    # step was scored when it was reached
+    attempted_id = get_corpus(previous_data["corpus_name"]).get_intent_id(intent_name)
+    if attempted_id is not None and attempted_id != previous_data["intent_id"]:
+        record_outcome(device_id, previous_data["corpus_name"], attempted_id, False)
+    return previous_data["intent_id"], previous_data["intent_name"], previous_data["corpus_name"], previous_data["mode_name"]
+
 
 # In[29]:
 
 
 ###
-# model of corpus
+# locales - corpora and ui strings of a locale are loaded by its first request
 ###
 
-class Corpus:
-    def __init__(self, corpus_filename):
-        self.meta_data = {}
-        self.data = {}
-        
-        self.load_corpus(corpus_filename)
-        
-    def load_corpus(self, corpus_filename):
-        with open(corpus_filename) as f:
-            raw_data = []
-            for line in f:
-                raw_data.append(line)
-        raw_data = [line.split("::")[-1].strip().replace("\\n", "\n") for line in raw_data]
+LOCALE_DIR = os.environ.get("TEACHME_LOCALE_DIR", "locales") # one directory per locale, e.g. locales/en-GB
+DEFAULT_LOCALE = os.environ.get("TEACHME_DEFAULT_LOCALE", "en-GB")
+MAX_LOCALES = int(os.environ.get("TEACHME_MAX_LOCALES", "4")) # loaded locales kept in memory
+
+# original image url -> {"small": url, "large": url}, written by teachme_assets.py
+ASSET_MANIFEST = os.environ.get("TEACHME_ASSET_MANIFEST", "assets.json")
+asset_manifest = {}
+if os.path.isfile(ASSET_MANIFEST):
+    with open(ASSET_MANIFEST) as f:
+        asset_manifest = json.load(f)["images"]
+
+class Locale:
+    def __init__(self, locale_name):
+        self.locale_name = locale_name
+        self.path = os.path.join(LOCALE_DIR, locale_name)
+        with open(os.path.join(self.path, "strings.json")) as f:
+            self.strings = json.load(f)
+        self.corpora = {} # corpus name -> Corpus, each corpus is loaded by its first request
+        self.index = None # ScenarioIndex of all corpora, built by the first search
+        self.lock = threading.Lock()
         
-        for i in range(0, len(raw_data), 7): # each conversational must have 7 lines
-            self.meta_data[str(int(i/7))] = {}
-            self.meta_data[str(int(i/7))]["intent_id"] =  str(int(i/7))
-            self.meta_data[str(int(i/7))]["intent_name"] =  raw_data[i].split(",")[1].strip()
-            self.meta_data[str(int(i/7))]["corpus_name"] =  raw_data[i].split(",")[-1].strip()
-            
-            self.data[str(int(i/7))] = {}
-            self.data[str(int(i/7))]["user_response"] =  raw_data[i+1]
-            self.data[str(int(i/7))]["alexa_response"] =  raw_data[i+2]
-            self.data[str(int(i/7))]["card_text"] = raw_data[i+3]
-            self.data[str(int(i/7))]["context"] = raw_data[i+4]
-            self.data[str(int(i/7))]["img_url"] = raw_data[i+5]
-            i += 7
+    def corpus_names(self):
+        return [os.path.basename(filename) for filename in corpus_filenames(self.path)]
         
-    def get_meta_data(self, intent_id): # return dict
-            return self.meta_data[intent_id]
-            
-    def get_data(self, intent_id):
-            return self.data[intent_id] # return dict
-        
-    def get_end_id(self):
-        return len(corpus.meta_data)
+    def get_corpus(self, corpus_name):
+        corpus = self.corpora.get(corpus_name)
+        if corpus is None:
+            with self.lock:
+                corpus = self.corpora.get(corpus_name)
+                if corpus is None:
+                    corpus = Corpus(os.path.join(self.path, corpus_name), asset_manifest)
+                    self.corpora[corpus_name] = corpus
+        return corpus
+
+    def get_index(self):
+        if self.index is None:
+            index = ScenarioIndex(self.get_corpus(corpus_name) for corpus_name in self.corpus_names())
+            with self.lock:
+                if self.index is None:
+                    self.index = index
+        return self.index
+
+loaded_locales = collections.OrderedDict() # locale name -> Locale, least recently used first
+locales_lock = threading.Lock()
+
+# the name of the locale that is served for a requested one, the locale directories are checked once per name
+@functools.lru_cache(maxsize=64)
+def resolve_locale(locale_name):
+    if os.path.isfile(os.path.join(LOCALE_DIR, str(locale_name), "strings.json")):
+        return locale_name
+    return DEFAULT_LOCALE
+
+# get a loaded locale, the least recently used one is evicted when there are too many
+def get_locale(locale_name):
+    locale_name = resolve_locale(locale_name)
+    with locales_lock:
+        locale = loaded_locales.get(locale_name)
+        if locale is None:
+            locale = Locale(locale_name)
+            loaded_locales[locale_name] = locale
+            while len(loaded_locales) > MAX_LOCALES:
+                loaded_locales.popitem(last=False)
+        else:
+            loaded_locales.move_to_end(locale_name)
+    return locale
+
+# the locale of the current alexa request, looked up once per request
+def current_locale():
+    locale = g.get("locale")
+    if locale is None:
+        locale = g.locale = get_locale(ask_request.locale or DEFAULT_LOCALE)
+    return locale
+
+def ui_text(name):
+    return current_locale().strings[name]
+
+def get_corpus(corpus_name):
+    return current_locale().get_corpus(corpus_name)
+
+# e.g. "Restaurant scenario"
+def scenario_title(corpus_name):
+    return ui_text(corpus_name.replace("_corpus", "_card_title"))
+
+# whether a spoken scenario name, e.g. "restaurant", means the corpus
+def is_scenario(corpus_name, scenario_name):
+    scenario_name = scenario_name.lower()
+    return corpus_name.replace("_corpus", "") in scenario_name or scenario_name in scenario_title(corpus_name).lower()
+
+# "You can continue the Restaurant scenario at step 4 of 9, or ..."
+def resume_menu(progress):
+    entries = [ui_text("resume_entry").format(scenario_title(state["corpus_name"]), int(state["intent_id"]) + 1,
+                                              get_corpus(state["corpus_name"]).get_end_id())
+               for state in progress]
+    return ui_text("resume_menu").format(ui_text("resume_separator").join(entries))
 
 
 # In[34]:
 
 
-corpus = Corpus("restaurant_corpus")
+# corpus = get_locale(DEFAULT_LOCALE).get_corpus("restaurant_corpus")
 # print(len(corpus.meta_data))
 # print(corpus.get_data("3")["alexa_response"].format("New York strip steak"))
 # print(corpus.get_data("2")["card_text"])
@@ -168,7 +671,7 @@ corpus = Corpus("restaurant_corpus")
 # print(extract_keywords(corpus.get_data("8")["card_text"]))
 # print(ignore_keywords(corpus.get_data("2")["card_text"]))
 # print(ignore_keywords(corpus.get_data("8")["card_text"]))
-extract_keywords(corpus.data["1"]["card_text"])
+# extract_keywords(corpus.data["1"]["card_text"])
 
 
 # In[ ]:
@@ -181,23 +684,27 @@ extract_keywords(corpus.data["1"]["card_text"])
 @ask.launch
 def welcome_response():
     
-    card_title = "Welcome!"
+    card_title = ui_text("welcome_card_title")
+    card_content = ui_text("welcome_card")
     
-    card_content = "Welcome to teach me skill. What do you want to learn?\n"
-    card_content += "\n"
-    card_content += "You could say:\n"
-    card_content += "1. Describe symptom in full sentence mode/keywords mode\n"
-    card_content += "2. Order food in full sentence mode/keywords mode\n"
-    card_content += "\n"
-    card_content += "----------\n"
-    card_content += "To end the skill: 'Alexa, exit/stop'\n"
-    card_content += "To resume the conversation: 'Alexa, ask teachme to continue'\n"
-    card_content += "To clear the previous conversation: 'Alexa, ask teachme to clear the progress'\n"
+    welcome_text = ui_text("welcome_text")
+    reprompt_text = ui_text("welcome_reprompt")
     
-    welcome_text = "Welcome to Teach me skill. Which scenario do you want to learn? I will help you to practice it."
-    reprompt_text = "I'm sorry - I didn't get it, could you please say that again?"
+    # the scenarios that could be continued and the practice schedule, from a single query
+    progress, schedule = get_progress(context.System.device.deviceId)
+    if progress:
+        menu = resume_menu(progress)
+        welcome_text += " " + menu
+        card_content += "\n" + menu
     
-    img_url = "https://s3.eu-west-2.amazonaws.com/echo.learn.image.bucket/blank.png"
+    # suggest the step that is most overdue for practice
+    due = schedule.next_due()
+    if due is not None:
+        corpus_name, step, _ = due
+        session.attributes["review"] = [corpus_name, step]
+        welcome_text += " " + ui_text("review_suggestion").format(scenario_title(corpus_name))
+    
+    img_url = ui_text("blank_img_url")
 
     return question(welcome_text).reprompt(reprompt_text).standard_card(title=card_title, text=card_content, 
                                                                         small_image_url=img_url, 
@@ -205,75 +712,131 @@ def welcome_response():
 
 @ask.intent('AMAZON.CancelIntent')
 def cancel_intent():
-    return statement("Okay, good bye.")
+    flush_session_state(context.System.device.deviceId)
+    return statement(ui_text("goodbye_text"))
 
 @ask.intent('AMAZON.StopIntent')
 def stop_intent():
-    return statement("Okay, good bye.")
+    flush_session_state(context.System.device.deviceId)
+    return statement(ui_text("goodbye_text"))
+
+# the session is closed by the user or timed out, save the state for continue_intent
+@ask.session_ended
+def session_ended():
+    flush_session_state(context.System.device.deviceId)
+    return "{}", 200
 
+# the help statement ends the session without a SessionEndedRequest, so the state is saved here
 @ask.intent('AMAZON.HelpIntent')
 def help_intent():
+    flush_session_state(context.System.device.deviceId)
     
-    card_title = "Help!"
+    card_title = ui_text("help_card_title")
+    card_content = ui_text("help_card")
     
-    card_content += "To start a new scenario - e.g.'Describe symptom in keywords mode', 'Order food in full sentence mode'\n"
-    card_content += "\n"
-    card_content += "----------\n"
-    card_content += "To end the skill - 'Alexa, exit/stop'\n"
-    card_content += "To resume the conversation - 'Alexa, ask teachme to continue'\n"
-    card_content += "To clear the previous conversation - 'Alexa, ask teachme to clear the progress'\n"
-    
-    img_url = "https://s3.eu-west-2.amazonaws.com/echo.learn.image.bucket/blank.png"
+    img_url = ui_text("blank_img_url")
     
-    return statement("Here is a list of command you could say.").standard_card(title=card_title, text=card_content, 
+    return statement(ui_text("help_text")).standard_card(title=card_title, text=card_content, 
                                                                                small_image_url=img_url, 
                                                                                large_image_url=img_url)
 
+# "continue" resumes the only scenario in progress, "continue the restaurant scenario" one of several,
+# otherwise the scenarios in progress are listed
 @ask.intent("continue_intent")
-def continue_intent():
-    # get the previous conversation state from the database
+def continue_intent(scenario_name):
+    # get the progress of every scenario from the database
     device_id = context.System.device.deviceId
-    previous_data = get_item(device_id)
+    progress, _ = get_progress(device_id)
+    if not progress:
+        return question(ui_text("continue_nothing")).reprompt(ui_text("welcome_reprompt"))
+    candidates = progress
+    if scenario_name:
+        candidates = [state for state in progress if is_scenario(state["corpus_name"], scenario_name)]
+    if len(candidates) != 1:
+        menu = resume_menu(progress)
+        return question(menu).reprompt(menu)
+    
+    previous_data = resume_state(device_id, candidates[0])
     intent_id = previous_data["intent_id"]
     intent_name = previous_data["intent_name"]
     corpus_name = previous_data["corpus_name"]
     mode_name = previous_data["mode_name"]
     
     # get data from the corpus
-    corpus = Corpus(corpus_name)
-    card_title = "Continue!"
-    card_content = corpus.data[intent_id]["context"]
-    card_content += "\n"
-    card_content += " "
-    card_content += "\n"
-    
-    # choose what to display according to the mode
-    if mode_name == "keywords":
-        card_content += extract_keywords(corpus.data[intent_id]["card_text"])
-    else:
-        card_content += ignore_keywords(corpus.data[intent_id]["card_text"])
+    corpus = get_corpus(corpus_name)
+    card_title = ui_text("continue_card_title")
+    card_content = build_card_content(corpus, intent_id, mode_name)
     
     # add extra time for user to response
-    reprompt_text = "Sorry, I didn't get it. Could you please say that again?"
+    reprompt_text = ui_text("reprompt")
     
     # add image for the card
-    img_url = "https://s3.eu-west-2.amazonaws.com/echo.learn.image.bucket/blank.png"
+    img_url = ui_text("blank_img_url")
     
     # push the card with an empty question
-    return question("Okay, now look at the card").reprompt(reprompt_text).standard_card(title=card_title, text=card_content, 
+    return question(ui_text("continue_text")).reprompt(reprompt_text).standard_card(title=card_title, text=card_content, 
                                                                                         small_image_url=img_url, 
                                                                                         large_image_url=img_url)
     
+# start the conversation at a step of a corpus, for review_intent and practise_intent
+def start_at_step(device_id, corpus_name, intent_id, mode_name, card_title):
+    corpus = get_corpus(corpus_name)
+    intent_name = corpus.get_meta_data(intent_id)["intent_name"]
+    mode_name = mode_name or "keywords"
+    save_state(device_id, intent_id, intent_name, corpus_name, mode_name, checkpoint=True)
+    
+    # the later restaurant steps need a main course, use the one the waiter recommends
+    main_course_name = DEFAULT_MAIN_COURSE
+    if corpus_name == "restaurant_corpus":
+        save_state_attribute(device_id, corpus_name, "main_course_name", main_course_name)
+    
+    card_content = build_card_content(corpus, intent_id, mode_name)
+    card_content += ui_text("hints")
+    
+    alexa_response = corpus.data[intent_id]["alexa_response"].format(main_course_name)
+    small_img_url, large_img_url = card_images(corpus, intent_id)
+    reprompt_text = ui_text("reprompt")
+    
+    return question(alexa_response).reprompt(reprompt_text).standard_card(title=card_title, text=card_content, 
+                                                                          small_image_url=small_img_url, 
+                                                                          large_image_url=large_img_url)
+
+# practise the step suggested on launch, or the most overdue one
+@ask.intent("review_intent")
+def review_intent(mode_name):
+    device_id = context.System.device.deviceId
+    review = session.attributes.get("review")
+    if review is None:
+        due = get_schedule(device_id).next_due()
+        if due is None:
+            return question(ui_text("review_nothing_due")).reprompt(ui_text("welcome_reprompt"))
+        review = due[:2]
+    corpus_name, step = review
+    
+    # the card and the question of the step before lead the learner to the sentence of the step
+    intent_id = str(max(int(step) - 1, 0))
+    return start_at_step(device_id, corpus_name, intent_id, mode_name, ui_text("review_card_title"))
+
+# "practise ordering dessert" - jump to the step whose card leads to what the learner asked for
+@ask.intent("practise_intent")
+def practise_intent(scenario_query, mode_name):
+    found = current_locale().get_index().search(scenario_query or "")
+    if found is None:
+        return question(ui_text("practise_not_found")).reprompt(ui_text("welcome_reprompt"))
+    corpus_name, intent_id = found
+    return start_at_step(context.System.device.deviceId, corpus_name, intent_id, mode_name,
+                         ui_text("practise_card_title"))
+
 @ask.intent("clear_intent")
 def clear_intent():
     # clear all entries from the database
     device_id = context.System.device.deviceId
-    delete_item(device_id)
+    clear_state(device_id)
     
     # push the card with an statement
-    card_title = "Clear conversational data!"
-    card_content = "Now the data is cleared.\nYou could invoke the skill again to start a new conversation."
-    return statement("Okay, now the conversation is cleared").simple_card(title=card_title, content=card_content)
+    card_title = ui_text("clear_card_title")
+    card_content = ui_text("clear_card")
+    return statement(ui_text("clear_text")).simple_card(title=card_title, content=card_content)
 
 # intent to load restaurant corpus, choose mode and start the initial question
 @ask.intent("start_restaurant_intent") # "0"
@@ -284,475 +847,272 @@ def start_restaurant_intent(mode_name):
     intent_name = "start_restaurant_intent"
     corpus_name = "restaurant_corpus"
     
-    update_item(device_id, intent_id, intent_name, corpus_name, mode_name) # mode_name should be str
+    save_state(device_id, intent_id, intent_name, corpus_name, mode_name, checkpoint=True) # mode_name should be str
 
     # get data from the corpus
-    corpus = Corpus(corpus_name)
-    card_title = "Restaurant scenario"
-    card_content = corpus.data[intent_id]["context"]
-    card_content += "\n"
-    card_content += " "
-    card_content += "\n"
-    
-    # choose what to display according to the mode
-    if mode_name == "keywords":
-        card_content += extract_keywords(corpus.data[intent_id]["card_text"])
-    else:
-        card_content += ignore_keywords(corpus.data[intent_id]["card_text"])
+    corpus = get_corpus(corpus_name)
+    card_title = ui_text("restaurant_card_title")
+    card_content = build_card_content(corpus, intent_id, mode_name)
         
     alexa_response = corpus.data[intent_id]["alexa_response"]
-    img_url = corpus.data[intent_id]["img_url"]
+    small_img_url, large_img_url = card_images(corpus, intent_id)
     
     # add hints for voice commands
-    card_content += "\n\n----------\n"
-    card_content += "To end the skill - 'Alexa, exit/stop'\n"
-    card_content += "To resume the conversation - 'Alexa, ask teachme to continue'\n"
-    card_content += "To clear the previous conversation - 'Alexa, ask teachme to clear the progress'\n"
+    card_content += ui_text("hints")
     
     # add extra time for user to response
-    reprompt_text = "Sorry, I didn't get it. Could you please say that again?"
+    reprompt_text = ui_text("reprompt")
     
     # get ready for the conversation
-    start_template = "<speak>Loading corpus, please wait for 5 seconds. Get ready. <break time='5s'/> {}</speak>"
+    start_template = ui_text("start_template")
     
     # push the card with Alexa response from the current conversation state - "0"
     return question(start_template.format(alexa_response)).reprompt(reprompt_text).standard_card(title=card_title, text=card_content, 
-                                                                                                 small_image_url=img_url, 
-                                                                                                 large_image_url=img_url)
+                                                                                                 small_image_url=small_img_url, 
+                                                                                                 large_image_url=large_img_url)
 
 @ask.intent("second_restaurant_intent") # "1"
 def second_restaurant_intent():
     # get the previous conversation state from the database - "0"
     device_id = context.System.device.deviceId
-    previous_data = get_item(device_id)
+    previous_data = get_state(device_id, "restaurant_corpus")
     
-    # check if the previous intent name equal to restaurant_start_intent
-    previous_intent = previous_data["intent_name"]
-    if previous_intent == "start_restaurant_intent":
-        # update the current conversation state to the database - "1"
-        intent_id = str(int(previous_data["intent_id"]) + 1)
-        intent_name = "second_restaurant_intent"
-        corpus_name = previous_data["corpus_name"]
-        mode_name = previous_data["mode_name"]
-        update_item(device_id, intent_id, intent_name, corpus_name, mode_name)
-    else: # do not update
-        intent_id = previous_data["intent_id"]
-        intent_name = previous_data["intent_name"]
-        corpus_name = previous_data["corpus_name"]
-        mode_name = previous_data["mode_name"]
+    # move to the next step if the previous intent is the step before, otherwise stay at the current step
+    intent_id, intent_name, corpus_name, mode_name = advance_state(device_id, previous_data, "start_restaurant_intent", "second_restaurant_intent")
     
     # get data from the corpus
-    corpus = Corpus(corpus_name)
-    card_title = "Restaurant scenario"
-    card_content = corpus.data[intent_id]["context"]
-    card_content += "\n"
-    card_content += " "
-    card_content += "\n"
-    
-    # choose what to display according to the mode
-    if mode_name == "keywords":
-        card_content += extract_keywords(corpus.data[intent_id]["card_text"])
-    else:
-        card_content += ignore_keywords(corpus.data[intent_id]["card_text"])
+    corpus = get_corpus(corpus_name)
+    card_title = ui_text("restaurant_card_title")
+    card_content = build_card_content(corpus, intent_id, mode_name)
     
     alexa_response = corpus.data[intent_id]["alexa_response"]
-    img_url = corpus.data[intent_id]["img_url"]
+    small_img_url, large_img_url = card_images(corpus, intent_id)
     
     # add hints for voice commands
-    card_content += "\n\n----------\n"
-    card_content += "To end the skill - 'Alexa, exit/stop'\n"
-    card_content += "To resume the conversation - 'Alexa, ask teachme to continue'\n"
-    card_content += "To clear the previous conversation - 'Alexa, ask teachme to clear the progress'\n"
+    card_content += ui_text("hints")
     
     # add extra time for user to response
-    reprompt_text = "Sorry, I didn't get it. Could you please say that again?"
+    reprompt_text = ui_text("reprompt")
     
     # push the card with Alexa response from the current conversation state - "1"
     return question(alexa_response).reprompt(reprompt_text).standard_card(title=card_title, text=card_content, 
-                                                                          small_image_url=img_url, 
-                                                                          large_image_url=img_url)
+                                                                          small_image_url=small_img_url, 
+                                                                          large_image_url=large_img_url)
 
 @ask.intent("third_restaurant_intent") # "2"
 def third_restaurant_intent():
     # get the previous conversation state from the database - "1"
     device_id = context.System.device.deviceId
-    previous_data = get_item(device_id)
+    previous_data = get_state(device_id, "restaurant_corpus")
     
-    # check if the previous intent name equal to restaurant_start_intent
-    previous_intent = previous_data["intent_name"]
-    if previous_intent == "second_restaurant_intent":
-        # update the current conversation state to the database - "2"
-        intent_id = str(int(previous_data["intent_id"]) + 1)
-        intent_name = "third_restaurant_intent"
-        corpus_name = previous_data["corpus_name"]
-        mode_name = previous_data["mode_name"]
-        update_item(device_id, intent_id, intent_name, corpus_name, mode_name)
-    else: # do not update
-        intent_id = previous_data["intent_id"]
-        intent_name = previous_data["intent_name"]
-        corpus_name = previous_data["corpus_name"]
-        mode_name = previous_data["mode_name"]
+    # move to the next step if the previous intent is the step before, otherwise stay at the current step
+    intent_id, intent_name, corpus_name, mode_name = advance_state(device_id, previous_data, "second_restaurant_intent", "third_restaurant_intent")
     
     # get data from the corpus
-    corpus = Corpus(corpus_name)
-    card_title = "Restaurant scenario"
-    card_content = corpus.data[intent_id]["context"]
-    card_content += "\n"
-    card_content += " "
-    card_content += "\n"
-    
-    # choose what to display according to the mode
-    if mode_name == "keywords":
-        card_content += extract_keywords(corpus.data[intent_id]["card_text"])
-    else:
-        card_content += ignore_keywords(corpus.data[intent_id]["card_text"])
+    corpus = get_corpus(corpus_name)
+    card_title = ui_text("restaurant_card_title")
+    card_content = build_card_content(corpus, intent_id, mode_name)
     
     alexa_response = corpus.data[intent_id]["alexa_response"]
-    img_url = corpus.data[intent_id]["img_url"]
+    small_img_url, large_img_url = card_images(corpus, intent_id)
     
     # add hints for voice commands
-    card_content += "\n\n----------\n"
-    card_content += "To end the skill - 'Alexa, exit/stop'\n"
-    card_content += "To resume the conversation - 'Alexa, ask teachme to continue'\n"
-    card_content += "To clear the previous conversation - 'Alexa, ask teachme to clear the progress'\n"
+    card_content += ui_text("hints")
     
     # add extra time for user to response
-    reprompt_text = "Sorry, I didn't get it. Could you please say that again?"
+    reprompt_text = ui_text("reprompt")
     
     # push the card with Alexa response from the current conversation state - "2"
     return question(alexa_response).reprompt(reprompt_text).standard_card(title=card_title, text=card_content, 
-                                                                          small_image_url=img_url, 
-                                                                          large_image_url=img_url)
+                                                                          small_image_url=small_img_url, 
+                                                                          large_image_url=large_img_url)
 
 @ask.intent("fourth_restaurant_intent") # "3"
 def fourth_restaurant_intent():
     # get the previous conversation state from the database - "2"
     device_id = context.System.device.deviceId
-    previous_data = get_item(device_id)
+    previous_data = get_state(device_id, "restaurant_corpus")
     
-    # check if the previous intent name equal to restaurant_start_intent
-    previous_intent = previous_data["intent_name"]
-    if previous_intent == "third_restaurant_intent":
-        # update the current conversation state to the database - "3"
-        intent_id = str(int(previous_data["intent_id"]) + 1)
-        intent_name = "fourth_restaurant_intent"
-        corpus_name = previous_data["corpus_name"]
-        mode_name = previous_data["mode_name"]
-        update_item(device_id, intent_id, intent_name, corpus_name, mode_name)
-    else: # do not update
-        intent_id = previous_data["intent_id"]
-        intent_name = previous_data["intent_name"]
-        corpus_name = previous_data["corpus_name"]
-        mode_name = previous_data["mode_name"]
+    # move to the next step if the previous intent is the step before, otherwise stay at the current step
+    intent_id, intent_name, corpus_name, mode_name = advance_state(device_id, previous_data, "third_restaurant_intent", "fourth_restaurant_intent")
         
     # get data from the corpus
-    corpus = Corpus(corpus_name)
-    card_title = "Restaurant scenario"
-    card_content = corpus.data[intent_id]["context"]
-    card_content += "\n"
-    card_content += " "
-    card_content += "\n"
-    
-    # choose what to display according to the mode
-    if mode_name == "keywords":
-        card_content += extract_keywords(corpus.data[intent_id]["card_text"])
-    else:
-        card_content += ignore_keywords(corpus.data[intent_id]["card_text"])
+    corpus = get_corpus(corpus_name)
+    card_title = ui_text("restaurant_card_title")
+    card_content = build_card_content(corpus, intent_id, mode_name)
     
     alexa_response = corpus.data[intent_id]["alexa_response"]
-    img_url = corpus.data[intent_id]["img_url"]
+    small_img_url, large_img_url = card_images(corpus, intent_id)
     
     # add hints for voice commands
-    card_content += "\n\n----------\n"
-    card_content += "To end the skill - 'Alexa, exit/stop'\n"
-    card_content += "To resume the conversation - 'Alexa, ask teachme to continue'\n"
-    card_content += "To clear the previous conversation - 'Alexa, ask teachme to clear the progress'\n"
+    card_content += ui_text("hints")
     
     # add extra time for user to response
-    reprompt_text = "Sorry, I didn't get it. Could you please say that again?"
+    reprompt_text = ui_text("reprompt")
     
     # push the card with Alexa response from the current conversation state - "3"
     return question(alexa_response).reprompt(reprompt_text).standard_card(title=card_title, text=card_content, 
-                                                                          small_image_url=img_url, 
-                                                                          large_image_url=img_url)
+                                                                          small_image_url=small_img_url, 
+                                                                          large_image_url=large_img_url)
 
 @ask.intent("fifth_restaurant_intent") # "4"
 def fifth_restaurant_intent(food_name):
     # get the previous conversation state from the database - "3"
     device_id = context.System.device.deviceId
-    previous_data = get_item(device_id)
+    previous_data = get_state(device_id, "restaurant_corpus")
     
-    # check if the previous intent name equal to restaurant_start_intent
-    previous_intent = previous_data["intent_name"]
-    if previous_intent == "fourth_restaurant_intent":
-        # update the current conversation state to the database - "4"
-        intent_id = str(int(previous_data["intent_id"]) + 1)
-        intent_name = "fifth_restaurant_intent"
-        corpus_name = previous_data["corpus_name"]
-        mode_name = previous_data["mode_name"]
-        update_item(device_id, intent_id, intent_name, corpus_name, mode_name)
-    else: # do not update
-        intent_id = previous_data["intent_id"]
-        intent_name = previous_data["intent_name"]
-        corpus_name = previous_data["corpus_name"]
-        mode_name = previous_data["mode_name"]
+    # move to the next step if the previous intent is the step before, otherwise stay at the current step
+    intent_id, intent_name, corpus_name, mode_name = advance_state(device_id, previous_data, "fourth_restaurant_intent", "fifth_restaurant_intent")
         
     # get data from the corpus
-    corpus = Corpus(corpus_name)
-    card_title = "Restaurant scenario"
-    card_content = corpus.data[intent_id]["context"]
-    card_content += "\n"
-    card_content += " "
-    card_content += "\n"
-    
-    # choose what to display according to the mode
-    if mode_name == "keywords":
-        card_content += extract_keywords(corpus.data[intent_id]["card_text"])
-    else:
-        card_content += ignore_keywords(corpus.data[intent_id]["card_text"])
+    corpus = get_corpus(corpus_name)
+    card_title = ui_text("restaurant_card_title")
+    card_content = build_card_content(corpus, intent_id, mode_name)
         
-    # send user's main course to the database as a new attribute
+    # send user's main course to the database as a new attribute, once the conversation has reached this step
     import re
-    if re.search("rib", food_name): # main course == rib-eye
+    if re.search("rib", food_name or ""): # main course == rib-eye
         main_course_name = "rib eye steak"
     else:
-        main_course_name = "New York strip steak"
-    update_item_attribute(device_id, "main_course_name", main_course_name)
+        main_course_name = DEFAULT_MAIN_COURSE
+    if intent_id != previous_data["intent_id"]:
+        save_state_attribute(device_id, corpus_name, "main_course_name", main_course_name)
     
-    # get response (main course name) from database
-    alexa_response = corpus.data[intent_id]["alexa_response"].format(get_item(device_id)["main_course_name"])
-    img_url = corpus.data[intent_id]["img_url"]
+    # get response (main course name) from the conversation state
+    alexa_response = corpus.data[intent_id]["alexa_response"].format(main_course_name)
+    small_img_url, large_img_url = card_images(corpus, intent_id)
     
     # add hints for voice commands
-    card_content += "\n\n----------\n"
-    card_content += "To end the skill - 'Alexa, exit/stop'\n"
-    card_content += "To resume the conversation - 'Alexa, ask teachme to continue'\n"
-    card_content += "To clear the previous conversation - 'Alexa, ask teachme to clear the progress'\n"
+    card_content += ui_text("hints")
     
     # add extra time for user to response
-    reprompt_text = "Sorry, I didn't get it. Could you please say that again?"
+    reprompt_text = ui_text("reprompt")
     
     # push the card with Alexa response from the current conversation state - "4"
     return question(alexa_response).reprompt(reprompt_text).standard_card(title=card_title, text=card_content, 
-                                                                          small_image_url=img_url, 
-                                                                          large_image_url=img_url)
+                                                                          small_image_url=small_img_url, 
+                                                                          large_image_url=large_img_url)
 
 @ask.intent("sixth_restaurant_intent") # "5"
 def sixth_restaurant_intent():
     # get the previous conversation state from the database - "4"
     device_id = context.System.device.deviceId
-    previous_data = get_item(device_id)
+    previous_data = get_state(device_id, "restaurant_corpus")
     
-    # check if the previous intent name equal to restaurant_start_intent
-    previous_intent = previous_data["intent_name"]
-    if previous_intent == "fifth_restaurant_intent":
-        # update the current conversation state to the database - "5"
-        intent_id = str(int(previous_data["intent_id"]) + 1)
-        intent_name = "sixth_restaurant_intent"
-        corpus_name = previous_data["corpus_name"]
-        mode_name = previous_data["mode_name"]
-        update_item(device_id, intent_id, intent_name, corpus_name, mode_name)
-    else: # do not update
-        intent_id = previous_data["intent_id"]
-        intent_name = previous_data["intent_name"]
-        corpus_name = previous_data["corpus_name"]
-        mode_name = previous_data["mode_name"]
+    # move to the next step if the previous intent is the step before, otherwise stay at the current step
+    intent_id, intent_name, corpus_name, mode_name = advance_state(device_id, previous_data, "fifth_restaurant_intent", "sixth_restaurant_intent")
         
     # get data from the corpus
-    corpus = Corpus(corpus_name)
-    card_title = "Restaurant scenario"
-    card_content = corpus.data[intent_id]["context"]
-    card_content += "\n"
-    card_content += " "
-    card_content += "\n"
-    
-    # choose what to display according to the mode
-    if mode_name == "keywords":
-        card_content += extract_keywords(corpus.data[intent_id]["card_text"])
-    else:
-        card_content += ignore_keywords(corpus.data[intent_id]["card_text"])
+    corpus = get_corpus(corpus_name)
+    card_title = ui_text("restaurant_card_title")
+    card_content = build_card_content(corpus, intent_id, mode_name)
         
     # get response (main course name) from database
     alexa_response = corpus.data[intent_id]["alexa_response"]
-    img_url = corpus.data[intent_id]["img_url"]
+    small_img_url, large_img_url = card_images(corpus, intent_id)
     
     # add hints for voice commands
-    card_content += "\n\n----------\n"
-    card_content += "To end the skill - 'Alexa, exit/stop'\n"
-    card_content += "To resume the conversation - 'Alexa, ask teachme to continue'\n"
-    card_content += "To clear the previous conversation - 'Alexa, ask teachme to clear the progress'\n"
+    card_content += ui_text("hints")
     
     # add extra time for user to response
-    reprompt_text = "Sorry, I didn't get it. Could you please say that again?"
+    reprompt_text = ui_text("reprompt")
     
     # push the card with Alexa response from the current conversation state - "5"
     return question(alexa_response).reprompt(reprompt_text).standard_card(title=card_title, text=card_content, 
-                                                                          small_image_url=img_url, 
-                                                                          large_image_url=img_url)
+                                                                          small_image_url=small_img_url, 
+                                                                          large_image_url=large_img_url)
     
 
 @ask.intent("seventh_restaurant_intent") # "6"
 def seventh_restaurant_intent():
     # get the previous conversation state from the database - "5"
     device_id = context.System.device.deviceId
-    previous_data = get_item(device_id)
+    previous_data = get_state(device_id, "restaurant_corpus")
     
-    # check if the previous intent name equal to restaurant_start_intent
-    previous_intent = previous_data["intent_name"]
-    if previous_intent == "sixth_restaurant_intent":
-        # update the current conversation state to the database - "6"
-        intent_id = str(int(previous_data["intent_id"]) + 1)
-        intent_name = "seventh_restaurant_intent"
-        corpus_name = previous_data["corpus_name"]
-        mode_name = previous_data["mode_name"]
-        update_item(device_id, intent_id, intent_name, corpus_name, mode_name)
-    else: # do not update
-        intent_id = previous_data["intent_id"]
-        intent_name = previous_data["intent_name"]
-        corpus_name = previous_data["corpus_name"]
-        mode_name = previous_data["mode_name"]
+    # move to the next step if the previous intent is the step before, otherwise stay at the current step
+    intent_id, intent_name, corpus_name, mode_name = advance_state(device_id, previous_data, "sixth_restaurant_intent", "seventh_restaurant_intent")
         
     # get data from the corpus
-    corpus = Corpus(corpus_name)
-    card_title = "Restaurant scenario"
-    card_content = corpus.data[intent_id]["context"]
-    card_content += "\n"
-    card_content += " "
-    card_content += "\n"
-    
-    # choose what to display according to the mode
-    if mode_name == "keywords":
-        card_content += extract_keywords(corpus.data[intent_id]["card_text"])
-    else:
-        card_content += ignore_keywords(corpus.data[intent_id]["card_text"])
+    corpus = get_corpus(corpus_name)
+    card_title = ui_text("restaurant_card_title")
+    card_content = build_card_content(corpus, intent_id, mode_name)
         
     # get response (main course name) from database
     alexa_response = corpus.data[intent_id]["alexa_response"]
-    img_url = corpus.data[intent_id]["img_url"]
+    small_img_url, large_img_url = card_images(corpus, intent_id)
     
     # add hints for voice commands
-    card_content += "\n\n----------\n"
-    card_content += "To end the skill - 'Alexa, exit/stop'\n"
-    card_content += "To resume the conversation - 'Alexa, ask teachme to continue'\n"
-    card_content += "To clear the previous conversation - 'Alexa, ask teachme to clear the progress'\n"
+    card_content += ui_text("hints")
     
     # add extra time for user to response
-    reprompt_text = "Sorry, I didn't get it. Could you please say that again?"
+    reprompt_text = ui_text("reprompt")
     
     # push the card with Alexa response from the current conversation state - "6"
     return question(alexa_response).reprompt(reprompt_text).standard_card(title=card_title, text=card_content, 
-                                                                          small_image_url=img_url, 
-                                                                          large_image_url=img_url)
+                                                                          small_image_url=small_img_url, 
+                                                                          large_image_url=large_img_url)
 
 @ask.intent("eighth_restaurant_intent") # "7"
 def eighth_restaurant_intent():
     # get the previous conversation state from the database - "6"
     device_id = context.System.device.deviceId
-    previous_data = get_item(device_id)
+    previous_data = get_state(device_id, "restaurant_corpus")
     
-    # check if the previous intent name equal to restaurant_start_intent
-    previous_intent = previous_data["intent_name"]
-    if previous_intent == "seventh_restaurant_intent":
-        # update the current conversation state to the database - "7"
-        intent_id = str(int(previous_data["intent_id"]) + 1)
-        intent_name = "eighth_restaurant_intent"
-        corpus_name = previous_data["corpus_name"]
-        mode_name = previous_data["mode_name"]
-        update_item(device_id, intent_id, intent_name, corpus_name, mode_name)
-    else: # do not update
-        intent_id = previous_data["intent_id"]
-        intent_name = previous_data["intent_name"]
-        corpus_name = previous_data["corpus_name"]
-        mode_name = previous_data["mode_name"]
+    # move to the next step if the previous intent is the step before, otherwise stay at the current step
+    intent_id, intent_name, corpus_name, mode_name = advance_state(device_id, previous_data, "seventh_restaurant_intent", "eighth_restaurant_intent")
         
     # get data from the corpus
-    corpus = Corpus(corpus_name)
-    card_title = "Restaurant scenario"
-    card_content = corpus.data[intent_id]["context"]
-    card_content += "\n"
-    card_content += " "
-    card_content += "\n"
-    
-    # choose what to display according to the mode
-    if mode_name == "keywords":
-        card_content += extract_keywords(corpus.data[intent_id]["card_text"])
-    else:
-        card_content += ignore_keywords(corpus.data[intent_id]["card_text"])
+    corpus = get_corpus(corpus_name)
+    card_title = ui_text("restaurant_card_title")
+    card_content = build_card_content(corpus, intent_id, mode_name)
         
     # get response (main course name) from database
-    alexa_response = corpus.data[intent_id]["alexa_response"].format(get_item(device_id)["main_course_name"])
-    img_url = corpus.data[intent_id]["img_url"]
+    alexa_response = corpus.data[intent_id]["alexa_response"].format(previous_data.get("main_course_name", DEFAULT_MAIN_COURSE))
+    small_img_url, large_img_url = card_images(corpus, intent_id)
     
     # add hints for voice commands
-    card_content += "\n\n----------\n"
-    card_content += "To end the skill - 'Alexa, exit/stop'\n"
-    card_content += "To resume the conversation - 'Alexa, ask teachme to continue'\n"
-    card_content += "To clear the previous conversation - 'Alexa, ask teachme to clear the progress'\n"
+    card_content += ui_text("hints")
     
     # add extra time for user to response
-    reprompt_text = "Sorry, I didn't get it. Could you please say that again?"
+    reprompt_text = ui_text("reprompt")
     
     # push the card with Alexa response from the current conversation state - "7"
     return question(alexa_response).reprompt(reprompt_text).standard_card(title=card_title, text=card_content, 
-                                                                          small_image_url=img_url, 
-                                                                          large_image_url=img_url)
+                                                                          small_image_url=small_img_url, 
+                                                                          large_image_url=large_img_url)
 
 # intent for ninth step of restaurant corpus and the end of the conversation
 @ask.intent("ninth_restaurant_intent") # "8"
 def ninth_restaurant_intent():
     # get the previous conversation state from the database - "7"
     device_id = context.System.device.deviceId
-    previous_data = get_item(device_id)
+    previous_data = get_state(device_id, "restaurant_corpus")
     
-    # check if the previous intent name equal to restaurant_start_intent
-    previous_intent = previous_data["intent_name"]
-    if previous_intent == "eighth_restaurant_intent":
-        # update the current conversation state to the database - "8"
-        intent_id = str(int(previous_data["intent_id"]) + 1)
-        intent_name = "ninth_restaurant_intent"
-        corpus_name = previous_data["corpus_name"]
-        mode_name = previous_data["mode_name"]
-        update_item(device_id, intent_id, intent_name, corpus_name, mode_name)
-    else: # do not update
-        intent_id = previous_data["intent_id"]
-        intent_name = previous_data["intent_name"]
-        corpus_name = previous_data["corpus_name"]
-        mode_name = previous_data["mode_name"]
+    # move to the next step if the previous intent is the step before, otherwise stay at the current step
+    intent_id, intent_name, corpus_name, mode_name = advance_state(device_id, previous_data, "eighth_restaurant_intent", "ninth_restaurant_intent")
         
     # get data from the corpus
-    corpus = Corpus(corpus_name)
-    card_title = "Restaurant scenario"
-    card_content = corpus.data[intent_id]["context"]
-    card_content += "\n"
-    card_content += " "
-    card_content += "\n"
-    
-    # choose what to display according to the mode
-    if mode_name == "keywords":
-        card_content += extract_keywords(corpus.data[intent_id]["card_text"])
-    else:
-        card_content += ignore_keywords(corpus.data[intent_id]["card_text"])
+    corpus = get_corpus(corpus_name)
+    card_title = ui_text("restaurant_card_title")
+    card_content = build_card_content(corpus, intent_id, mode_name)
         
     # get response (main course name) from database
     alexa_response = corpus.data[intent_id]["alexa_response"]
-    img_url = corpus.data[intent_id]["img_url"]
+    small_img_url, large_img_url = card_images(corpus, intent_id)
     
     # add hints for voice commands
-    card_content += "\n\n----------\n"
-    card_content += "To end the skill - 'Alexa, exit/stop'\n"
-    card_content += "To resume the conversation - 'Alexa, ask teachme to continue'\n"
-    card_content += "To clear the previous conversation - 'Alexa, ask teachme to clear the progress'\n"
+    card_content += ui_text("hints")
     
     # get ready for the end of the conversation
-    end_template = "<speak>{} <break time='3s'/> Thank you for practicing. This is the end of the conversation.</speak>"
+    end_template = ui_text("end_template")
     
     # since it is the last intent of the conversation, clear the database
-    delete_item(device_id)
+    clear_state(device_id, corpus_name)
     
     # push the card with Alexa response from the current conversation state - "8"
     return statement(end_template.format(alexa_response)).standard_card(title=card_title, text=card_content,
-                                                                        small_image_url=img_url, 
-                                                                        large_image_url=img_url)
+                                                                        small_image_url=small_img_url, 
+                                                                        large_image_url=large_img_url)
 
 
 # In[ ]:
@@ -767,305 +1127,173 @@ def start_symptom_intent(mode_name):
     intent_name = "start_symptom_intent"
     corpus_name = "symptom_corpus"
     
-    update_item(device_id, intent_id, intent_name, corpus_name, mode_name) # mode_name should be str
+    save_state(device_id, intent_id, intent_name, corpus_name, mode_name, checkpoint=True) # mode_name should be str
 
     # get data from the corpus
-    corpus = Corpus(corpus_name)
-    card_title = "Symptom scenario"
-    card_content = corpus.data[intent_id]["context"]
-    card_content += "\n"
-    card_content += " "
-    card_content += "\n"
-    
-    # choose what to display according to the mode
-    if mode_name == "keywords":
-        card_content += extract_keywords(corpus.data[intent_id]["card_text"])
-    else:
-        card_content += ignore_keywords(corpus.data[intent_id]["card_text"])
+    corpus = get_corpus(corpus_name)
+    card_title = ui_text("symptom_card_title")
+    card_content = build_card_content(corpus, intent_id, mode_name)
         
     alexa_response = corpus.data[intent_id]["alexa_response"]
-    img_url = corpus.data[intent_id]["img_url"]
+    small_img_url, large_img_url = card_images(corpus, intent_id)
     
     # add hints for voice commands
-    card_content += "\n\n----------\n"
-    card_content += "To end the skill - 'Alexa, exit/stop'\n"
-    card_content += "To resume the conversation - 'Alexa, ask teachme to continue'\n"
-    card_content += "To clear the previous conversation - 'Alexa, ask teachme to clear the progress'\n"
+    card_content += ui_text("hints")
     
     # add extra time for user to response
-    reprompt_text = "Sorry, I didn't get it. Could you please say that again?"
+    reprompt_text = ui_text("reprompt")
     
     # get ready for the conversation
-    start_template = "<speak>Loading corpus, please wait for 5 seconds. Get ready. <break time='5s'/>, {}</speak>"
+    start_template = ui_text("start_template")
     
     # push the card with Alexa response from the current conversation state - "0"
     return question(start_template.format(alexa_response)).reprompt(reprompt_text).standard_card(title=card_title, text=card_content, 
-                                                                                                 small_image_url=img_url, 
-                                                                                                 large_image_url=img_url)
+                                                                                                 small_image_url=small_img_url, 
+                                                                                                 large_image_url=large_img_url)
 
 @ask.intent("second_symptom_intent") # "1"
 def second_symptom_intent():
     # get the previous conversation state from the database - "0"
     device_id = context.System.device.deviceId
-    previous_data = get_item(device_id)
+    previous_data = get_state(device_id, "symptom_corpus")
     
-    # check if the previous intent name equal to restaurant_start_intent
-    previous_intent = previous_data["intent_name"]
-    if previous_intent == "start_symptom_intent":
-        # update the current conversation state to the database - "1"
-        intent_id = str(int(previous_data["intent_id"]) + 1)
-        intent_name = "second_symptom_intent"
-        corpus_name = previous_data["corpus_name"]
-        mode_name = previous_data["mode_name"]
-        update_item(device_id, intent_id, intent_name, corpus_name, mode_name)
-    else: # do not update, stay at the current state
-        intent_id = previous_data["intent_id"]
-        intent_name = previous_data["intent_name"]
-        corpus_name = previous_data["corpus_name"]
-        mode_name = previous_data["mode_name"]
+    # move to the next step if the previous intent is the step before, otherwise stay at the current step
+    intent_id, intent_name, corpus_name, mode_name = advance_state(device_id, previous_data, "start_symptom_intent", "second_symptom_intent")
     
     # get data from the corpus
-    corpus = Corpus(corpus_name)
-    card_title = "Symptom scenario"
-    card_content = corpus.data[intent_id]["context"]
-    card_content += "\n"
-    card_content += " "
-    card_content += "\n"
-    
-    # choose what to display according to the mode
-    if mode_name == "keywords":
-        card_content += extract_keywords(corpus.data[intent_id]["card_text"])
-    else:
-        card_content += ignore_keywords(corpus.data[intent_id]["card_text"])
+    corpus = get_corpus(corpus_name)
+    card_title = ui_text("symptom_card_title")
+    card_content = build_card_content(corpus, intent_id, mode_name)
     
     alexa_response = corpus.data[intent_id]["alexa_response"]
-    img_url = corpus.data[intent_id]["img_url"]
+    small_img_url, large_img_url = card_images(corpus, intent_id)
     
     # add hints for voice commands
-    card_content += "\n\n----------\n"
-    card_content += "To end the skill - 'Alexa, exit/stop'\n"
-    card_content += "To resume the conversation - 'Alexa, ask teachme to continue'\n"
-    card_content += "To clear the previous conversation - 'Alexa, ask teachme to clear the progress'\n"
+    card_content += ui_text("hints")
     
     # add extra time for user to response
-    reprompt_text = "Sorry, I didn't get it. Could you please say that again?"
+    reprompt_text = ui_text("reprompt")
     
     # push the card with Alexa response from the current conversation state - "1"
     return question(alexa_response).reprompt(reprompt_text).standard_card(title=card_title, text=card_content, 
-                                                                          small_image_url=img_url, 
-                                                                          large_image_url=img_url)
+                                                                          small_image_url=small_img_url, 
+                                                                          large_image_url=large_img_url)
 
 @ask.intent("third_symptom_intent") # "2"
 def third_symptom_intent():
     # get the previous conversation state from the database - "1"
     device_id = context.System.device.deviceId
-    previous_data = get_item(device_id)
+    previous_data = get_state(device_id, "symptom_corpus")
     
-    # check if the previous intent name equal to restaurant_start_intent
-    previous_intent = previous_data["intent_name"]
-    if previous_intent == "second_symptom_intent":
-        # update the current conversation state to the database - "2"
-        intent_id = str(int(previous_data["intent_id"]) + 1)
-        intent_name = "third_symptom_intent"
-        corpus_name = previous_data["corpus_name"]
-        mode_name = previous_data["mode_name"]
-        update_item(device_id, intent_id, intent_name, corpus_name, mode_name)
-    else: # do not update, stay at the current state
-        intent_id = previous_data["intent_id"]
-        intent_name = previous_data["intent_name"]
-        corpus_name = previous_data["corpus_name"]
-        mode_name = previous_data["mode_name"]
+    # move to the next step if the previous intent is the step before, otherwise stay at the current step
+    intent_id, intent_name, corpus_name, mode_name = advance_state(device_id, previous_data, "second_symptom_intent", "third_symptom_intent")
     
     # get data from the corpus
-    corpus = Corpus(corpus_name)
-    card_title = "Symptom scenario"
-    card_content = corpus.data[intent_id]["context"]
-    card_content += "\n"
-    card_content += " "
-    card_content += "\n"
-    
-    # choose what to display according to the mode
-    if mode_name == "keywords":
-        card_content += extract_keywords(corpus.data[intent_id]["card_text"])
-    else:
-        card_content += ignore_keywords(corpus.data[intent_id]["card_text"])
+    corpus = get_corpus(corpus_name)
+    card_title = ui_text("symptom_card_title")
+    card_content = build_card_content(corpus, intent_id, mode_name)
     
     alexa_response = corpus.data[intent_id]["alexa_response"]
-    img_url = corpus.data[intent_id]["img_url"]
+    small_img_url, large_img_url = card_images(corpus, intent_id)
     
     # add hints for voice commands
-    card_content += "\n\n----------\n"
-    card_content += "To end the skill - 'Alexa, exit/stop'\n"
-    card_content += "To resume the conversation - 'Alexa, ask teachme to continue'\n"
-    card_content += "To clear the previous conversation - 'Alexa, ask teachme to clear the progress'\n"
+    card_content += ui_text("hints")
     
     # add extra time for user to response
-    reprompt_text = "Sorry, I didn't get it. Could you please say that again?"
+    reprompt_text = ui_text("reprompt")
     
     # push the card with Alexa response from the current conversation state - "2"
     return question(alexa_response).reprompt(reprompt_text).standard_card(title=card_title, text=card_content, 
-                                                                          small_image_url=img_url, 
-                                                                          large_image_url=img_url)
+                                                                          small_image_url=small_img_url, 
+                                                                          large_image_url=large_img_url)
 
 @ask.intent("fourth_symptom_intent") # "3"
 def fourth_symptom_intent():
     # get the previous conversation state from the database - "2"
     device_id = context.System.device.deviceId
-    previous_data = get_item(device_id)
+    previous_data = get_state(device_id, "symptom_corpus")
     
-    # check if the previous intent name equal to restaurant_start_intent
-    previous_intent = previous_data["intent_name"]
-    if previous_intent == "third_symptom_intent":
-        # update the current conversation state to the database - "3"
-        intent_id = str(int(previous_data["intent_id"]) + 1)
-        intent_name = "fourth_symptom_intent"
-        corpus_name = previous_data["corpus_name"]
-        mode_name = previous_data["mode_name"]
-        update_item(device_id, intent_id, intent_name, corpus_name, mode_name)
-    else: # do not update, stay at the current state
-        intent_id = previous_data["intent_id"]
-        intent_name = previous_data["intent_name"]
-        corpus_name = previous_data["corpus_name"]
-        mode_name = previous_data["mode_name"]
+    # move to the next step if the previous intent is the step before, otherwise stay at the current step
+    intent_id, intent_name, corpus_name, mode_name = advance_state(device_id, previous_data, "third_symptom_intent", "fourth_symptom_intent")
     
     # get data from the corpus
-    corpus = Corpus(corpus_name)
-    card_title = "Symptom scenario"
-    card_content = corpus.data[intent_id]["context"]
-    card_content += "\n"
-    card_content += " "
-    card_content += "\n"
-    
-    # choose what to display according to the mode
-    if mode_name == "keywords":
-        card_content += extract_keywords(corpus.data[intent_id]["card_text"])
-    else:
-        card_content += ignore_keywords(corpus.data[intent_id]["card_text"])
+    corpus = get_corpus(corpus_name)
+    card_title = ui_text("symptom_card_title")
+    card_content = build_card_content(corpus, intent_id, mode_name)
     
     alexa_response = corpus.data[intent_id]["alexa_response"]
-    img_url = corpus.data[intent_id]["img_url"]
+    small_img_url, large_img_url = card_images(corpus, intent_id)
     
     # add hints for voice commands
-    card_content += "\n\n----------\n"
-    card_content += "To end the skill - 'Alexa, exit/stop'\n"
-    card_content += "To resume the conversation - 'Alexa, ask teachme to continue'\n"
-    card_content += "To clear the previous conversation - 'Alexa, ask teachme to clear the progress'\n"
+    card_content += ui_text("hints")
     
     # add extra time for user to response
-    reprompt_text = "Sorry, I didn't get it. Could you please say that again?"
+    reprompt_text = ui_text("reprompt")
     
     # push the card with Alexa response from the current conversation state - "3"
     return question(alexa_response).reprompt(reprompt_text).standard_card(title=card_title, text=card_content, 
-                                                                          small_image_url=img_url, 
-                                                                          large_image_url=img_url)
+                                                                          small_image_url=small_img_url, 
+                                                                          large_image_url=large_img_url)
 
 @ask.intent("fifth_symptom_intent") # "4"
 def fifth_symptom_intent():
     # get the previous conversation state from the database - "3"
     device_id = context.System.device.deviceId
-    previous_data = get_item(device_id)
+    previous_data = get_state(device_id, "symptom_corpus")
     
-    # check if the previous intent name equal to restaurant_start_intent
-    previous_intent = previous_data["intent_name"]
-    if previous_intent == "fourth_symptom_intent":
-        # update the current conversation state to the database - "4"
-        intent_id = str(int(previous_data["intent_id"]) + 1)
-        intent_name = "fifth_symptom_intent"
-        corpus_name = previous_data["corpus_name"]
-        mode_name = previous_data["mode_name"]
-        update_item(device_id, intent_id, intent_name, corpus_name, mode_name)
-    else: # do not update, stay at the current state
-        intent_id = previous_data["intent_id"]
-        intent_name = previous_data["intent_name"]
-        corpus_name = previous_data["corpus_name"]
-        mode_name = previous_data["mode_name"]
+    # move to the next step if the previous intent is the step before, otherwise stay at the current step
+    intent_id, intent_name, corpus_name, mode_name = advance_state(device_id, previous_data, "fourth_symptom_intent", "fifth_symptom_intent")
     
     # get data from the corpus
-    corpus = Corpus(corpus_name)
-    card_title = "Symptom scenario"
-    card_content = corpus.data[intent_id]["context"]
-    card_content += "\n"
-    card_content += " "
-    card_content += "\n"
-    
-    # choose what to display according to the mode
-    if mode_name == "keywords":
-        card_content += extract_keywords(corpus.data[intent_id]["card_text"])
-    else:
-        card_content += ignore_keywords(corpus.data[intent_id]["card_text"])
+    corpus = get_corpus(corpus_name)
+    card_title = ui_text("symptom_card_title")
+    card_content = build_card_content(corpus, intent_id, mode_name)
     
     alexa_response = corpus.data[intent_id]["alexa_response"]
-    img_url = corpus.data[intent_id]["img_url"]
+    small_img_url, large_img_url = card_images(corpus, intent_id)
     
     # add hints for voice commands
-    card_content += "\n\n----------\n"
-    card_content += "To end the skill - 'Alexa, exit/stop'\n"
-    card_content += "To resume the conversation - 'Alexa, ask teachme to continue'\n"
-    card_content += "To clear the previous conversation - 'Alexa, ask teachme to clear the progress'\n"
+    card_content += ui_text("hints")
     
     # add extra time for user to response
-    reprompt_text = "Sorry, I didn't get it. Could you please say that again?"
+    reprompt_text = ui_text("reprompt")
     
     # push the card with Alexa response from the current conversation state - "4"
     return question(alexa_response).reprompt(reprompt_text).standard_card(title=card_title, text=card_content, 
-                                                                          small_image_url=img_url, 
-                                                                          large_image_url=img_url)
+                                                                          small_image_url=small_img_url, 
+                                                                          large_image_url=large_img_url)
 
 # intent for sixth step of symptom corpus and the end of the conversation
 @ask.intent("sixth_symptom_intent") # "5"
 def sixth_symptom_intent():
     # get the previous conversation state from the database - "4"
     device_id = context.System.device.deviceId
-    previous_data = get_item(device_id)
+    previous_data = get_state(device_id, "symptom_corpus")
     
-    # check if the previous intent name equal to restaurant_start_intent
-    previous_intent = previous_data["intent_name"]
-    if previous_intent == "fifth_symptom_intent":
-        # update the current conversation state to the database - "5"
-        intent_id = str(int(previous_data["intent_id"]) + 1)
-        intent_name = "sixth_symptom_intent"
-        corpus_name = previous_data["corpus_name"]
-        mode_name = previous_data["mode_name"]
-        update_item(device_id, intent_id, intent_name, corpus_name, mode_name)
-    else: # do not update, stay at the current state
-        intent_id = previous_data["intent_id"]
-        intent_name = previous_data["intent_name"]
-        corpus_name = previous_data["corpus_name"]
-        mode_name = previous_data["mode_name"]
+    # move to the next step if the previous intent is the step before, otherwise stay at the current step
+    intent_id, intent_name, corpus_name, mode_name = advance_state(device_id, previous_data, "fifth_symptom_intent", "sixth_symptom_intent")
     
     # get data from the corpus
-    corpus = Corpus(corpus_name)
-    card_title = "Symptom scenario"
-    card_content = corpus.data[intent_id]["context"]
-    card_content += "\n"
-    card_content += " "
-    card_content += "\n"
-    
-    # choose what to display according to the mode
-    if mode_name == "keywords":
-        card_content += extract_keywords(corpus.data[intent_id]["card_text"])
-    else:
-        card_content += ignore_keywords(corpus.data[intent_id]["card_text"])
+    corpus = get_corpus(corpus_name)
+    card_title = ui_text("symptom_card_title")
+    card_content = build_card_content(corpus, intent_id, mode_name)
     
     alexa_response = corpus.data[intent_id]["alexa_response"]
-    img_url = corpus.data[intent_id]["img_url"]
+    small_img_url, large_img_url = card_images(corpus, intent_id)
     
     # add hints for voice commands
-    card_content += "\n\n----------\n"
-    card_content += "To end the skill - 'Alexa, exit/stop'\n"
-    card_content += "To resume the conversation - 'Alexa, ask teachme to continue'\n"
-    card_content += "To clear the previous conversation - 'Alexa, ask teachme to clear the progress'\n"
+    card_content += ui_text("hints")
     
     # get ready for the end of the conversation
-    end_template = "<speak>{} <break time='3s'/> Thank you for practicing. This is the end of the conversation.</speak>"
+    end_template = ui_text("end_template")
     
     # since it is the last intent of the conversation, clear the database
-    delete_item(device_id)
+    clear_state(device_id, corpus_name)
     
     # push the card with Alexa response from the current conversation state - "5"
     return statement(end_template.format(alexa_response)).standard_card(title=card_title, text=card_content, 
-                                                                                                small_image_url=img_url, 
-                                                                                                large_image_url=img_url)
+                                                                                                small_image_url=small_img_url, 
+                                                                                                large_image_url=large_img_url)
 
 
 # In[42]:
@@ -1087,6 +1315,108 @@ def sixth_symptom_intent():
 # In[ ]:
 
 
+###
+# consumed capacity
+###
+
+# add the capacity consumed by the request to the intent, corpus and device cohort totals
+@app.after_request
+def account_capacity(response):
+    consumed = g.pop("consumed_capacity", None)
+    if consumed is not None:
+        intent = ask_request.intent
+        intent_name = intent.name if intent else ask_request.type
+        capacity.add(intent_name or "-", g.get("corpus_name"), context.System.device.deviceId, consumed[0], consumed[1])
+    return response
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    return jsonify({"consumed_capacity": capacity.snapshot()})
+
+
+###
+# warm up - a new worker is only ready once every hot path has been primed
+###
+
+WARM_UP = os.environ.get("TEACHME_WARM_UP", "1") == "1"
+WARM_UP_MAX_DELAY = float(os.environ.get("TEACHME_WARM_UP_MAX_DELAY", "30")) # seconds between retries of a step
+ALEXA_CERT_URL = os.environ.get("TEACHME_ALEXA_CERT_URL", "") # e.g. https://s3.amazonaws.com/echo.api/echo-api-cert-7.pem
+
+warm_up_status = {"ready": False, "steps": {}}
+warm_up_lock = threading.Lock()
+warm_up_pid = None # the process the warm up thread runs in
+
+# the default locale first, and no more locales than are kept in memory - the others would only be evicted again
+def warm_up_corpora():
+    locale_names = sorted(os.listdir(LOCALE_DIR))
+    if DEFAULT_LOCALE in locale_names:
+        locale_names.remove(DEFAULT_LOCALE)
+        locale_names.insert(0, DEFAULT_LOCALE)
+    for locale_name in locale_names[:MAX_LOCALES]:
+        locale = get_locale(locale_name)
+        for corpus_name in locale.corpus_names():
+            corpus = locale.get_corpus(corpus_name)
+            # render the card texts of both modes into the keyword caches
+            for intent_id in corpus.data:
+                extract_keywords(corpus.data[intent_id]["card_text"])
+                ignore_keywords(corpus.data[intent_id]["card_text"])
+        locale.get_index()
+
+# resolve the endpoint and open the tls connection, it stays in the boto3 connection pool
+def warm_up_storage():
+    table.get_item(Key=item_key("__warm_up__", "-"))
+
+def warm_up_verification():
+    if ALEXA_CERT_URL and app.config.get("ASK_VERIFY_REQUESTS", True):
+        certificate_cache.get(ALEXA_CERT_URL)
+
+# a failed step is retried until it succeeds, the delay doubles up to WARM_UP_MAX_DELAY
+def warm_up():
+    for name, step in [("corpora", warm_up_corpora), ("storage", warm_up_storage),
+                       ("verification", warm_up_verification)]:
+        start = time.time()
+        delay = min(1.0, WARM_UP_MAX_DELAY)
+        attempt = 1
+        while True:
+            try:
+                step()
+                break
+            except Exception:
+                log.exception("warm up step failed", extra={"fields": {"step": name, "attempt": attempt}})
+                warm_up_status["steps"][name] = "failed, attempt {}".format(attempt)
+            time.sleep(delay)
+            delay = min(delay * 2, WARM_UP_MAX_DELAY)
+            attempt += 1
+        warm_up_status["steps"][name] = "{:.3f}s".format(time.time() - start)
+    warm_up_status["ready"] = True
+    log.info("warm up finished", extra={"fields": warm_up_status["steps"]})
+
+# threads do not survive a fork, a worker forked by a pre-fork server (e.g. gunicorn --preload) before
+# the warm up finished starts its own on the first readiness check
+def start_warm_up():
+    global warm_up_pid
+    with warm_up_lock:
+        if warm_up_status["ready"] or warm_up_pid == os.getpid():
+            return
+        warm_up_pid = os.getpid()
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+# readiness check for the load balancer, 503 until the warm up has finished
+@app.route("/ready", methods=["GET"])
+def ready_endpoint():
+    if WARM_UP:
+        start_warm_up()
+    return jsonify(warm_up_status), 200 if warm_up_status["ready"] else 503
+
+if WARM_UP:
+    start_warm_up()
+else:
+    warm_up_status["ready"] = True
+
+
+# In[ ]:
+
+
 if __name__ == '__main__':
     app.run(debug=True)
 
@@ -0,0 +1,174 @@
+
+# coding: utf-8
+
+###
+# in-memory stand-in for the dynamodb table, for benchmarks, replays and local runs
+# only the calls and expressions used by this project are supported
+###
+
+import re
+import copy
+import zlib
+import threading
+
+from botocore.exceptions import ClientError
+
+CLAUSE_PATTERN = re.compile(r"\b(set|remove)\s+", re.IGNORECASE)
+
+
+# stable across processes, so a resumed scan sees the same segments
+def segment_of(key, total_segments):
+    return zlib.crc32(str(key).encode()) % total_segments
+
+
+# boto3 condition objects, only the operators used by this project - item is None when there is no item
+def matches_condition(item, condition):
+    expression = condition.get_expression()
+    operator = expression["operator"]
+    values = expression["values"]
+    if operator == "OR":
+        return any(matches_condition(item, value) for value in values)
+    if operator == "AND":
+        return all(matches_condition(item, value) for value in values)
+    if operator == "attribute_not_exists":
+        return item is None or values[0].name not in item
+    if operator == "attribute_exists":
+        return item is not None and values[0].name in item
+    if operator == "=":
+        return item is not None and item.get(values[0].name) == values[1]
+    raise ValueError("unsupported condition: {}".format(operator))
+
+def conditional_check_failed(operation_name):
+    return ClientError({"Error": {"Code": "ConditionalCheckFailedException",
+                                  "Message": "The conditional request failed"}}, operation_name)
+
+
+class LocalTable:
+    def __init__(self, key_name="device_id", sort_key_name=None, name="local"):
+        self.name = name
+        self.key_name = key_name
+        self.sort_key_name = sort_key_name
+        self.items = {} # (partition key, sort key) or partition key -> item
+        self.lock = threading.Lock()
+
+    def item_key(self, key):
+        if self.sort_key_name is None:
+            return key[self.key_name]
+        return (key[self.key_name], key[self.sort_key_name])
+
+    def partition_of(self, item_key):
+        return item_key if self.sort_key_name is None else item_key[0]
+
+    def key_of(self, item_key):
+        if self.sort_key_name is None:
+            return {self.key_name: item_key}
+        return {self.key_name: item_key[0], self.sort_key_name: item_key[1]}
+
+    def get_item(self, Key, **kwargs):
+        with self.lock:
+            item = self.items.get(self.item_key(Key))
+        return {"Item": copy.deepcopy(item)} if item is not None else {}
+
+    def put_item(self, Item, ConditionExpression=None, **kwargs):
+        with self.lock:
+            item_key = self.item_key(Item)
+            if ConditionExpression is not None and not matches_condition(self.items.get(item_key),
+                                                                         ConditionExpression):
+                raise conditional_check_failed("PutItem")
+            self.items[item_key] = copy.deepcopy(Item)
+        return {}
+
+    # "set a = :a, b = :b remove c, d" expressions only
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeValues=None, ExpressionAttributeNames=None,
+                    ConditionExpression=None, **kwargs):
+        names = ExpressionAttributeNames or {}
+        parts = CLAUSE_PATTERN.split(UpdateExpression)
+        if parts[0].strip():
+            raise ValueError("unsupported update expression: {}".format(UpdateExpression))
+        updated = {}
+        removed = []
+        for clause, body in zip(parts[1::2], parts[2::2]):
+            for part in body.split(","):
+                if clause.lower() == "set":
+                    attribute_name, value_name = [name.strip() for name in part.split("=")]
+                    updated[names.get(attribute_name, attribute_name)] = copy.deepcopy(ExpressionAttributeValues[value_name])
+                else:
+                    removed.append(names.get(part.strip(), part.strip()))
+        with self.lock:
+            if ConditionExpression is not None and not matches_condition(self.items.get(self.item_key(Key)),
+                                                                         ConditionExpression):
+                raise conditional_check_failed("UpdateItem")
+            item = self.items.setdefault(self.item_key(Key), dict(Key))
+            item.update(updated)
+            for attribute_name in removed:
+                item.pop(attribute_name, None)
+        return {"Attributes": updated}
+
+    def delete_item(self, Key, **kwargs):
+        with self.lock:
+            self.items.pop(self.item_key(Key), None)
+        return {}
+
+    def batch_writer(self, **kwargs):
+        return LocalBatchWriter(self)
+
+    # the items of one partition in sort key order, only Key(partition key).eq(value) conditions
+    def query(self, KeyConditionExpression, Limit=None, ExclusiveStartKey=None, **kwargs):
+        expression = KeyConditionExpression.get_expression()
+        key, value = expression["values"]
+        if expression["operator"] != "=" or getattr(key, "name", None) != self.key_name:
+            raise ValueError("only equality on {} is supported".format(self.key_name))
+        return self.page(lambda item_key: self.partition_of(item_key) == value, Limit, ExclusiveStartKey)
+
+    # segmented scan in pages of Limit items, FilterExpression is not supported
+    def scan(self, Segment=0, TotalSegments=1, Limit=None, ExclusiveStartKey=None, **kwargs):
+        return self.page(lambda item_key: segment_of(self.partition_of(item_key), TotalSegments) == Segment,
+                         Limit, ExclusiveStartKey)
+
+    def page(self, matches, limit, exclusive_start_key):
+        with self.lock:
+            keys = sorted(key for key in self.items if matches(key))
+            if exclusive_start_key is not None:
+                keys = [key for key in keys if key > self.item_key(exclusive_start_key)]
+            page = keys[:limit] if limit else keys
+            response = {"Items": [copy.deepcopy(self.items[key]) for key in page], "Count": len(page)}
+        if limit and len(keys) > limit:
+            response["LastEvaluatedKey"] = self.key_of(page[-1])
+        return response
+
+
+# the requests are applied when the block ends, like the boto3 batch writer flushes its buffer
+class LocalBatchWriter:
+    def __init__(self, table):
+        self.table = table
+        self.requests = []
+
+    def put_item(self, Item):
+        self.requests.append((self.table.put_item, {"Item": Item}))
+
+    def delete_item(self, Key):
+        self.requests.append((self.table.delete_item, {"Key": Key}))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for method, kwargs in self.requests:
+            method(**kwargs)
+        self.requests = []
+
+
+# stand-in for the dynamodb service resource, only batch_write_item on the given tables
+class LocalDatabase:
+    def __init__(self, *tables):
+        self.tables = {table.name: table for table in tables}
+
+    def batch_write_item(self, RequestItems, **kwargs):
+        for table_name, write_requests in RequestItems.items():
+            with self.tables[table_name].batch_writer() as batch:
+                for write_request in write_requests:
+                    if "PutRequest" in write_request:
+                        batch.put_item(Item=write_request["PutRequest"]["Item"])
+                    else:
+                        batch.delete_item(Key=write_request["DeleteRequest"]["Key"])
+        return {"UnprocessedItems": {}}
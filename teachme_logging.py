@@ -0,0 +1,103 @@
+
+# coding: utf-8
+
+###
+# structured logging - records go through a queue, a background listener does the i/o
+###
+
+import sys
+import copy
+import json
+import queue
+import random
+import atexit
+import logging
+import threading
+import logging.handlers
+
+
+# one json object per line
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {"time": self.formatTime(record), "level": record.levelname,
+                 "logger": record.name, "message": record.getMessage()}
+        for name, value in getattr(record, "fields", {}).items(): # extra={"fields": {...}}
+            entry[name] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+# keeps only a fraction of the verbose debug records, e.g. the flask-ask request/response dumps
+class SamplingFilter(logging.Filter):
+    def __init__(self, rate, level=logging.DEBUG):
+        super().__init__()
+        self.rate = rate
+        self.level = level
+
+    def filter(self, record):
+        if record.levelno > self.level:
+            return True
+        return random.random() < self.rate
+
+
+# QueueHandler.prepare formats the whole record (traceback included) on the logging thread and drops
+# exc_info, this one only merges the arguments into the message - the listener formats the rest
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+# stop() may be called more than once, e.g. by the application and by atexit
+class QueueListener(logging.handlers.QueueListener):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stop_lock = threading.Lock()
+        self.stopped = False
+
+    def stop(self):
+        with self.stop_lock:
+            if self.stopped:
+                return
+            self.stopped = True
+        super().stop()
+
+
+# "flask_ask=DEBUG,teachme=INFO" -> {"flask_ask": "DEBUG", "teachme": "INFO"}
+def parse_levels(config):
+    levels = {}
+    for part in config.split(","):
+        if "=" in part:
+            name, level = part.split("=", 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+# install the queue handler on the root logger, returns the started listener
+def setup_logging(levels, sampled_loggers=None, stream=sys.stderr):
+    log_queue = queue.Queue(-1)
+
+    output = logging.StreamHandler(stream)
+    output.setFormatter(JsonFormatter())
+    listener = QueueListener(log_queue, output, respect_handler_level=True)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(DeferredQueueHandler(log_queue))
+    root.setLevel(levels.get("root", "WARNING"))
+
+    for name, level in levels.items():
+        if name != "root":
+            logging.getLogger(name).setLevel(level)
+
+    # the filter is on the logger, so dropped records are never put on the queue
+    for name, rate in (sampled_loggers or {}).items():
+        logging.getLogger(name).addFilter(SamplingFilter(rate))
+
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
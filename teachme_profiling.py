@@ -0,0 +1,134 @@
+
+# coding: utf-8
+
+###
+# on-demand profiling of the skill endpoint
+###
+
+import os
+import sys
+import time
+import random
+import pstats
+import cProfile
+import threading
+import collections
+
+from werkzeug.wsgi import ClosingIterator
+
+
+# wsgi middleware, profiles the whole turn - request parsing, handler, corpus, storage and response
+class ProfilerMiddleware:
+    def __init__(self, wsgi_app, sample_rate=0.1, output_dir="profiles", interval=0.01, dump_every=20):
+        self.wsgi_app = wsgi_app
+        self.sample_rate = sample_rate # fraction of requests to profile
+        self.output_dir = output_dir
+        self.dump_every = dump_every # profiled requests between writing the files
+        self.sampler = StackSampler(interval) # one sampler thread for all profiled requests
+
+        self.lock = threading.RLock()
+        self.stats = None # pstats.Stats aggregated since startup
+        self.stacks = collections.Counter() # collapsed stack -> number of samples
+        self.profiled_requests = 0
+
+    def __call__(self, environ, start_response):
+        if random.random() >= self.sample_rate:
+            return self.wsgi_app(environ, start_response)
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except RuntimeError: # another profile is active on this thread, e.g. of a response that was not closed
+            return self.wsgi_app(environ, start_response)
+        thread_id = threading.get_ident()
+        self.sampler.add(thread_id)
+
+        # the profile ends when the server closes the response, so the response building is measured as well
+        def finish():
+            profile.disable()
+            self.add_profile(profile, self.sampler.remove(thread_id))
+
+        try:
+            return ClosingIterator(self.wsgi_app(environ, start_response), finish)
+        except BaseException:
+            finish()
+            raise
+
+    def add_profile(self, profile, stacks):
+        with self.lock:
+            if self.stats is None:
+                self.stats = pstats.Stats(profile)
+            else:
+                self.stats.add(profile)
+            self.stacks.update(stacks)
+            self.profiled_requests += 1
+            if self.profiled_requests % self.dump_every == 0:
+                self.dump()
+
+    # write the aggregated pstats file and a flame graph file in the collapsed stack format
+    def dump(self):
+        with self.lock:
+            if self.stats is None:
+                return
+            os.makedirs(self.output_dir, exist_ok=True)
+            self.stats.dump_stats(os.path.join(self.output_dir, "teachme.prof"))
+            with open(os.path.join(self.output_dir, "teachme.collapsed"), "w") as f:
+                for stack, count in self.stacks.most_common():
+                    f.write("{} {}\n".format(stack, count))
+
+    # the hottest functions since startup, sorted by cumulative or own time
+    def top_functions(self, limit=20, sort_by="cumulative"):
+        with self.lock:
+            if self.stats is None:
+                return {"profiled_requests": 0, "functions": []}
+            rows = []
+            for (filename, line, name), (cc, nc, tt, ct, callers) in self.stats.stats.items():
+                rows.append({"function": "{}:{}({})".format(filename, line, name),
+                             "calls": nc, "own_time": tt, "cumulative_time": ct})
+            profiled_requests = self.profiled_requests
+        key = "own_time" if sort_by == "own" else "cumulative_time"
+        rows.sort(key=lambda row: row[key], reverse=True)
+        return {"profiled_requests": profiled_requests, "functions": rows[:limit]}
+
+
+# samples the stacks of the profiled threads from one background thread, stacks are "outer;...;inner" strings
+class StackSampler:
+    def __init__(self, interval):
+        self.interval = interval
+        self.threads = {} # thread id -> Counter of its stacks
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def add(self, thread_id):
+        with self.lock:
+            self.threads[thread_id] = collections.Counter()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="stack-sampler", daemon=True)
+                self.thread.start()
+
+    # the stacks sampled since add
+    def remove(self, thread_id):
+        with self.lock:
+            return self.threads.pop(thread_id, collections.Counter())
+
+    def run(self):
+        while True:
+            with self.lock:
+                thread_ids = list(self.threads)
+            if thread_ids:
+                frames = sys._current_frames()
+                stacks = {thread_id: collapse(frames[thread_id]) for thread_id in thread_ids if thread_id in frames}
+                with self.lock:
+                    for thread_id, stack in stacks.items():
+                        if thread_id in self.threads:
+                            self.threads[thread_id][stack] += 1
+            time.sleep(self.interval)
+
+
+def collapse(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append("{} ({}:{})".format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+        frame = frame.f_back
+    return ";".join(reversed(names))
@@ -0,0 +1,163 @@
+
+# coding: utf-8
+
+###
+# replay of captured skill requests against a build of the app, with the in-memory store
+#
+# python teachme_replay.py run captures/*.jsonl --build ../teachme-main --output main.jsonl
+# python teachme_replay.py run captures/*.jsonl --build . --speed 4 --output branch.jsonl
+# python teachme_replay.py compare main.jsonl branch.jsonl
+#
+# the requests are sent one after another in the captured order, at the captured pace divided by
+# --speed (0 - as fast as possible), each run is its own process so two builds never share a module
+###
+
+import os
+import sys
+import json
+import time
+import argparse
+import collections
+
+
+def read_captures(paths):
+    entries = []
+    for path in paths:
+        with open(path) as f:
+            entries.extend(json.loads(line) for line in f if line.strip())
+    entries.sort(key=lambda entry: entry["time"])
+    return entries
+
+
+def request_name(request_json):
+    alexa_request = request_json.get("request", {})
+    return alexa_request.get("intent", {}).get("name") or alexa_request.get("type", "-")
+
+
+# import the app of a build directory with the local store, request verification off
+def load_app(build_dir):
+    os.environ["TEACHME_STORE"] = "local"
+    os.environ["TEACHME_WARM_UP"] = "0"
+    os.environ["TEACHME_CAPTURE_DIR"] = ""
+    os.environ["TEACHME_CAPACITY_SUMMARY_INTERVAL"] = "0"
+    # the same on both runs, so the signed session state of their responses can be compared
+    os.environ.setdefault("TEACHME_STATE_SECRET", "teachme-replay")
+    build_dir = os.path.abspath(build_dir)
+    os.chdir(build_dir)
+    sys.path.insert(0, build_dir)
+    import teachme_learn_v1
+    teachme_learn_v1.app.config["ASK_VERIFY_REQUESTS"] = False
+    # load the corpora before the first request, so it is not timed
+    if hasattr(teachme_learn_v1, "warm_up"):
+        teachme_learn_v1.warm_up()
+    return teachme_learn_v1.app
+
+
+def run(entries, app, speed, output):
+    client = app.test_client()
+    session_attributes = {} # session id -> attributes of the last response, sent back like alexa does
+    first = entries[0]["time"] if entries else 0
+    start = time.perf_counter()
+    for index, entry in enumerate(entries):
+        if speed > 0:
+            delay = start + (entry["time"] - first) / speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        request_json = entry["request"]
+        session = request_json.get("session")
+        if session and not session.get("new") and session.get("sessionId") in session_attributes:
+            session["attributes"] = session_attributes[session["sessionId"]]
+
+        sent = time.perf_counter()
+        response = client.post("/", data=json.dumps(request_json), content_type="application/json")
+        latency = time.perf_counter() - sent
+        try:
+            response_json = json.loads(response.get_data(as_text=True) or "null")
+        except ValueError:
+            response_json = None
+        if session and isinstance(response_json, dict) and "sessionAttributes" in response_json:
+            session_attributes[session.get("sessionId")] = response_json["sessionAttributes"]
+        output.write(json.dumps({"index": index, "name": request_name(request_json), "status": response.status_code,
+                                 "latency": latency, "captured_latency": entry.get("elapsed"),
+                                 "response": response_json}) + "\n")
+
+
+def percentiles(values):
+    values = sorted(values)
+    if not values:
+        return {}
+    pick = lambda fraction: values[min(int(fraction * len(values)), len(values) - 1)]
+    return {"n": len(values), "p50": pick(0.5), "p90": pick(0.9), "p99": pick(0.99), "max": values[-1]}
+
+def format_percentiles(stats):
+    if not stats:
+        return "-"
+    return "n={n} p50={p50:.2f}ms p90={p90:.2f}ms p99={p99:.2f}ms max={max:.2f}ms".format(
+        n=stats["n"], **{key: stats[key] * 1000 for key in ["p50", "p90", "p99", "max"]})
+
+
+def read_results(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+# latency distributions of both runs, overall and per request name, and the requests answered differently
+def compare(results_a, results_b, show=5):
+    names = sorted(set(result["name"] for result in results_a + results_b))
+    print("{:<32} {}".format("all (a)", format_percentiles(percentiles([r["latency"] for r in results_a]))))
+    print("{:<32} {}".format("all (b)", format_percentiles(percentiles([r["latency"] for r in results_b]))))
+    for name in names:
+        for label, results in [("a", results_a), ("b", results_b)]:
+            stats = percentiles([r["latency"] for r in results if r["name"] == name])
+            print("{:<32} {}".format("{} ({})".format(name, label), format_percentiles(stats)))
+
+    differences = collections.Counter()
+    examples = []
+    for a, b in zip(results_a, results_b):
+        if a["status"] != b["status"] or a["response"] != b["response"]:
+            differences[a["name"]] += 1
+            if len(examples) < show:
+                examples.append((a, b))
+    if len(results_a) != len(results_b):
+        print("the runs replayed {} and {} requests".format(len(results_a), len(results_b)))
+    print("{} of {} responses differ".format(sum(differences.values()), min(len(results_a), len(results_b))))
+    for name, count in differences.most_common():
+        print("  {}: {}".format(name, count))
+    for a, b in examples:
+        print("request {} ({}):\n  a: {} {}\n  b: {} {}".format(a["index"], a["name"], a["status"],
+                                                               json.dumps(a["response"], sort_keys=True),
+                                                               b["status"], json.dumps(b["response"], sort_keys=True)))
+    return 1 if differences or len(results_a) != len(results_b) else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay captured skill requests and compare builds.")
+    commands = parser.add_subparsers(dest="command")
+    run_parser = commands.add_parser("run", help="replay captures against a build")
+    run_parser.add_argument("captures", nargs="+")
+    run_parser.add_argument("--build", default=".", help="directory of the build to replay against")
+    run_parser.add_argument("--speed", type=float, default=1.0, help="1 - captured pace, 0 - as fast as possible")
+    run_parser.add_argument("--output", required=True, help="results, one json line per request")
+    compare_parser = commands.add_parser("compare", help="compare the results of two runs")
+    compare_parser.add_argument("results_a")
+    compare_parser.add_argument("results_b")
+    compare_parser.add_argument("--show", type=int, default=5, help="differing responses to print")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        entries = read_captures(args.captures)
+        output_path = os.path.abspath(args.output)
+        app = load_app(args.build)
+        with open(output_path, "w") as output:
+            run(entries, app, args.speed, output)
+        results = read_results(output_path)
+        print("replayed {} requests, {}".format(len(results), format_percentiles(percentiles(
+            [result["latency"] for result in results]))))
+        return 0
+    if args.command == "compare":
+        return compare(read_results(args.results_a), read_results(args.results_b), args.show)
+    parser.print_help()
+    return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
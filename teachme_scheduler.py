@@ -0,0 +1,97 @@
+
+# coding: utf-8
+
+###
+# spaced repetition - per learner priority queue of the practised steps, keyed on due time
+###
+
+import time
+import zlib
+import heapq
+import struct
+
+HOUR = 60 # the schedule counts in minutes
+FIRST_INTERVAL = 24 * HOUR # after the first success
+RETRY_INTERVAL = 1 * HOUR # after a failure
+MAX_INTERVAL = 180 * 24 * HOUR
+
+# corpus index, step, due (minutes since epoch), interval (minutes), streak - 13 bytes per entry
+ENTRY = struct.Struct("<HHIIB")
+
+
+def now_minutes():
+    return int(time.time() // 60)
+
+
+class Schedule:
+    def __init__(self, corpus_names=None):
+        self.corpus_names = list(corpus_names or []) # entries refer to a corpus by its index
+        self.corpus_ids = {name: index for index, name in enumerate(self.corpus_names)}
+        self.entries = {} # (corpus index, step) -> [due, interval, streak]
+        self.heap = [] # (due, corpus index, step), an item is stale when its due is not the entry's due
+        self.version = 0 # writes of the stored schedule, a write only succeeds on the version it was read at
+
+    def corpus_id(self, corpus_name):
+        if corpus_name not in self.corpus_ids:
+            self.corpus_ids[corpus_name] = len(self.corpus_names)
+            self.corpus_names.append(corpus_name)
+        return self.corpus_ids[corpus_name]
+
+    # update a step after the learner practised it, O(log n)
+    def record(self, corpus_name, step, success, now=None):
+        now = now_minutes() if now is None else now
+        key = (self.corpus_id(corpus_name), int(step))
+        due, interval, streak = self.entries.get(key, (0, 0, 0))
+        if success:
+            interval = FIRST_INTERVAL if streak == 0 else min(interval * 2, MAX_INTERVAL)
+            streak = min(streak + 1, 255)
+        else:
+            interval = RETRY_INTERVAL
+            streak = 0
+        due = now + interval
+        self.entries[key] = [due, interval, streak]
+        heapq.heappush(self.heap, (due, key[0], key[1]))
+        # stale heap items are dropped lazily, rebuild when they outnumber the live ones
+        if len(self.heap) > 2 * len(self.entries) + 16:
+            self.rebuild()
+
+    def rebuild(self):
+        self.heap = [(entry[0], key[0], key[1]) for key, entry in self.entries.items()]
+        heapq.heapify(self.heap)
+
+    # the step that is most overdue, as (corpus name, step, due), or None if nothing is due yet
+    def next_due(self, now=None):
+        now = now_minutes() if now is None else now
+        while self.heap:
+            due, corpus_index, step = self.heap[0]
+            entry = self.entries.get((corpus_index, step))
+            if entry is None or entry[0] != due:
+                heapq.heappop(self.heap) # stale
+                continue
+            if due > now:
+                return None
+            return self.corpus_names[corpus_index], step, due
+        return None
+
+    def __len__(self):
+        return len(self.entries)
+
+    ###
+    # compact persisted state - packed entries, zlib compressed
+    ###
+
+    def encode(self):
+        packed = b"".join(ENTRY.pack(corpus_index, step, due, interval, streak)
+                          for (corpus_index, step), (due, interval, streak) in self.entries.items())
+        return {"corpora": ",".join(self.corpus_names), "entries": zlib.compress(packed)}
+
+    @classmethod
+    def decode(cls, item):
+        corpus_names = item["corpora"].split(",") if item.get("corpora") else []
+        schedule = cls(corpus_names)
+        packed = zlib.decompress(bytes(item["entries"])) if item.get("entries") else b""
+        for corpus_index, step, due, interval, streak in ENTRY.iter_unpack(packed):
+            schedule.entries[(corpus_index, step)] = [due, interval, streak]
+        schedule.rebuild()
+        schedule.version = int(item.get("version", 0))
+        return schedule
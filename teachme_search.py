@@ -0,0 +1,104 @@
+
+# coding: utf-8
+
+###
+# inverted index over the corpus steps of a locale, for "practise ..." requests
+#
+# python teachme_search.py locales/en-GB "asking for the bill"
+###
+
+import sys
+import math
+import argparse
+import collections
+
+from teachme_corpus import KEYWORD_PATTERN, tokenize, load_corpora
+
+# words of a spoken request that say nothing about the step
+STOP_WORDS = frozenset("a an the to of for and or in on at my me i i'm you your it it's is am are was be how do "
+                       "does did can could would will should please want like practise practice practising "
+                       "practicing learn say saying tell told let's lets again some ask have has had get go going "
+                       "need what when where which about with this that something".split())
+# how much a match in each text of a step counts
+FIELD_WEIGHTS = {"sentence": 2.0, "title": 2.0, "keywords": 1.5, "context": 1.0, "question": 1.0}
+# a step is only found when it matches at least this share of the words of the request, with at least this
+# score per word - otherwise one common word would start a step for almost any request
+MIN_COVERAGE = 0.5
+MIN_SCORE = 0.25
+
+
+# crude stemming, so "ordering" finds "order" and "drinks" finds "drink"
+def normalize(word):
+    for suffix in ("ing", "ed", "es", "s"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+def terms(text):
+    words = (normalize(word) for word in tokenize(text) if word not in STOP_WORDS)
+    return [word for word in words if word not in STOP_WORDS]
+
+
+# a step n is found by the texts its card leads to: the question, context and keywords of the card of
+# step n and the sentence of step n + 1, the learner practises it starting at step n - step 0 is also
+# found by its own sentence, which names the scenario (e.g. "Order food")
+class ScenarioIndex:
+    def __init__(self, corpora):
+        self.steps = [] # (corpus name, intent id)
+        self.postings = {} # term -> [(step, weight)]
+        frequencies = []
+        for corpus in corpora:
+            for step in range(corpus.get_end_id() - 1):
+                intent_id = str(step)
+                data = corpus.get_data(intent_id)
+                fields = {"sentence": corpus.get_data(str(step + 1))["user_response"],
+                          "title": data["user_response"] if step == 0 else "",
+                          "keywords": " ".join(KEYWORD_PATTERN.findall(data["card_text"])),
+                          "context": data["context"],
+                          "question": data["alexa_response"]}
+                counts = collections.Counter()
+                for field, text in fields.items():
+                    for term in terms(text):
+                        counts[term] += FIELD_WEIGHTS[field]
+                self.steps.append((corpus.get_meta_data(intent_id)["corpus_name"], intent_id))
+                frequencies.append(counts)
+
+        # tf-idf weights, normalised by the length of the step so long contexts do not win every search
+        document_frequency = collections.Counter(term for counts in frequencies for term in counts)
+        for step, counts in enumerate(frequencies):
+            length = math.sqrt(sum(counts.values())) or 1.0
+            for term, count in counts.items():
+                weight = count * math.log(1 + len(frequencies) / document_frequency[term]) / length
+                self.postings.setdefault(term, []).append((step, weight))
+
+    # the best (corpus name, intent id) for a request, None when no step matches enough of it
+    def search(self, query, corpus_name=None):
+        query_terms = set(terms(query))
+        scores = collections.defaultdict(float)
+        matches = collections.Counter()
+        for term in query_terms:
+            for step, weight in self.postings.get(term, ()):
+                scores[step] += weight
+                matches[step] += 1
+        scores = {step: score for step, score in scores.items()
+                  if matches[step] >= MIN_COVERAGE * len(query_terms) and score >= MIN_SCORE * len(query_terms)}
+        if corpus_name is not None:
+            scores = {step: score for step, score in scores.items() if self.steps[step][0] == corpus_name}
+        if not scores:
+            return None
+        # ties go to the earlier step
+        return self.steps[max(scores, key=lambda step: (scores[step], -step))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find the corpus step of a practise request.")
+    parser.add_argument("directory")
+    parser.add_argument("query")
+    args = parser.parse_args()
+    index = ScenarioIndex(load_corpora(args.directory, processes=1).values())
+    print(index.search(args.query))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,137 @@
+
+# coding: utf-8
+
+###
+# compact encoding of the conversation items
+#
+# version 1 (no "v" attribute): intent_id, intent_name, corpus_name, mode_name, main_course_name as strings
+# version 2: v, c (corpus id), i (step as a number), m (mode id), mc (main course), u (last written, epoch seconds)
+#            intent_name is not stored, it is looked up in the corpus by the step
+# version 3: as version 2 without c, the corpus is the scenario of the key
+#
+# an item holds the progress of one scenario, the key is (device_id, scenario) where scenario is the corpus name
+# a field without a value (e.g. no mode_name slot) has no attribute
+###
+
+SCHEMA_VERSION = 3
+
+# ids are stored in the table, never renumber or reuse one - so they are a fixed table rather than numbered
+# from the corpus files of a locale, where a new or renamed corpus would shift the ids of the stored items
+#
+# the scenario sort key is the corpus name, not its id: a corpus without an id still needs a key, the admin
+# --corpus filter and the export read the scenario as it is, and the id would save a dozen bytes of an item
+# that stays within one read (4 KB) and one write (1 KB) capacity unit either way - CORPUS_IDS is only read
+# for the c attribute of version 2 items
+CORPUS_IDS = {"restaurant_corpus": 1, "symptom_corpus": 2}
+MODE_IDS = {"keywords": 1, "sentence": 2}
+CORPUS_NAMES = {value: name for name, value in CORPUS_IDS.items()}
+MODE_NAMES = {value: name for name, value in MODE_IDS.items()}
+
+# state field -> attribute name, corpus_name is only read from version 2 items
+ATTRIBUTE_NAMES = {"corpus_name": "c", "intent_id": "i", "mode_name": "m", "main_course_name": "mc", "updated": "u"}
+
+# the main course of the later restaurant steps when the learner did not choose one, the one the waiter recommends
+DEFAULT_MAIN_COURSE = "New York strip steak"
+
+# partition key and sort key of the conversation table
+KEY_NAMES = ("device_id", "scenario")
+# the sort key of the practice schedule of a device (teachme_scheduler.py), it is kept in the partition of the
+# device so the query of the launch reads it with the progress
+SCHEDULE_SCENARIO = "#schedule"
+
+# version 1 and 2 attributes, removed when the whole state of an item is written
+# (main_course_name is not rewritten with the state, so it is read as a fallback of mc instead)
+LEGACY_ATTRIBUTES = ["intent_id", "intent_name", "corpus_name", "mode_name", "main_course_name"]
+REMOVED_ATTRIBUTES = ["intent_id", "intent_name", "corpus_name", "mode_name", "c"]
+
+
+# names and modes without an id are stored as strings
+def encode_value(ids, value):
+    return ids.get(value, value)
+
+def decode_value(names, value):
+    if value is None or isinstance(value, str):
+        return value
+    return names.get(int(value), str(value))
+
+
+# the attributes of a version 3 item for the state fields, e.g. {"v": 3, "i": 3, "m": 1}, and the
+# attributes of the fields without a value
+def encode_state(state, versioned=True):
+    attributes = {"v": SCHEMA_VERSION} if versioned else {}
+    empty = []
+    for field, value in state.items():
+        if field in ("corpus_name", "intent_name"): # the key, and looked up in the corpus
+            continue
+        if value is None:
+            empty.append(ATTRIBUTE_NAMES.get(field, field))
+            continue
+        if field == "mode_name":
+            value = encode_value(MODE_IDS, value)
+        elif field == "intent_id":
+            value = int(value)
+        attributes[ATTRIBUTE_NAMES.get(field, field)] = value
+    return attributes, empty
+
+def item_key(device_id, corpus_name):
+    return {"device_id": device_id, "scenario": corpus_name}
+
+def encode_item(key, state):
+    item, _ = encode_state(state)
+    item.update(item_key(key, state["corpus_name"]))
+    return item
+
+
+# the state fields of an item in any version, intent_name_of(corpus_name, intent_id) gives the
+# intent name of a version 2 or 3 item, mode_name is None when the item has no mode
+def decode_item(item, intent_name_of=None):
+    if "v" not in item: # version 1
+        state = {field: item[field] for field in LEGACY_ATTRIBUTES if field in item}
+        if "mc" in item:
+            state["main_course_name"] = item["mc"]
+        state.setdefault("mode_name", None)
+        return state
+
+    state = {}
+    if "scenario" in item:
+        state["corpus_name"] = item["scenario"]
+    elif item.get("c") is not None:
+        state["corpus_name"] = decode_value(CORPUS_NAMES, item["c"])
+    if item.get("i") is not None:
+        state["intent_id"] = str(int(item["i"]))
+    state["mode_name"] = decode_value(MODE_NAMES, item.get("m"))
+    if "mc" in item:
+        state["main_course_name"] = item["mc"]
+    elif "main_course_name" in item:
+        state["main_course_name"] = item["main_course_name"]
+    if item.get("u") is not None:
+        state["updated"] = int(item["u"])
+    if intent_name_of is not None and "corpus_name" in state and "intent_id" in state:
+        state["intent_name"] = intent_name_of(state["corpus_name"], state["intent_id"])
+    return state
+
+
+# update expression writing the state fields in version 3, the whole state also marks the item as
+# version 3 and removes the older attributes, a single field leaves the version as it is
+# the attributes of fields without a value are removed
+def update_expression(state, whole_state=True):
+    attributes, removed = encode_state(state, versioned=whole_state)
+    if whole_state:
+        removed += REMOVED_ATTRIBUTES
+    names = {}
+    values = {}
+    assignments = []
+    for index, (attribute_name, value) in enumerate(sorted(attributes.items())):
+        names["#a{}".format(index)] = attribute_name
+        values[":a{}".format(index)] = value
+        assignments.append("#a{} = :a{}".format(index, index))
+    removals = []
+    for index, attribute_name in enumerate(removed):
+        names["#r{}".format(index)] = attribute_name
+        removals.append("#r{}".format(index))
+    clauses = []
+    if assignments:
+        clauses.append("set {}".format(", ".join(assignments)))
+    if removals:
+        clauses.append("remove {}".format(", ".join(removals)))
+    return " ".join(clauses), names, values
@@ -0,0 +1,165 @@
+
+# coding: utf-8
+
+###
+# cache of the alexa signing certificates - only the per-request signature check stays on the hot path
+#
+# the checks only use pyOpenSSL calls that exist from the version flask-ask pins (17.0.0) onwards:
+# the trust store is built with add_cert rather than load_locations and a chain argument
+###
+
+import os
+import ssl
+import time
+import calendar
+import functools
+import posixpath
+import threading
+import collections
+from urllib.parse import urlparse
+from urllib.request import urlopen
+
+try:
+    from flask_ask.verifier import VerificationError
+except ImportError: # the offline tools and tests run without flask-ask
+    class VerificationError(Exception):
+        pass
+
+SIGNING_CERTIFICATE_NAME = "echo-api.amazon.com"
+
+
+# split a pem bundle into its certificates, the signing certificate comes first
+def split_pem_chain(pem_data):
+    marker = b"-----END CERTIFICATE-----"
+    return [part[part.index(b"-----BEGIN CERTIFICATE-----"):].strip() + b"\n" + marker + b"\n"
+            for part in pem_data.split(marker) if b"-----BEGIN CERTIFICATE-----" in part]
+
+
+# https://s3.amazonaws.com(:443)/echo.api/..., the rules of the alexa skills kit documentation
+def valid_certificate_url(cert_url):
+    url = urlparse(cert_url)
+    if url.scheme.lower() != "https" or (url.hostname or "").lower() != "s3.amazonaws.com":
+        return False
+    if url.port not in (None, 443):
+        return False
+    return posixpath.normpath(url.path).startswith("/echo.api/")
+
+
+def asn1_time(value):
+    return calendar.timegm(time.strptime(value.decode("ascii"), "%Y%m%d%H%M%SZ"))
+
+def subject_alt_names(cert):
+    if hasattr(cert, "to_cryptography"): # pyOpenSSL 17.1 onwards, get_extension is gone from newer versions
+        from cryptography import x509
+        try:
+            extension = cert.to_cryptography().extensions.get_extension_for_class(x509.SubjectAlternativeName)
+        except x509.ExtensionNotFound:
+            return []
+        return extension.value.get_values_for_type(x509.DNSName)
+    names = []
+    for index in range(cert.get_extension_count()):
+        extension = cert.get_extension(index)
+        if extension.get_short_name() == b"subjectAltName":
+            names.extend(name.strip()[4:] for name in str(extension).split(",") if name.strip().startswith("DNS:"))
+    return names
+
+def valid_certificate(cert, now=None):
+    now = time.time() if now is None else now
+    if not asn1_time(cert.get_notBefore()) <= now <= asn1_time(cert.get_notAfter()):
+        return False
+    return SIGNING_CERTIFICATE_NAME in subject_alt_names(cert)
+
+
+# the bundle of trusted roots - certifi if it is installed, otherwise the system bundle
+def default_ca_file():
+    try:
+        import certifi
+        return certifi.where()
+    except ImportError:
+        paths = ssl.get_default_verify_paths()
+        return paths.cafile or paths.openssl_cafile
+
+@functools.lru_cache(maxsize=4)
+def trusted_roots(ca_file):
+    from OpenSSL import crypto
+    if not ca_file or not os.path.isfile(ca_file):
+        return ()
+    with open(ca_file, "rb") as f:
+        return tuple(crypto.load_certificate(crypto.FILETYPE_PEM, part) for part in split_pem_chain(f.read()))
+
+def trust_store(ca_file, intermediates):
+    from OpenSSL import crypto
+    store = crypto.X509Store()
+    roots = trusted_roots(ca_file or default_ca_file())
+    if not roots and hasattr(store, "set_default_paths"):
+        store.set_default_paths()
+    # every certificate of the store is a trust anchor if it is self-signed, so a downloaded self-signed
+    # certificate is never added - the intermediates only help to build the path to one of the roots
+    intermediates = tuple(cert for cert in intermediates if cert.get_issuer() != cert.get_subject())
+    for cert in roots + intermediates:
+        try:
+            store.add_cert(cert)
+        except crypto.Error: # already in the store
+            pass
+    return store
+
+
+# download, parse and validate a certificate chain, returns (signing certificate, expiry timestamp)
+def fetch_certificate(cert_url, opener=urlopen, ca_file=None):
+    from OpenSSL import crypto
+
+    if not valid_certificate_url(cert_url):
+        raise VerificationError("Certificate URL verification failed")
+    with opener(cert_url) as response:
+        pem_data = response.read()
+    chain = [crypto.load_certificate(crypto.FILETYPE_PEM, part) for part in split_pem_chain(pem_data)]
+    if not chain:
+        raise VerificationError("Certificate verification failed")
+    cert = chain[0]
+    if not valid_certificate(cert): # validity dates and the echo-api.amazon.com name
+        raise VerificationError("Certificate verification failed")
+
+    # the chain must lead from the signing certificate to a trusted root
+    try:
+        crypto.X509StoreContext(trust_store(ca_file, chain[1:]), cert).verify_certificate()
+    except crypto.X509StoreContextError:
+        raise VerificationError("Certificate chain verification failed")
+
+    not_after = min(asn1_time(c.get_notAfter()) for c in chain)
+    return cert, not_after
+
+
+# bounded lru of validated certificates keyed by url, an entry expires after ttl or with its certificate
+class CertificateCache:
+    def __init__(self, max_size=16, ttl=3600, fetch=fetch_certificate):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.fetch = fetch
+        self.entries = collections.OrderedDict() # url -> (certificate, expires)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # drop-in for flask_ask.verifier.load_certificate
+    def get(self, cert_url):
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(cert_url)
+            if entry is not None and entry[1] > now:
+                self.entries.move_to_end(cert_url)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        # failures are not cached, the next request tries again
+        cert, not_after = self.fetch(cert_url)
+        with self.lock:
+            self.entries[cert_url] = (cert, min(now + self.ttl, not_after))
+            self.entries.move_to_end(cert_url)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return cert
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
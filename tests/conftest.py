@@ -0,0 +1,67 @@
+import os
+import sys
+import json
+
+import pytest
+
+# the modules live at the top of the repository
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+# one alexa session of a device, the session attributes of a response are sent with the next request
+class AlexaSession:
+    def __init__(self, client, device_id="device-1", session_id="session-1", locale="en-GB"):
+        self.client = client
+        self.device_id = device_id
+        self.session_id = session_id
+        self.locale = locale
+        self.attributes = {}
+        self.new = True
+
+    def send(self, intent_name=None, slots=None, request_type="IntentRequest"):
+        request = {"type": request_type, "requestId": "request-1", "timestamp": "2026-10-19T10:00:00Z",
+                   "locale": self.locale}
+        if request_type == "IntentRequest":
+            request["intent"] = {"name": intent_name,
+                                 "slots": {name: {"name": name, "value": value} for name, value in (slots or {}).items()}}
+        system = {"device": {"deviceId": self.device_id}, "application": {"applicationId": "skill"},
+                  "user": {"userId": "user-1"}}
+        body = {"version": "1.0", "context": {"System": system}, "request": request,
+                "session": {"new": self.new, "sessionId": self.session_id, "application": {"applicationId": "skill"},
+                            "attributes": self.attributes, "user": {"userId": "user-1"}}}
+        self.new = False
+        response = self.client.post("/", data=json.dumps(body), content_type="application/json")
+        try:
+            assert response.status_code == 200, response.get_data(as_text=True)
+            data = json.loads(response.get_data(as_text=True))
+        finally:
+            response.close()
+        self.attributes = data.get("sessionAttributes", self.attributes)
+        return data
+
+    def speech(self, data):
+        return data["response"]["outputSpeech"]["text"]
+
+
+# the skill on the in-memory store, the tables are emptied for every test
+@pytest.fixture
+def teachme():
+    pytest.importorskip("flask_ask")
+    os.environ.setdefault("TEACHME_STORE", "local")
+    os.environ.setdefault("TEACHME_STATE_SECRET", "test-secret")
+    os.environ.setdefault("TEACHME_WARM_UP", "0")
+    os.environ.setdefault("TEACHME_CAPACITY_SUMMARY_INTERVAL", "0")
+    os.environ.setdefault("TEACHME_LOCALE_DIR", os.path.join(ROOT, "locales"))
+    import teachme_learn_v1
+    teachme_learn_v1.app.config["ASK_VERIFY_REQUESTS"] = False
+    teachme_learn_v1.table.items.clear()
+    if teachme_learn_v1.legacy_table is not None:
+        teachme_learn_v1.legacy_table.items.clear()
+    return teachme_learn_v1
+
+
+@pytest.fixture
+def alexa(teachme):
+    return lambda device_id="device-1", session_id="session-1", locale="en-GB": AlexaSession(
+        teachme.app.test_client(), device_id, session_id, locale)
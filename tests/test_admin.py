@@ -0,0 +1,135 @@
+import os
+
+import pytest
+from botocore.exceptions import ClientError
+
+import teachme_admin
+from teachme_admin import batches, migrate_mode, move_progress, run_batches, scan_items, seed_requests, write_batch
+from teachme_corpus import Corpus
+from teachme_local_store import LocalTable
+from teachme_state_codec import decode_item, encode_item, DEFAULT_MAIN_COURSE
+
+LOCALE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "locales", "en-GB")
+
+
+def put(device_id, corpus_name="restaurant_corpus", intent_id="1"):
+    state = {"corpus_name": corpus_name, "intent_id": intent_id, "mode_name": "keywords"}
+    return {"PutRequest": {"Item": encode_item(device_id, state)}}
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(teachme_admin.time, "sleep", lambda seconds: None)
+
+
+# a stand-in for the dynamodb resource, fails the batches containing a poisoned device
+class FakeDynamoDB:
+    def __init__(self, unprocessed_rounds=0, poisoned=None):
+        self.unprocessed_rounds = unprocessed_rounds
+        self.poisoned = poisoned
+        self.written = []
+
+    def batch_write_item(self, RequestItems):
+        (table_name, requests), = RequestItems.items()
+        keys = [teachme_admin.request_key(request) for request in requests]
+        assert len(set(keys)) == len(keys), "duplicate key in a batch"
+        if any(key[0] == self.poisoned for key in keys):
+            raise ClientError({"Error": {"Code": "ValidationException", "Message": "bad item"}}, "BatchWriteItem")
+        if self.unprocessed_rounds:
+            self.unprocessed_rounds -= 1
+            self.written.extend(requests[1:])
+            return {"UnprocessedItems": {table_name: requests[:1]}}
+        self.written.extend(requests)
+        return {}
+
+
+def test_batches_merge_writes_of_the_same_key():
+    requests = [put("a", intent_id="1"), put("b"), put("a", intent_id="2")]
+    assert list(batches(requests, 25)) == [[put("a", intent_id="2"), put("b")]]
+    # a batch is full when it has 25 distinct keys
+    requests = [put("device-{}".format(i % 30)) for i in range(60)]
+    sizes = [len(batch) for batch in batches(requests, 25)]
+    assert sizes == [25, 25, 10]
+
+
+def test_unprocessed_items_are_retried():
+    dynamodb = FakeDynamoDB(unprocessed_rounds=2)
+    requests = [put("device-{}".format(i)) for i in range(5)]
+    assert write_batch(dynamodb, "table", requests) == (5, 0)
+    assert sorted(r["PutRequest"]["Item"]["device_id"] for r in dynamodb.written) == ["device-{}".format(i)
+                                                                                      for i in range(5)]
+
+
+def test_exhausted_retries_are_reported_not_raised():
+    dynamodb = FakeDynamoDB(unprocessed_rounds=100)
+    assert write_batch(dynamodb, "table", [put("a"), put("b")], max_retries=2) == (1, 1)
+
+
+def test_failed_batch_is_skipped():
+    dynamodb = FakeDynamoDB(poisoned="device-3")
+    requests = [put("device-{}".format(i)) for i in range(60)]
+    progress = run_batches(dynamodb, "table", requests, workers=2)
+    assert progress.failed == 25
+    assert progress.done == len(dynamodb.written) == 35
+
+
+def test_migrate_mode_only_changes_the_mode():
+    table = LocalTable("device_id", "scenario")
+    table.put_item(Item=dict(encode_item("compact", {"corpus_name": "restaurant_corpus", "intent_id": "3",
+                                                      "mode_name": "sentence"}), mc="soup"))
+    table.put_item(Item={"device_id": "legacy", "scenario": "restaurant_corpus", "intent_id": "2",
+                         "corpus_name": "restaurant_corpus", "mode_name": "sentence"})
+    items = list(scan_items(table, {"mode_name": "sentence"}))
+    assert len(items) == 2
+    assert [migrate_mode(table, item, "keywords") for item in items] == [(1, 0), (1, 0)]
+    for item in table.scan()["Items"]:
+        state = decode_item(item)
+        assert state["mode_name"] == "keywords"
+    assert decode_item(table.get_item(Key={"device_id": "compact", "scenario": "restaurant_corpus"})["Item"]) == {
+        "corpus_name": "restaurant_corpus", "intent_id": "3", "mode_name": "keywords", "main_course_name": "soup"}
+
+
+def test_migrate_mode_skips_items_changed_since_the_scan():
+    table = LocalTable("device_id", "scenario")
+    table.put_item(Item=encode_item("device", {"corpus_name": "restaurant_corpus", "intent_id": "3",
+                                                "mode_name": "sentence"}))
+    item, = scan_items(table, {"mode_name": "sentence"})
+    table.update_item(Key={"device_id": "device", "scenario": "restaurant_corpus"}, UpdateExpression="set m = :m",
+                      ExpressionAttributeValues={":m": 1})
+    assert migrate_mode(table, item, "full") == (0, 0)
+    assert decode_item(table.get_item(Key={"device_id": "device", "scenario": "restaurant_corpus"})["Item"])[
+        "mode_name"] == "keywords"
+
+
+def test_seeded_restaurant_progress_has_a_main_course():
+    corpus = Corpus(os.path.join(LOCALE, "restaurant_corpus"))
+    request, = seed_requests(["device"], corpus, 5, "keywords")
+    assert decode_item(request["PutRequest"]["Item"]) == {"corpus_name": "restaurant_corpus", "intent_id": "5",
+                                                          "mode_name": "keywords",
+                                                          "main_course_name": DEFAULT_MAIN_COURSE}
+    corpus = Corpus(os.path.join(LOCALE, "symptom_corpus"))
+    request, = seed_requests(["device"], corpus, 2, "keywords")
+    assert "mc" not in request["PutRequest"]["Item"]
+
+
+def test_reset_without_a_filter_needs_all(capsys):
+    with pytest.raises(SystemExit):
+        teachme_admin.main(["reset"])
+    assert "--all" in capsys.readouterr().err
+
+
+def test_move_progress_keeps_newer_progress():
+    table = LocalTable("device_id", "scenario")
+    legacy_table = LocalTable("device_id")
+    legacy_table.put_item(Item={"device_id": "old", "intent_id": "2", "intent_name": "third_restaurant_intent",
+                                "corpus_name": "restaurant_corpus", "mode_name": "sentence"})
+    legacy_table.put_item(Item={"device_id": "active", "v": 2, "c": 1, "i": 1, "m": 1})
+    table.put_item(Item=encode_item("active", {"corpus_name": "restaurant_corpus", "intent_id": "6",
+                                               "mode_name": "keywords"}))
+    results = [move_progress(table, legacy_table, item) for item in list(scan_items(legacy_table, {}))]
+    assert sorted(results) == [(0, 0), (1, 0)]
+    assert decode_item(table.get_item(Key={"device_id": "old", "scenario": "restaurant_corpus"})["Item"]) == {
+        "corpus_name": "restaurant_corpus", "intent_id": "2", "mode_name": "sentence"}
+    assert decode_item(table.get_item(Key={"device_id": "active", "scenario": "restaurant_corpus"})["Item"])[
+        "intent_id"] == "6"
+    assert legacy_table.items == {}
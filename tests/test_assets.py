@@ -0,0 +1,136 @@
+import io
+import json
+
+import pytest
+
+PIL = pytest.importorskip("PIL")
+from PIL import Image
+from botocore.stub import Stubber, ANY
+
+import teachme_assets
+from teachme_assets import (DirectoryTarget, S3Target, build_manifest, corpus_image_urls, hashed_name,
+                            render_variant)
+from teachme_corpus import Corpus
+
+CORPUS = """Meta:: 0, start_restaurant_intent, restaurant_corpus
+Y:: Order food
+A:: May I take your order now?
+C:: You could say:\\n(Yes).
+Context:: In a restaurant.
+Img_url:: https://images.example.com/cards/waiter.jpg
+
+Meta:: 1, second_restaurant_intent, restaurant_corpus
+Y:: Yes.
+A:: Here you are.
+C:: You could say:\\n(Thank you).
+Context:: The food arrives.
+Img_url:: https://images.example.com/cards/soup.png
+"""
+URLS = ["https://images.example.com/cards/soup.png", "https://images.example.com/cards/waiter.jpg"]
+
+
+def image_bytes(image_format, size=(2000, 1000)):
+    output = io.BytesIO()
+    Image.new("RGB", size, (200, 120, 40)).save(output, image_format)
+    return output.getvalue()
+
+
+# the images as local copies, so nothing is downloaded
+@pytest.fixture
+def source_dir(tmp_path):
+    directory = tmp_path / "images"
+    directory.mkdir()
+    (directory / "waiter.jpg").write_bytes(image_bytes("JPEG"))
+    (directory / "soup.png").write_bytes(image_bytes("PNG"))
+    return str(directory)
+
+
+@pytest.fixture
+def locale_dir(tmp_path):
+    directory = tmp_path / "locales" / "en-GB"
+    directory.mkdir(parents=True)
+    (directory / "restaurant_corpus").write_text(CORPUS)
+    (directory / "strings.json").write_text("{}")
+    return str(tmp_path / "locales")
+
+
+class CountingTarget(DirectoryTarget):
+    def __init__(self, output_dir, base_url):
+        super().__init__(output_dir, base_url)
+        self.puts = 0
+
+    def put(self, name, data, content_type):
+        self.puts += 1
+        return super().put(name, data, content_type)
+
+
+def test_corpus_image_urls(locale_dir):
+    assert corpus_image_urls(locale_dir) == URLS
+
+
+def test_variants_fit_and_keep_the_format():
+    for image_format in ["JPEG", "PNG"]:
+        for variant, size in teachme_assets.VARIANTS.items():
+            data, rendered_format = render_variant(image_bytes(image_format), size)
+            assert rendered_format == image_format
+            width, height = Image.open(io.BytesIO(data)).size
+            assert width <= size[0] and height <= size[1]
+    # never scaled up
+    data, _ = render_variant(image_bytes("JPEG", (100, 50)), teachme_assets.VARIANTS["large"])
+    assert Image.open(io.BytesIO(data)).size == (100, 50)
+
+
+def test_manifest_in_a_directory(tmp_path, locale_dir, source_dir):
+    target = CountingTarget(str(tmp_path / "out"), "http://localhost:8080/")
+    manifest_path = str(tmp_path / "assets.json")
+    images = build_manifest(corpus_image_urls(locale_dir), target, manifest_path, source_dir, workers=2)
+    assert sorted(images) == URLS
+    assert target.puts == 2 * len(teachme_assets.VARIANTS)
+    for url, entry in images.items():
+        for variant in teachme_assets.VARIANTS:
+            name = entry[variant][len("http://localhost:8080/"):]
+            assert (tmp_path / "out" / name).is_file()
+            assert name.endswith(".png" if url.endswith(".png") else ".jpg")
+
+    # the corpus sends the variants
+    corpus = Corpus(locale_dir + "/en-GB/restaurant_corpus", images)
+    assert corpus.get_data("1")["small_img_url"] == images[URLS[0]]["small"]
+    assert corpus.get_data("1")["large_img_url"] == images[URLS[0]]["large"]
+
+
+def test_unchanged_images_are_reused(tmp_path, locale_dir, source_dir, monkeypatch):
+    manifest_path = str(tmp_path / "assets.json")
+    urls = corpus_image_urls(locale_dir)
+    first = build_manifest(urls, CountingTarget(str(tmp_path / "out"), ""), manifest_path, source_dir)
+
+    target = CountingTarget(str(tmp_path / "out"), "")
+    assert build_manifest(urls, target, manifest_path, source_dir) == first
+    assert target.puts == 0
+
+    # a changed image is rendered again
+    (tmp_path / "images" / "soup.png").write_bytes(image_bytes("PNG", (1500, 1500)))
+    second = build_manifest(urls, target, manifest_path, source_dir)
+    assert target.puts == len(teachme_assets.VARIANTS)
+    assert second[URLS[1]] == first[URLS[1]] and second[URLS[0]] != first[URLS[0]]
+
+    # so is every image when the variant sizes change
+    monkeypatch.setitem(teachme_assets.VARIANTS, "small", (360, 240))
+    target.puts = 0
+    build_manifest(urls, target, manifest_path, source_dir)
+    assert target.puts == 2 * len(teachme_assets.VARIANTS)
+    with open(manifest_path) as f:
+        assert json.load(f)["variants"]["small"] == [360, 240]
+
+
+# an s3-compatible stand-in, the requests are checked instead of sent
+def test_s3_target(source_dir):
+    target = S3Target("bucket", "cards/", None, endpoint_url="http://localhost:9000")
+    data, image_format = render_variant(image_bytes("JPEG"), teachme_assets.VARIANTS["small"])
+    name = hashed_name(URLS[1], "small", data, image_format)
+    with Stubber(target.client) as stubber:
+        stubber.add_response("put_object", {}, {"Bucket": "bucket", "Key": "cards/" + name, "Body": data,
+                                                "ContentType": "image/jpeg", "CacheControl": ANY})
+        url = target.put(name, data, "image/jpeg")
+        stubber.assert_no_pending_responses()
+    assert url == "http://localhost:9000/bucket/cards/" + name
+    assert name.startswith("waiter-small-") and name.endswith(".jpg")
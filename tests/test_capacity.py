@@ -0,0 +1,82 @@
+from teachme_capacity import CapacityAccounting, device_cohort
+
+
+def test_units_are_summed_per_intent_corpus_and_cohort():
+    capacity = CapacityAccounting(window_seconds=60, cohorts=4)
+    capacity.add("second_restaurant_intent", "restaurant_corpus", "device-1", 0.5, 1.0, now=0)
+    capacity.add("second_restaurant_intent", "restaurant_corpus", "device-2", 0.5, 0.0, now=10)
+    capacity.add("LaunchRequest", None, "device-1", 2.0, 0.0, now=20)
+    snapshot = capacity.snapshot()
+    assert (snapshot["requests"], snapshot["read_units"], snapshot["write_units"]) == (3, 3.0, 1.0)
+    assert snapshot["by_intent"]["second_restaurant_intent"] == {"read_units": 1.0, "write_units": 1.0,
+                                                                  "requests": 2, "units_per_request": 1.0}
+    assert snapshot["by_corpus"]["-"]["read_units"] == 2.0 # requests without a corpus
+    cohort = str(device_cohort("device-1", 4))
+    assert snapshot["by_cohort"][cohort]["requests"] >= 2
+    assert sum(row["requests"] for row in snapshot["by_cohort"].values()) == 3
+
+
+def test_cohorts_are_stable_and_bounded():
+    assert device_cohort("device-1", 16) == device_cohort("device-1", 16)
+    assert {device_cohort("device-{}".format(index), 16) for index in range(1000)} == set(range(16))
+
+
+def test_windows_are_kept_for_the_most_recent_ones():
+    capacity = CapacityAccounting(window_seconds=60, windows=3)
+    for minute in range(5):
+        capacity.add("intent", None, "device", 1.0, 0.0, now=minute * 60 + 30)
+    capacity.add("intent", None, "device", 1.0, 0.0, now=4 * 60 + 59)
+    by_window = capacity.snapshot()["by_window"]
+    assert list(by_window) == ["120", "180", "240"]
+    assert by_window["240"]["requests"] == 2
+    # the totals keep every request
+    assert capacity.snapshot()["requests"] == 6
+
+
+def test_summary_lists_the_most_expensive_intents():
+    capacity = CapacityAccounting()
+    for index, intent_name in enumerate(["a", "b", "c", "d"]):
+        capacity.add(intent_name, None, "device", float(index), 1.0, now=0)
+    summary = capacity.summary(limit=2)
+    assert summary["top_intents"] == {"d": 4.0, "c": 3.0}
+    assert (summary["requests"], summary["read_units"], summary["write_units"]) == (4, 6.0, 4.0)
+
+
+def test_clear_intent_deletes_are_accounted(teachme, alexa, monkeypatch):
+    monkeypatch.setattr(teachme, "capacity", CapacityAccounting())
+    batch_write_item = teachme.dynamodb.batch_write_item
+
+    def consumed_batch_write_item(RequestItems, **kwargs):
+        assert kwargs["ReturnConsumedCapacity"] == "TOTAL"
+        batch_write_item(RequestItems)
+        return {"UnprocessedItems": {}, "ConsumedCapacity": [
+            {"TableName": name, "CapacityUnits": float(len(requests))} for name, requests in RequestItems.items()]}
+
+    monkeypatch.setattr(teachme.dynamodb, "batch_write_item", consumed_batch_write_item)
+    session = alexa()
+    session.send("start_restaurant_intent", {"mode_name": "keywords"})
+    session.send("start_symptom_intent", {"mode_name": "keywords"})
+    session.send("clear_intent")
+    assert teachme.table.items == {}
+    assert teachme.capacity.snapshot()["by_intent"]["clear_intent"]["write_units"] == 2.0
+
+
+def test_unprocessed_deletes_are_sent_again(teachme, monkeypatch):
+    monkeypatch.setattr(teachme.time, "sleep", lambda seconds: None)
+    for corpus_name in ["restaurant_corpus", "symptom_corpus"]:
+        teachme.table.put_item(Item={"device_id": "device-1", "scenario": corpus_name})
+    batch_write_item = teachme.dynamodb.batch_write_item
+    sent = []
+
+    # processes the first request of every call
+    def slow_batch_write_item(RequestItems, **kwargs):
+        (name, requests), = RequestItems.items()
+        sent.append(len(requests))
+        batch_write_item({name: requests[:1]})
+        return {"UnprocessedItems": {name: requests[1:]} if len(requests) > 1 else {}}
+
+    monkeypatch.setattr(teachme.dynamodb, "batch_write_item", slow_batch_write_item)
+    with teachme.app.test_request_context():
+        teachme.delete_items("device-1", ["restaurant_corpus", "symptom_corpus"])
+    assert sent == [2, 1]
+    assert teachme.table.items == {}
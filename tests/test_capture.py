@@ -0,0 +1,104 @@
+import io
+import json
+
+import pytest
+
+pytest.importorskip("werkzeug")
+from teachme_capture import CaptureMiddleware, anonymize
+
+SECRET = b"secret"
+
+
+def skill_request(slots=None):
+    return {"session": {"sessionId": "session-1", "user": {"userId": "user-1", "accessToken": "token"}},
+            "context": {"System": {"device": {"deviceId": "device-1"}, "apiAccessToken": "api-token"}},
+            "request": {"type": "IntentRequest", "requestId": "request-1",
+                        "intent": {"name": "practise_intent", "slots": slots or {}}}}
+
+
+def test_ids_are_pseudonymised_and_tokens_dropped():
+    captured = anonymize(skill_request(), SECRET)
+    assert captured["session"]["sessionId"].startswith("anon.")
+    assert captured["context"]["System"]["device"]["deviceId"] == anonymize(skill_request(), SECRET)["context"][
+        "System"]["device"]["deviceId"]
+    assert "accessToken" not in captured["session"]["user"]
+    assert "apiAccessToken" not in captured["context"]["System"]
+    assert "user-1" not in json.dumps(captured)
+
+
+def test_free_text_slots_are_pseudonymised():
+    slots = {"scenario_query": {"name": "scenario_query", "value": "my friend Alice's birthday dinner",
+                                "resolutions": {"resolutionsPerAuthority": [{"values": ["Alice"]}]}},
+             "mode_name": {"name": "mode_name", "value": "keywords"}}
+    captured = anonymize(skill_request(slots), SECRET)["request"]["intent"]["slots"]
+    assert captured["scenario_query"]["value"].startswith("anon.")
+    assert "resolutions" not in captured["scenario_query"]
+    assert "Alice" not in json.dumps(captured)
+    assert captured["mode_name"]["value"] == "keywords"
+
+
+class Writer:
+    def __init__(self):
+        self.records = []
+
+    def record(self, arrived, elapsed, status, body):
+        self.records.append((status, body))
+
+
+class App:
+    def __init__(self):
+        self.bodies = []
+        self.closed = False
+
+    def __call__(self, environ, start_response):
+        self.bodies.append(environ["wsgi.input"].read(int(environ.get("CONTENT_LENGTH") or 0)))
+        start_response("200 OK", [("Content-Type", "application/json")])
+        return self
+
+    def __iter__(self):
+        yield b"{}"
+
+    def close(self):
+        self.closed = True
+
+
+def call(middleware, body, **environ):
+    environ = dict({"REQUEST_METHOD": "POST", "PATH_INFO": "/", "wsgi.input": io.BytesIO(body)}, **environ)
+    response = middleware(environ, lambda status, headers, exc_info=None: None)
+    data = b"".join(response)
+    response.close()
+    return data
+
+
+def test_body_with_content_length():
+    app, writer = App(), Writer()
+    body = json.dumps(skill_request()).encode()
+    assert call(CaptureMiddleware(app, writer), body, CONTENT_LENGTH=str(len(body))) == b"{}"
+    assert app.bodies == [body]
+    assert writer.records == [(200, body)]
+    assert app.closed
+
+
+def test_chunked_body_is_read_to_the_end():
+    app, writer = App(), Writer()
+    body = json.dumps(skill_request()).encode()
+    call(CaptureMiddleware(app, writer), body, **{"wsgi.input_terminated": True, "HTTP_TRANSFER_ENCODING": "chunked"})
+    assert app.bodies == [body]
+    assert writer.records == [(200, body)]
+
+
+def test_recorded_when_the_response_is_closed():
+    app, writer = App(), Writer()
+    body = b"{}"
+    response = CaptureMiddleware(app, writer)({"REQUEST_METHOD": "POST", "PATH_INFO": "/", "CONTENT_LENGTH": "2",
+                                               "wsgi.input": io.BytesIO(body)}, lambda *args: None)
+    assert writer.records == []
+    list(response)
+    response.close()
+    assert writer.records == [(200, body)] and app.closed
+
+
+def test_other_requests_pass_through():
+    app, writer = App(), Writer()
+    call(CaptureMiddleware(app, writer), b"", REQUEST_METHOD="GET", PATH_INFO="/ready")
+    assert writer.records == []
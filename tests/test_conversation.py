@@ -0,0 +1,122 @@
+import pytest
+
+from teachme_scheduler import Schedule
+from teachme_state_codec import SCHEDULE_SCENARIO
+
+STATE_MODES = ["session", "dynamodb"]
+
+
+@pytest.fixture(params=STATE_MODES)
+def state_mode(request, teachme, monkeypatch):
+    monkeypatch.setattr(teachme, "STATE_MODE", request.param)
+    return request.param
+
+
+# the progress items of a device, by scenario
+def stored_items(teachme, device_id="device-1"):
+    return {key[1]: item for key, item in teachme.table.items.items()
+            if key[0] == device_id and key[1] != SCHEDULE_SCENARIO}
+
+
+def test_main_course_is_saved_with_the_state(teachme, alexa, state_mode):
+    session = alexa()
+    for intent_name in ["start_restaurant_intent", "second_restaurant_intent", "third_restaurant_intent",
+                        "fourth_restaurant_intent"]:
+        session.send(intent_name, {"mode_name": "keywords"} if intent_name.startswith("start") else None)
+    session.send("fifth_restaurant_intent", {"food_name": "the rib eye"})
+    session.send("AMAZON.StopIntent")
+    item = stored_items(teachme)["restaurant_corpus"]
+    assert (item["i"], item["mc"]) == (4, "rib eye steak")
+
+
+# an intent of a scenario without progress does not start it, and must not leave an item behind
+def test_out_of_order_intent_without_progress(teachme, alexa, state_mode):
+    session = alexa()
+    data = session.send("fifth_restaurant_intent", {"food_name": "the rib eye"})
+    assert data["response"]["shouldEndSession"] is False
+    session.send("AMAZON.StopIntent")
+    session.send(request_type="SessionEndedRequest")
+    assert stored_items(teachme) == {}
+
+    # the next session still launches, and the scenario starts from its first step
+    session = alexa(session_id="session-2")
+    session.send(request_type="LaunchRequest")
+    session.send("start_restaurant_intent", {"mode_name": "keywords"})
+    session.send("second_restaurant_intent")
+    session.send("AMAZON.StopIntent")
+    assert stored_items(teachme)["restaurant_corpus"]["i"] == 1
+
+
+def test_out_of_order_intent_of_another_scenario(teachme, alexa, state_mode):
+    session = alexa()
+    session.send("start_symptom_intent", {"mode_name": "keywords"})
+    session.send("second_symptom_intent")
+    session.send("fifth_restaurant_intent", {"food_name": "soup"})
+    session.send("eighth_restaurant_intent")
+    session.send("AMAZON.StopIntent")
+    items = stored_items(teachme)
+    assert list(items) == ["symptom_corpus"]
+    assert items["symptom_corpus"]["i"] == 1 and "mc" not in items["symptom_corpus"]
+
+
+# counts the calls of the table, per method
+def count_calls(monkeypatch, table):
+    calls = []
+    for name in ["get_item", "query", "put_item", "update_item", "delete_item"]:
+        method = getattr(table, name)
+        monkeypatch.setattr(table, name, lambda *args, name=name, method=method, **kwargs: calls.append(name) or
+                            method(*args, **kwargs))
+    return calls
+
+
+def test_launch_reads_progress_and_schedule_with_one_query(teachme, alexa, state_mode, monkeypatch):
+    schedule = Schedule()
+    schedule.record("symptom_corpus", 2, False, now=0)
+    teachme.save_schedule("device-1", schedule)
+    session = alexa()
+    session.send("start_restaurant_intent", {"mode_name": "keywords"})
+    session.send("AMAZON.StopIntent")
+
+    calls = count_calls(monkeypatch, teachme.table)
+    legacy_calls = count_calls(monkeypatch, teachme.legacy_table)
+    data = alexa(session_id="session-2").send(request_type="LaunchRequest")
+    assert calls == ["query"] and legacy_calls == []
+    speech = data["response"]["outputSpeech"]["text"]
+    assert "Restaurant" in speech and "due for practice" in speech
+
+
+def test_clear_keeps_the_schedule(teachme, alexa, state_mode):
+    teachme.save_schedule("device-1", Schedule())
+    session = alexa()
+    session.send("start_restaurant_intent", {"mode_name": "keywords"})
+    session.send("start_symptom_intent", {"mode_name": "keywords"})
+    session.send("clear_intent")
+    assert list(teachme.table.items) == [("device-1", SCHEDULE_SCENARIO)]
+
+
+def test_legacy_progress_is_moved_on_first_read(teachme, alexa, state_mode):
+    teachme.legacy_table.put_item(Item={"device_id": "device-1", "v": 2, "c": 1, "i": 2, "m": 1})
+    data = alexa().send(request_type="LaunchRequest")
+    assert "Restaurant" in data["response"]["outputSpeech"]["text"]
+    assert teachme.legacy_table.items == {}
+    assert stored_items(teachme)["restaurant_corpus"]["i"] == 2
+
+    # the moved progress is continued, and once cleared it does not come back
+    session = alexa(session_id="session-2")
+    session.send("continue_intent")
+    session.send("fourth_restaurant_intent")
+    session.send("AMAZON.StopIntent")
+    assert stored_items(teachme)["restaurant_corpus"]["i"] == 3
+    session.send("clear_intent")
+    assert "Restaurant" not in alexa(session_id="session-3").send(request_type="LaunchRequest")["response"][
+        "outputSpeech"]["text"]
+
+
+def test_legacy_progress_is_moved_by_an_intent_of_its_scenario(teachme, alexa, state_mode):
+    teachme.legacy_table.put_item(Item={"device_id": "device-1", "intent_id": "1",
+                                        "intent_name": "second_symptom_intent", "corpus_name": "symptom_corpus"})
+    session = alexa()
+    session.send("third_symptom_intent")
+    session.send("AMAZON.StopIntent")
+    assert stored_items(teachme)["symptom_corpus"]["i"] == 2
+    assert teachme.legacy_table.items == {}
@@ -0,0 +1,82 @@
+import os
+
+import pytest
+
+import teachme_corpus
+from teachme_corpus import Corpus, CorpusError, iter_records, load_corpora
+
+LOCALE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "locales", "en-GB")
+
+
+def step_lines(step, intent_name="start_intent", corpus_name="tiny_corpus"):
+    return ["Meta:: {}, {}, {}".format(step, intent_name, corpus_name), "Y:: Sentence {}.".format(step),
+            "A:: Question?", "C:: You could say:\\n(keyword).", "Context:: Context.",
+            "Img_url:: https://example.com/{}.png".format(step)]
+
+
+def parse(lines):
+    return list(iter_records(line + "\n" for line in lines))
+
+
+def test_records_and_their_first_lines():
+    lines = [""] + step_lines(0) + ["", ""] + step_lines(1, "second_intent")
+    records = parse(lines)
+    assert [line_number for line_number, _ in records] == [2, 10]
+    assert records[1][1]["Meta"] == "1, second_intent, tiny_corpus"
+    assert records[0][1]["C"] == "You could say:\n(keyword)."
+
+
+@pytest.mark.parametrize("lines, line_number, message", [
+    # a field out of order, reported at its own line
+    (step_lines(0)[:2] + step_lines(0)[3:], 3, "expected a 'A::' line"),
+    # a line without a field name
+    (step_lines(0) + ["", "Meta 1, second_intent, tiny_corpus"], 8, "expected a 'Meta::' line"),
+    # a blank line inside a step
+    (step_lines(0)[:3] + [""] + step_lines(0)[3:], 4, "blank line inside the step starting at line 1"),
+    # a Meta line without the corpus name, reported at the first line of the step
+    ([""] + ["Meta:: 0, start_intent"] + step_lines(0)[1:], 2, "expected 'Meta:: <id>, <intent name>, <corpus name>'"),
+    # a step cut short at the end of the file, reported at the first line of the step
+    (step_lines(0) + [""] + step_lines(1)[:4], 8, "incomplete step, missing 'Context::'"),
+])
+def test_errors_name_the_line(lines, line_number, message):
+    with pytest.raises(CorpusError) as error:
+        parse(lines)
+    assert error.value.line_number == line_number
+    assert str(error.value) == "<corpus>:{}: {}".format(line_number, message)
+
+
+def test_corpus_error_names_the_file(tmp_path):
+    path = tmp_path / "broken_corpus"
+    path.write_text("\n".join(step_lines(0)[:5]))
+    with pytest.raises(CorpusError) as error:
+        Corpus(str(path))
+    assert error.value.corpus_filename == str(path)
+    assert str(error.value).startswith("{}:1: incomplete step".format(path))
+
+
+def test_load_corpora_in_a_process_pool(tmp_path):
+    serial = load_corpora(LOCALE, processes=1)
+    parallel = load_corpora(LOCALE, processes=2)
+    assert sorted(parallel) == sorted(serial) == ["restaurant_corpus", "symptom_corpus"]
+    for name, corpus in parallel.items():
+        assert corpus.data == serial[name].data
+        assert corpus.meta_data == serial[name].meta_data
+        assert corpus.intent_ids == serial[name].intent_ids
+
+
+# the error of a corpus parsed in a worker process reaches the caller with its file and line
+def test_load_corpora_error_from_a_worker(tmp_path):
+    (tmp_path / "good_corpus").write_text("\n".join(step_lines(0)) + "\n")
+    (tmp_path / "bad_corpus").write_text("\n".join(step_lines(0)[:3] + ["Context:: no card"]) + "\n")
+    (tmp_path / "strings.json").write_text("{}")
+    with pytest.raises(CorpusError) as error:
+        load_corpora(str(tmp_path), processes=2)
+    assert (error.value.line_number, error.value.message) == (4, "expected a 'C::' line")
+    assert error.value.corpus_filename == str(tmp_path / "bad_corpus")
+
+
+def test_main_reports_the_first_error(tmp_path, capsys, monkeypatch):
+    (tmp_path / "bad_corpus").write_text("Y:: no meta\n")
+    monkeypatch.setattr("sys.argv", ["teachme_corpus.py", str(tmp_path), "--processes", "1"])
+    assert teachme_corpus.main() == 1
+    assert capsys.readouterr().out.strip() == "{}:1: expected a 'Meta::' line".format(tmp_path / "bad_corpus")
@@ -0,0 +1,102 @@
+import os
+import gzip
+import json
+import base64
+
+import pytest
+from boto3.dynamodb.types import Binary
+
+from teachme_export import export_table
+from teachme_local_store import LocalTable
+
+
+def make_table(count):
+    table = LocalTable("device_id", "scenario")
+    for index in range(count):
+        table.put_item(Item={"device_id": "device-{:03d}".format(index), "scenario": "restaurant_corpus", "i": index})
+    return table
+
+
+def read_parts(output_dir):
+    items = []
+    for name in sorted(os.listdir(output_dir)):
+        if name.startswith("part-"):
+            with gzip.open(os.path.join(output_dir, name), "rt") as f:
+                items.extend(json.loads(line) for line in f)
+    return items
+
+
+# fails the scan after a number of pages, like a killed process
+class CrashingTable:
+    def __init__(self, table, pages):
+        self.table = table
+        self.pages = pages
+
+    def scan(self, **kwargs):
+        if self.pages == 0:
+            raise KeyboardInterrupt
+        self.pages -= 1
+        return self.table.scan(**kwargs)
+
+
+def test_export_writes_every_item_once(tmp_path):
+    table = make_table(57)
+    assert export_table(table, str(tmp_path), total_segments=3, workers=3, page_size=5, pages_per_file=2) == 57
+    assert sorted(item["i"] for item in read_parts(str(tmp_path))) == list(range(57))
+
+
+def test_interrupted_export_resumes_without_duplicates(tmp_path):
+    table = make_table(57)
+    with pytest.raises(KeyboardInterrupt):
+        export_table(CrashingTable(table, 5), str(tmp_path), total_segments=1, workers=1, page_size=4,
+                     pages_per_file=2)
+    # the unfinished file of the interrupted run and a stray part file are deleted on resume
+    assert any(name.endswith(".tmp") for name in os.listdir(str(tmp_path)))
+    open(os.path.join(str(tmp_path), "part-00000-000099.jsonl.gz"), "wb").close()
+
+    assert export_table(table, str(tmp_path), total_segments=1, workers=1, page_size=4, pages_per_file=2) == 57
+    names = os.listdir(str(tmp_path))
+    assert not any(name.endswith(".tmp") for name in names)
+    assert "part-00000-000099.jsonl.gz" not in names
+    assert sorted(item["i"] for item in read_parts(str(tmp_path))) == list(range(57))
+
+
+def test_finished_export_is_not_repeated(tmp_path):
+    table = make_table(10)
+    export_table(table, str(tmp_path), total_segments=2, workers=2, page_size=3)
+    table.put_item(Item={"device_id": "late", "scenario": "restaurant_corpus", "i": 99})
+    assert export_table(table, str(tmp_path), total_segments=2, workers=2, page_size=3) == 10
+    assert len(read_parts(str(tmp_path))) == 10
+
+
+# compact items only have the attributes of the fields with a value, legacy items have other ones
+def test_parquet_files_have_every_column(tmp_path):
+    pyarrow_parquet = pytest.importorskip("pyarrow.parquet")
+    table = LocalTable("device_id", "scenario")
+    table.put_item(Item={"device_id": "a", "scenario": "restaurant_corpus", "v": 3, "i": 4, "m": 1,
+                         "mc": "rib eye steak", "u": 1700000000})
+    table.put_item(Item={"device_id": "b", "scenario": "symptom_corpus", "v": 3, "i": 1})
+    table.put_item(Item={"device_id": "c", "scenario": "airport_corpus", "v": 3, "i": 2, "m": "full"})
+    table.put_item(Item={"device_id": "d", "scenario": "restaurant_corpus", "intent_id": "2",
+                         "intent_name": "third_restaurant_intent", "corpus_name": "restaurant_corpus",
+                         "mode_name": "sentence", "note": "legacy"})
+    assert export_table(table, str(tmp_path), total_segments=1, workers=1, output_format="parquet",
+                        page_size=1) == 4
+    names = sorted(name for name in os.listdir(str(tmp_path)) if name.startswith("part-"))
+    assert len(names) == 1
+    rows = sorted(pyarrow_parquet.read_table(os.path.join(str(tmp_path), names[0])).to_pylist(),
+                  key=lambda row: row["device_id"])
+    assert rows[0]["m"] == "1" and rows[0]["mc"] == "rib eye steak" and rows[0]["other"] is None
+    assert rows[1]["m"] is None and rows[1]["mc"] is None and rows[1]["i"] == 1
+    assert rows[2]["m"] == "full"
+    assert rows[3]["i"] is None and rows[3]["mode_name"] == "sentence"
+    assert json.loads(rows[3]["other"]) == {"note": "legacy"}
+
+
+def test_binary_attributes_are_base64(tmp_path):
+    table = make_table(0)
+    table.put_item(Item={"device_id": "a", "scenario": "#schedule", "corpora": "restaurant_corpus",
+                         "entries": Binary(b"\x00\x01"), "version": 1})
+    export_table(table, str(tmp_path), total_segments=1, workers=1)
+    item, = read_parts(str(tmp_path))
+    assert base64.b64decode(item["entries"]) == b"\x00\x01"
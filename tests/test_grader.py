@@ -0,0 +1,115 @@
+import os
+import math
+import random
+import collections
+
+import pytest
+
+np = pytest.importorskip("numpy")
+from teachme_corpus import Corpus, KEYWORD_PATTERN, corpus_filenames, tokenize
+from teachme_grader import Report, Targets, grade, lookup
+
+LOCALE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "locales", "en-GB")
+
+
+@pytest.fixture(scope="module")
+def corpora():
+    return [Corpus(filename) for filename in corpus_filenames(LOCALE)]
+
+
+@pytest.fixture(scope="module")
+def targets(corpora):
+    return Targets(corpora)
+
+
+# the scores of one utterance, computed the plain way
+def reference_scores(corpus, intent_id, utterance):
+    said = collections.Counter(tokenize(utterance))
+    expected = collections.Counter(tokenize(corpus.get_data(intent_id)["user_response"]))
+    norms = math.sqrt(sum(count ** 2 for count in said.values())) * math.sqrt(sum(count ** 2 for count in
+                                                                                  expected.values()))
+    similarity = sum(count * expected[token] for token, count in said.items()) / norms if norms else 0.0
+    previous_card = corpus.get_data(str(int(intent_id) - 1))["card_text"] if intent_id != "0" else ""
+    phrases = [tokenize(phrase) for phrase in KEYWORD_PATTERN.findall(previous_card)]
+    phrases = [phrase for phrase in phrases if phrase]
+    if not phrases:
+        return similarity, float("nan")
+    return similarity, sum(all(token in said for token in phrase) for phrase in phrases) / len(phrases)
+
+
+def turns(corpora):
+    rng = random.Random(42)
+    words = sorted(set(token for corpus in corpora for intent_id in corpus.data
+                       for token in tokenize(corpus.get_data(intent_id)["user_response"] + " " +
+                                             corpus.get_data(intent_id)["card_text"])))
+    for corpus in corpora:
+        for intent_id in sorted(corpus.data, key=int):
+            sentence = corpus.get_data(intent_id)["user_response"]
+            for utterance in [sentence, "", "xyzzy plugh", sentence + " " + sentence + " xyzzy",
+                              sentence.upper(), " ".join(rng.sample(words, 6)),
+                              " ".join(rng.choice(words + ["unknown", "words"]) for _ in range(12))]:
+                yield corpus, intent_id, utterance
+
+
+def test_grade_matches_the_plain_scores(corpora, targets):
+    cases = list(turns(corpora))
+    target_ids = [targets.index[(corpus.get_meta_data(intent_id)["corpus_name"], intent_id)]
+                  for corpus, intent_id, _ in cases]
+    similarity, recall = grade(targets, [utterance for _, _, utterance in cases], target_ids)
+    for row, (corpus, intent_id, utterance) in enumerate(cases):
+        expected_similarity, expected_recall = reference_scores(corpus, intent_id, utterance)
+        assert similarity[row] == pytest.approx(expected_similarity), utterance
+        if math.isnan(expected_recall): # step 0 has no card before it
+            assert math.isnan(recall[row]), utterance
+        else:
+            assert recall[row] == pytest.approx(expected_recall), utterance
+
+
+def test_grade_of_utterances_without_keywords_to_grade(corpora, targets):
+    # every target without keywords, only empty and unknown utterances
+    target_ids = [target for (corpus_name, intent_id), target in targets.index.items() if intent_id == "0"]
+    similarity, recall = grade(targets, ["", "xyzzy"], target_ids)
+    assert list(similarity) == [0.0, 0.0]
+    assert np.isnan(recall).all()
+
+
+def test_lookup():
+    keys = np.array([2, 5, 9])
+    assert list(lookup(keys, np.array([5, 1, 9, 10]), np.array([1.0, 2.0, 3.0]))) == [2.0, 0.0, 3.0, 0.0]
+    assert list(lookup(np.array([], dtype=np.int64), np.array([1, 2]), np.array([]))) == [0.0, 0.0]
+
+
+def test_report_averages_over_chunks(targets):
+    target = targets.index[("restaurant_corpus", "2")]
+    first = targets.index[("restaurant_corpus", "0")]
+    report = Report()
+    report.add(["a", "a"], np.array([target, first]), np.array([1.0, 0.5]), np.array([0.5, np.nan]))
+    report.add(["a", "b"], np.array([target, target]), np.array([0.0, 0.25]), np.array([1.0, 0.0]))
+    rows = {(row["cohort"], row["intent_id"]): row for row in report.rows(targets)}
+    assert rows[("a", "2")]["utterances"] == 2
+    assert rows[("a", "2")]["similarity"] == 0.5
+    assert rows[("a", "2")]["keyword_recall"] == 0.75
+    assert rows[("a", "0")]["keyword_recall"] == "" # no keywords to grade
+    assert rows[("b", "2")]["keyword_recall"] == 0.0
+
+
+def test_grade_of_a_step_after_a_card_without_keywords(tmp_path):
+    steps = [("start_intent", "start", "You could say:\nA (table) (for two)."),
+             ("second_intent", "A table for two.", "You could say: anything you like."),
+             ("third_intent", "Anything you like.", "This is the end of the conversation.")]
+    lines = []
+    for step, (intent_name, sentence, card) in enumerate(steps):
+        lines += ["Meta:: {}, {}, tiny_corpus".format(step, intent_name), "Y:: " + sentence, "A:: Question?",
+                  "C:: " + card.replace("\n", "\\n"), "Context:: Context.", "Img_url:: https://example.com/a.png", ""]
+    path = tmp_path / "tiny_corpus"
+    path.write_text("\n".join(lines))
+    corpus = Corpus(str(path))
+    targets = Targets([corpus])
+    utterances = ["a table for two please", "anything you like", "table"]
+    similarity, recall = grade(targets, utterances, [targets.index[("tiny_corpus", intent_id)]
+                                                     for intent_id in ["1", "2", "1"]])
+    for row, (utterance, intent_id) in enumerate(zip(utterances, ["1", "2", "1"])):
+        expected_similarity, expected_recall = reference_scores(corpus, intent_id, utterance)
+        assert similarity[row] == pytest.approx(expected_similarity)
+        assert recall[row] == pytest.approx(expected_recall, nan_ok=True)
+    assert np.isnan(recall[1]) and recall[0] == 1.0 and recall[2] == 0.5
@@ -0,0 +1,105 @@
+import pytest
+from boto3.dynamodb.conditions import Attr, Key
+from botocore.exceptions import ClientError
+
+from teachme_local_store import LocalDatabase, LocalTable, segment_of
+
+
+@pytest.fixture
+def table():
+    table = LocalTable("device_id", "scenario")
+    for device in range(10):
+        for scenario in ["restaurant_corpus", "symptom_corpus"]:
+            table.put_item(Item={"device_id": "device-{}".format(device), "scenario": scenario, "i": device})
+    return table
+
+
+def key(device, scenario="restaurant_corpus"):
+    return {"device_id": device, "scenario": scenario}
+
+
+def test_get_returns_copies(table):
+    item = table.get_item(Key=key("device-1"))["Item"]
+    item["i"] = 100
+    assert table.get_item(Key=key("device-1"))["Item"]["i"] == 1
+    assert table.get_item(Key=key("missing")) == {}
+
+
+def test_partition_key_only():
+    table = LocalTable("device_id")
+    table.put_item(Item={"device_id": "device", "entries": b"x"})
+    assert table.get_item(Key={"device_id": "device"})["Item"]["entries"] == b"x"
+    table.delete_item(Key={"device_id": "device"})
+    assert table.get_item(Key={"device_id": "device"}) == {}
+
+
+def test_update_set_and_remove(table):
+    table.update_item(Key=key("device-1"), UpdateExpression="set #a0 = :a0, m = :m remove #r0",
+                      ExpressionAttributeNames={"#a0": "v", "#r0": "i"}, ExpressionAttributeValues={":a0": 3, ":m": 1})
+    assert table.get_item(Key=key("device-1"))["Item"] == {"device_id": "device-1", "scenario": "restaurant_corpus",
+                                                           "v": 3, "m": 1}
+    # an update creates the item, a remove only needs no values
+    table.update_item(Key=key("new"), UpdateExpression="remove m")
+    assert table.get_item(Key=key("new"))["Item"] == key("new")
+    with pytest.raises(ValueError):
+        table.update_item(Key=key("new"), UpdateExpression="add i :one", ExpressionAttributeValues={":one": 1})
+
+
+def test_conditions(table):
+    condition = Attr("version").not_exists() | Attr("version").eq(1)
+    table.put_item(Item=dict(key("device-1"), version=1), ConditionExpression=condition)
+    table.put_item(Item=dict(key("device-1"), version=2), ConditionExpression=condition)
+    with pytest.raises(ClientError) as error:
+        table.put_item(Item=dict(key("device-1"), version=3), ConditionExpression=condition)
+    assert error.value.response["Error"]["Code"] == "ConditionalCheckFailedException"
+    with pytest.raises(ClientError):
+        table.update_item(Key=key("device-1"), UpdateExpression="set version = :v",
+                          ExpressionAttributeValues={":v": 5}, ConditionExpression=Attr("version").eq(1))
+    assert table.get_item(Key=key("device-1"))["Item"]["version"] == 2
+
+
+def test_query_pages_through_one_partition(table):
+    table.put_item(Item=key("device-1", "airport_corpus"))
+    scenarios = []
+    kwargs = {"KeyConditionExpression": Key("device_id").eq("device-1"), "Limit": 2}
+    while True:
+        response = table.query(**kwargs)
+        scenarios.extend(item["scenario"] for item in response["Items"])
+        if "LastEvaluatedKey" not in response:
+            break
+        kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+    assert scenarios == ["airport_corpus", "restaurant_corpus", "symptom_corpus"]
+    with pytest.raises(ValueError):
+        table.query(KeyConditionExpression=Key("scenario").eq("restaurant_corpus"))
+
+
+def test_segments_cover_every_item_once(table):
+    seen = []
+    for segment in range(3):
+        kwargs = {"Segment": segment, "TotalSegments": 3, "Limit": 4}
+        while True:
+            response = table.scan(**kwargs)
+            assert all(segment_of(item["device_id"], 3) == segment for item in response["Items"])
+            seen.extend((item["device_id"], item["scenario"]) for item in response["Items"])
+            if "LastEvaluatedKey" not in response:
+                break
+            kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+    assert sorted(seen) == sorted(table.items)
+
+
+def test_batch_writer_applies_on_exit(table):
+    with table.batch_writer() as batch:
+        batch.delete_item(Key=key("device-1"))
+        batch.put_item(Item=key("device-20"))
+        assert table.get_item(Key=key("device-1")) != {}
+    assert table.get_item(Key=key("device-1")) == {}
+    assert table.get_item(Key=key("device-20"))["Item"] == key("device-20")
+
+
+def test_database_batch_write_item(table):
+    database = LocalDatabase(table)
+    response = database.batch_write_item(RequestItems={table.name: [
+        {"DeleteRequest": {"Key": key("device-1")}}, {"PutRequest": {"Item": key("device-20")}}]})
+    assert response == {"UnprocessedItems": {}}
+    assert table.get_item(Key=key("device-1")) == {}
+    assert table.get_item(Key=key("device-20"))["Item"] == key("device-20")
@@ -0,0 +1,59 @@
+import os
+import shutil
+import collections
+
+import pytest
+
+
+# a locale directory with copies of en-GB under other names, the loaded locales and the resolved names are
+# those of this directory for the test
+@pytest.fixture
+def locale_dir(teachme, tmp_path, monkeypatch):
+    for locale_name in ("en-GB", "en-US", "en-AU"):
+        shutil.copytree(os.path.join(teachme.LOCALE_DIR, "en-GB"), str(tmp_path / locale_name))
+    monkeypatch.setattr(teachme, "LOCALE_DIR", str(tmp_path))
+    monkeypatch.setattr(teachme, "loaded_locales", collections.OrderedDict())
+    teachme.resolve_locale.cache_clear()
+    yield tmp_path
+    teachme.resolve_locale.cache_clear()
+
+
+def test_unknown_locale_falls_back_to_the_default(teachme, locale_dir):
+    assert teachme.resolve_locale("en-US") == "en-US"
+    assert teachme.resolve_locale("fr-FR") == teachme.DEFAULT_LOCALE
+    assert teachme.resolve_locale(None) == teachme.DEFAULT_LOCALE
+    assert teachme.get_locale("fr-FR") is teachme.get_locale(teachme.DEFAULT_LOCALE)
+    assert list(teachme.loaded_locales) == [teachme.DEFAULT_LOCALE]
+
+
+def test_least_recently_used_locale_is_evicted(teachme, locale_dir, monkeypatch):
+    monkeypatch.setattr(teachme, "MAX_LOCALES", 2)
+    british = teachme.get_locale("en-GB")
+    american = teachme.get_locale("en-US")
+    assert teachme.get_locale("en-GB") is british # now the most recently used
+    teachme.get_locale("en-AU")
+    assert list(teachme.loaded_locales) == ["en-GB", "en-AU"]
+    assert teachme.get_locale("en-US") is not american # loaded again
+    assert list(teachme.loaded_locales) == ["en-AU", "en-US"]
+
+
+# the locale is looked up once per request however many texts the response has, and again by the next request
+def test_locale_is_looked_up_once_per_request(teachme, alexa, locale_dir, monkeypatch):
+    get_locale = teachme.get_locale
+    lookups = []
+
+    def counting_get_locale(locale_name):
+        lookups.append(locale_name)
+        return get_locale(locale_name)
+
+    monkeypatch.setattr(teachme, "get_locale", counting_get_locale)
+    session = alexa(locale="en-US")
+    session.send(request_type="LaunchRequest")
+    assert lookups == ["en-US"]
+    session.send("AMAZON.HelpIntent")
+    assert lookups == ["en-US", "en-US"]
+
+
+def test_request_in_an_unknown_locale_gets_the_default_texts(teachme, alexa, locale_dir):
+    speech = alexa(locale="en-GB").send(request_type="LaunchRequest")["response"]["outputSpeech"]
+    assert alexa(locale="fr-FR").send(request_type="LaunchRequest")["response"]["outputSpeech"] == speech
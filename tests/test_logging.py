@@ -0,0 +1,60 @@
+import io
+import json
+import logging
+
+import pytest
+
+from teachme_logging import parse_levels, setup_logging
+
+
+@pytest.fixture
+def logged():
+    stream = io.StringIO()
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    listener = setup_logging({"root": "INFO"}, stream=stream)
+    def lines():
+        listener.stop()
+        return [json.loads(line) for line in stream.getvalue().splitlines()]
+    yield lines
+    listener.stop()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    for handler in handlers:
+        root.addHandler(handler)
+    root.setLevel(level)
+
+
+def test_fields_and_arguments(logged):
+    logging.getLogger("teachme").info("step %s of %s", 3, "restaurant_corpus", extra={"fields": {"key": "device"}})
+    entry, = logged()
+    assert entry["message"] == "step 3 of restaurant_corpus"
+    assert entry["key"] == "device" and entry["level"] == "INFO" and entry["logger"] == "teachme"
+
+
+def test_exception_is_kept_for_the_listener(logged):
+    try:
+        raise ValueError("broken")
+    except ValueError:
+        logging.getLogger("teachme").exception("request failed")
+    entry, = logged()
+    assert entry["message"] == "request failed"
+    assert "ValueError: broken" in entry["exception"]
+
+
+def test_arguments_are_merged_on_the_logging_thread(logged):
+    state = {"step": 1}
+    logging.getLogger("teachme").warning("state %s", state)
+    state["step"] = 2 # changed before the listener writes the record
+    entry, = logged()
+    assert entry["message"] == "state {'step': 1}"
+
+
+def test_stop_twice(logged):
+    logging.getLogger("teachme").warning("once")
+    assert len(logged()) == 1
+    logged() # stopped already
+
+
+def test_parse_levels():
+    assert parse_levels("flask_ask=debug, teachme=INFO,broken") == {"flask_ask": "DEBUG", "teachme": "INFO"}
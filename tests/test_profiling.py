@@ -0,0 +1,69 @@
+import time
+import threading
+
+import pytest
+
+pytest.importorskip("werkzeug")
+from teachme_profiling import ProfilerMiddleware, StackSampler
+
+
+def slow_step():
+    time.sleep(0.05)
+
+
+class App:
+    def __init__(self):
+        self.closed = 0
+
+    def __call__(self, environ, start_response):
+        start_response("200 OK", [])
+        return self
+
+    def __iter__(self):
+        slow_step()
+        yield b"{}"
+
+    def close(self):
+        self.closed += 1
+
+
+def test_response_is_closed_and_profiled(tmp_path):
+    app = App()
+    profiler = ProfilerMiddleware(app, sample_rate=1.0, output_dir=str(tmp_path), interval=0.005)
+    response = profiler({}, lambda *args: None)
+    assert b"".join(response) == b"{}"
+    assert profiler.profiled_requests == 0 # not until the server closes the response
+    response.close()
+    assert app.closed == 1
+    assert profiler.profiled_requests == 1
+    functions = [row["function"] for row in profiler.top_functions(limit=100)["functions"]]
+    assert any("slow_step" in function for function in functions)
+    assert any("slow_step" in stack for stack in profiler.stacks)
+    profiler.dump()
+    assert (tmp_path / "teachme.prof").is_file() and (tmp_path / "teachme.collapsed").is_file()
+
+
+def test_unsampled_requests_pass_through():
+    app = App()
+    profiler = ProfilerMiddleware(app, sample_rate=0.0)
+    assert profiler({}, lambda *args: None) is app
+
+
+def sampler_threads():
+    return [thread.name for thread in threading.enumerate()].count("stack-sampler")
+
+def test_one_sampler_thread_for_concurrent_requests():
+    before = sampler_threads()
+    sampler = StackSampler(0.005)
+    done = threading.Event()
+    workers = [threading.Thread(target=done.wait) for _ in range(3)]
+    for worker in workers:
+        worker.start()
+        sampler.add(worker.ident)
+    time.sleep(0.05)
+    done.set()
+    stacks = [sampler.remove(worker.ident) for worker in workers]
+    for worker in workers:
+        worker.join()
+    assert all(sum(counter.values()) > 0 for counter in stacks)
+    assert sampler_threads() == before + 1
@@ -0,0 +1,85 @@
+from teachme_scheduler import Schedule, FIRST_INTERVAL, RETRY_INTERVAL
+
+
+def test_record_and_next_due():
+    schedule = Schedule()
+    schedule.record("restaurant_corpus", 1, True, now=0)
+    schedule.record("restaurant_corpus", 4, False, now=0)
+    assert schedule.next_due(now=RETRY_INTERVAL - 1) is None
+    assert schedule.next_due(now=RETRY_INTERVAL) == ("restaurant_corpus", 4, RETRY_INTERVAL)
+    schedule.record("restaurant_corpus", 4, True, now=RETRY_INTERVAL)
+    assert schedule.next_due(now=FIRST_INTERVAL) == ("restaurant_corpus", 1, FIRST_INTERVAL)
+
+
+def test_encode_keeps_entries_and_version():
+    schedule = Schedule()
+    schedule.record("restaurant_corpus", 1, True, now=0)
+    schedule.record("symptom_corpus", 2, False, now=0)
+    item = schedule.encode()
+    item["version"] = 3
+    decoded = Schedule.decode(item)
+    assert decoded.entries == schedule.entries
+    assert decoded.corpus_names == schedule.corpus_names
+    assert decoded.version == 3
+    assert Schedule.decode({}).version == 0
+
+
+def stored_schedule(teachme, device_id="device-1"):
+    item = teachme.table.get_item(Key=teachme.item_key(device_id, teachme.SCHEDULE_SCENARIO)).get("Item")
+    return Schedule.decode(item) if item else None
+
+
+# a write only succeeds on the version it was read at
+def test_concurrent_save_is_rejected(teachme):
+    assert teachme.save_schedule("device-1", Schedule())
+    first = teachme.get_schedule("device-1")
+    second = teachme.get_schedule("device-1")
+    first.record("restaurant_corpus", 1, True)
+    assert teachme.save_schedule("device-1", first)
+    assert first.version == 2
+    second.record("restaurant_corpus", 2, True)
+    assert not teachme.save_schedule("device-1", second)
+    stored = stored_schedule(teachme)
+    assert stored.version == 2 and len(stored) == 1
+
+
+def test_apply_outcomes(teachme):
+    teachme.apply_outcomes("device-1", [["restaurant_corpus", 1, True], ["symptom_corpus", 2, False]])
+    stored = stored_schedule(teachme)
+    assert stored.version == 1 and len(stored) == 2
+    teachme.apply_outcomes("device-1", [])
+    assert stored_schedule(teachme).version == 1
+
+
+# another turn saves the schedule between the read and the write of the first attempt, the outcomes
+# are applied again to the schedule it wrote
+def test_apply_outcomes_retries_on_conflict(teachme, monkeypatch):
+    get_schedule = teachme.get_schedule
+    reads = []
+
+    def concurrent_get_schedule(key):
+        schedule = get_schedule(key)
+        if not reads:
+            other = get_schedule(key)
+            other.record("symptom_corpus", 3, True)
+            assert teachme.save_schedule(key, other)
+        reads.append(schedule.version)
+        return schedule
+
+    monkeypatch.setattr(teachme, "get_schedule", concurrent_get_schedule)
+    teachme.apply_outcomes("device-1", [["restaurant_corpus", 1, True]])
+    assert reads == [0, 1]
+    stored = stored_schedule(teachme)
+    assert stored.version == 2
+    assert {(stored.corpus_names[index], step) for index, step in stored.entries} == \
+        {("symptom_corpus", 3), ("restaurant_corpus", 1)}
+
+
+def test_apply_outcomes_gives_up_after_the_attempts(teachme, monkeypatch, caplog):
+    attempts = []
+    monkeypatch.setattr(teachme, "save_schedule", lambda key, schedule: attempts.append(key) and False)
+    with caplog.at_level("WARNING", logger="teachme"):
+        teachme.apply_outcomes("device-1", [["restaurant_corpus", 1, True]], attempts=3)
+    assert len(attempts) == 3
+    assert "schedule not saved" in caplog.text
+    assert stored_schedule(teachme) is None
@@ -0,0 +1,55 @@
+import os
+
+import pytest
+
+from teachme_corpus import load_corpora
+from teachme_search import ScenarioIndex, terms
+
+LOCALE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "locales", "en-GB")
+
+
+@pytest.fixture(scope="module")
+def index():
+    return ScenarioIndex(load_corpora(LOCALE, processes=1).values())
+
+
+@pytest.mark.parametrize("query, found", [
+    ("order food", ("restaurant_corpus", "0")),
+    ("describe my symptoms", ("symptom_corpus", "0")),
+    ("ordering dessert", ("restaurant_corpus", "5")),
+    ("an appetizer", ("restaurant_corpus", "1")),
+])
+def test_search(index, query, found):
+    assert index.search(query) == found
+
+
+# words of the request that are in many steps do not find a step on their own
+@pytest.mark.parametrize("query, found", [
+    ("I have a fever", None),
+    ("tell the doctor my symptoms", ("symptom_corpus", "0")),
+    ("I would like to tell you something", None),
+    ("what do I say when I have a stomach ache", ("symptom_corpus", "0")),
+])
+def test_common_words_do_not_decide(index, query, found):
+    assert index.search(query) == found
+
+
+# a step must match at least half of the words of the request
+def test_partial_matches_are_not_found(index):
+    assert index.search("dessert") == ("restaurant_corpus", "5")
+    assert index.search("dessert xylophone trombone") is None
+
+
+def test_every_step_but_the_last_is_indexed(index):
+    corpora = load_corpora(LOCALE, processes=1)
+    assert len(index.steps) == sum(corpus.get_end_id() - 1 for corpus in corpora.values())
+
+
+def test_corpus_filter_and_no_match(index):
+    assert index.search("order food", corpus_name="symptom_corpus") != ("restaurant_corpus", "0")
+    assert index.search("xylophone") is None
+    assert index.search("please") is None # stop words only
+
+
+def test_terms():
+    assert terms("Practise ordering the drinks") == ["order", "drink"]
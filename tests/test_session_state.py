@@ -0,0 +1,88 @@
+import pytest
+
+
+@pytest.fixture
+def session_mode(teachme, monkeypatch):
+    monkeypatch.setattr(teachme, "STATE_MODE", "session")
+    monkeypatch.setattr(teachme, "CHECKPOINT_INTERVAL", 3)
+
+
+def stored_step(teachme, device_id="device-1", corpus_name="restaurant_corpus"):
+    item = teachme.table.items.get((device_id, corpus_name))
+    return None if item is None else item["i"]
+
+
+def start(session, turns):
+    session.send("start_restaurant_intent", {"mode_name": "keywords"})
+    for intent_name in ["second_restaurant_intent", "third_restaurant_intent", "fourth_restaurant_intent"][:turns]:
+        session.send(intent_name)
+
+
+def test_state_is_signed(teachme, alexa, session_mode):
+    session = alexa()
+    start(session, 1)
+    state = session.attributes["state"]
+    assert (state["corpus_name"], state["intent_id"]) == ("restaurant_corpus", "1")
+    assert session.attributes["state_signature"] == teachme.sign_state(state)
+
+
+def test_dynamodb_is_written_on_checkpoints(teachme, alexa, session_mode):
+    session = alexa()
+    session.send("start_restaurant_intent", {"mode_name": "keywords"})
+    assert stored_step(teachme) == 0 # starting a scenario is a checkpoint
+    session.send("second_restaurant_intent")
+    session.send("third_restaurant_intent")
+    assert stored_step(teachme) == 0
+    assert session.attributes["unsaved_turns"] == 2
+    session.send("fourth_restaurant_intent")
+    assert stored_step(teachme) == 3
+    assert session.attributes["unsaved_turns"] == 0
+
+
+@pytest.mark.parametrize("intent_name, request_type", [("AMAZON.StopIntent", "IntentRequest"),
+                                                       ("AMAZON.CancelIntent", "IntentRequest"),
+                                                       ("AMAZON.HelpIntent", "IntentRequest"),
+                                                       (None, "SessionEndedRequest")])
+def test_unsaved_turns_are_saved_when_the_session_ends(teachme, alexa, session_mode, intent_name, request_type):
+    session = alexa()
+    start(session, 2)
+    assert stored_step(teachme) == 0
+    data = session.send(intent_name, request_type=request_type)
+    assert stored_step(teachme) == 2
+    if intent_name == "AMAZON.HelpIntent":
+        assert data["response"]["shouldEndSession"] is True
+
+
+@pytest.mark.parametrize("tamper", [
+    lambda attributes: attributes["state"].update(intent_id="7", intent_name="eighth_restaurant_intent"),
+    lambda attributes: attributes.update(state_signature="0" * 64),
+    lambda attributes: attributes.pop("state_signature"),
+])
+def test_tampered_state_is_not_trusted(teachme, alexa, session_mode, tamper):
+    session = alexa()
+    start(session, 2) # saved at step 0, the session is at step 2
+    tamper(session.attributes)
+    # the saved step is used instead, so the learner is at step 0 and step 6 is out of order
+    session.send("seventh_restaurant_intent")
+    assert stored_step(teachme) == 0
+    session.send("second_restaurant_intent")
+    assert session.attributes["state"]["intent_id"] == "1"
+    assert session.attributes["state_signature"] == teachme.sign_state(session.attributes["state"])
+
+
+def test_tampered_state_is_not_written(teachme, alexa, session_mode):
+    session = alexa()
+    start(session, 2)
+    session.attributes["state"]["intent_id"] = "7"
+    session.send("AMAZON.StopIntent")
+    assert stored_step(teachme) == 0
+
+
+# starting a scenario again keeps the attributes of its state, but only of a state signed by the skill
+def test_tampered_state_is_not_signed_again(teachme, alexa, session_mode):
+    session = alexa()
+    start(session, 1)
+    session.attributes["state"]["main_course_name"] = "forged"
+    session.send("start_restaurant_intent", {"mode_name": "keywords"})
+    assert "main_course_name" not in session.attributes["state"]
+    assert "mc" not in teachme.table.items[("device-1", "restaurant_corpus")]
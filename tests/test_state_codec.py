@@ -0,0 +1,57 @@
+from teachme_local_store import LocalTable
+from teachme_state_codec import decode_item, encode_item, item_key, update_expression, SCHEMA_VERSION
+
+
+def intent_name_of(corpus_name, intent_id):
+    return "{}-{}".format(corpus_name, intent_id)
+
+
+def test_encode_item_round_trip():
+    state = {"corpus_name": "restaurant_corpus", "intent_id": "3", "mode_name": "keywords",
+             "main_course_name": "rib eye steak"}
+    item = encode_item("device", state)
+    assert item == {"v": SCHEMA_VERSION, "i": 3, "m": 1, "mc": "rib eye steak",
+                    "device_id": "device", "scenario": "restaurant_corpus"}
+    assert decode_item(item, intent_name_of) == dict(state, intent_name="restaurant_corpus-3")
+
+
+def test_none_fields_are_not_stored():
+    state = {"corpus_name": "symptom_corpus", "intent_id": "0", "mode_name": None}
+    item = encode_item("device", state)
+    assert "m" not in item
+    assert decode_item(item) == state
+
+
+def test_unknown_names_are_stored_as_strings():
+    state = {"corpus_name": "airport_corpus", "intent_id": "2", "mode_name": "full"}
+    assert decode_item(encode_item("device", state)) == state
+
+
+def test_update_expression_round_trip_removes_empty_fields():
+    table = LocalTable("device_id", "scenario")
+    key = item_key("device", "restaurant_corpus")
+    for mode_name in ["keywords", None]:
+        state = {"intent_id": "4", "intent_name": "fifth_restaurant_intent", "corpus_name": "restaurant_corpus",
+                 "mode_name": mode_name}
+        expression, names, values = update_expression(state)
+        table.update_item(Key=key, UpdateExpression=expression, ExpressionAttributeNames=names,
+                          ExpressionAttributeValues=values)
+        item = table.get_item(Key=key)["Item"]
+        assert decode_item(item, intent_name_of) == dict(state, intent_name="restaurant_corpus-4")
+    assert "m" not in item
+
+
+def test_single_none_field_only_removes():
+    expression, names, values = update_expression({"main_course_name": None}, whole_state=False)
+    assert expression == "remove #r0"
+    assert names == {"#r0": "mc"} and values == {}
+
+
+def test_older_versions_decode():
+    version_1 = {"device_id": "device", "intent_id": "2", "intent_name": "third_restaurant_intent",
+                 "corpus_name": "restaurant_corpus", "mode_name": None, "main_course_name": "steak"}
+    assert decode_item(version_1) == {"intent_id": "2", "intent_name": "third_restaurant_intent",
+                                      "corpus_name": "restaurant_corpus", "mode_name": None,
+                                      "main_course_name": "steak"}
+    version_2 = {"device_id": "device", "v": 2, "c": 2, "i": 1, "m": None}
+    assert decode_item(version_2) == {"corpus_name": "symptom_corpus", "intent_id": "1", "mode_name": None}
@@ -0,0 +1,158 @@
+import io
+import datetime
+
+import pytest
+
+pytest.importorskip("OpenSSL")
+from cryptography import x509
+from cryptography.x509.oid import NameOID
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from OpenSSL import crypto
+
+import teachme_verification
+from teachme_verification import CertificateCache, VerificationError, fetch_certificate, valid_certificate_url
+
+CERT_URL = "https://s3.amazonaws.com/echo.api/echo-api-cert.pem"
+NOW = datetime.datetime.now(datetime.timezone.utc)
+
+
+def make_certificate(name, issuer=None, ca=False, san=None, not_before=None, not_after=None):
+    key = ec.generate_private_key(ec.SECP256R1())
+    subject = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, name)])
+    builder = (x509.CertificateBuilder()
+               .subject_name(subject)
+               .issuer_name(issuer[0].subject if issuer else subject)
+               .public_key(key.public_key())
+               .serial_number(x509.random_serial_number())
+               .not_valid_before(not_before or NOW - datetime.timedelta(days=1))
+               .not_valid_after(not_after or NOW + datetime.timedelta(days=30))
+               .add_extension(x509.BasicConstraints(ca=ca, path_length=None), critical=True))
+    if ca:
+        builder = builder.add_extension(x509.KeyUsage(digital_signature=True, key_cert_sign=True, crl_sign=True,
+                                                      content_commitment=False, key_encipherment=False,
+                                                      data_encipherment=False, key_agreement=False,
+                                                      encipher_only=False, decipher_only=False), critical=True)
+    if san:
+        builder = builder.add_extension(x509.SubjectAlternativeName([x509.DNSName(san)]), critical=False)
+    cert = builder.sign(issuer[1] if issuer else key, hashes.SHA256())
+    return cert, key
+
+
+def pem(*certs):
+    return b"".join(cert.public_bytes(serialization.Encoding.PEM) for cert, _ in certs)
+
+
+@pytest.fixture
+def root():
+    return make_certificate("Test Root", ca=True)
+
+
+@pytest.fixture
+def intermediate(root):
+    return make_certificate("Test Intermediate", issuer=root, ca=True)
+
+
+@pytest.fixture
+def ca_file(tmp_path, root):
+    path = tmp_path / "roots.pem"
+    path.write_bytes(pem(root))
+    return str(path)
+
+
+# serves the pem bundle instead of the network
+def opener_for(pem_data):
+    return lambda url: io.BytesIO(pem_data)
+
+
+def test_valid_chain(ca_file, intermediate):
+    leaf = make_certificate("echo-api.amazon.com", issuer=intermediate, san="echo-api.amazon.com")
+    cert, not_after = fetch_certificate(CERT_URL, opener_for(pem(leaf, intermediate)), ca_file)
+    assert cert.to_cryptography().subject == leaf[0].subject
+    assert not_after == int(leaf[0].not_valid_after_utc.timestamp())
+
+
+def test_expired_certificate(ca_file, intermediate):
+    leaf = make_certificate("echo-api.amazon.com", issuer=intermediate, san="echo-api.amazon.com",
+                            not_before=NOW - datetime.timedelta(days=10), not_after=NOW - datetime.timedelta(days=1))
+    with pytest.raises(VerificationError):
+        fetch_certificate(CERT_URL, opener_for(pem(leaf, intermediate)), ca_file)
+
+
+def test_wrong_subject_alt_name(ca_file, intermediate):
+    leaf = make_certificate("echo-api.amazon.com", issuer=intermediate, san="example.com")
+    with pytest.raises(VerificationError):
+        fetch_certificate(CERT_URL, opener_for(pem(leaf, intermediate)), ca_file)
+
+
+def test_untrusted_root(ca_file):
+    other_root = make_certificate("Other Root", ca=True)
+    other_intermediate = make_certificate("Other Intermediate", issuer=other_root, ca=True)
+    leaf = make_certificate("echo-api.amazon.com", issuer=other_intermediate, san="echo-api.amazon.com")
+    with pytest.raises(VerificationError):
+        fetch_certificate(CERT_URL, opener_for(pem(leaf, other_intermediate, other_root)), ca_file)
+
+
+def test_self_signed_leaf(ca_file):
+    leaf = make_certificate("echo-api.amazon.com", san="echo-api.amazon.com")
+    with pytest.raises(VerificationError):
+        fetch_certificate(CERT_URL, opener_for(pem(leaf)), ca_file)
+
+
+@pytest.mark.parametrize("url, valid", [
+    ("https://s3.amazonaws.com/echo.api/echo-api-cert.pem", True),
+    ("HTTPS://s3.amazonaws.com:443/echo.api/../echo.api/echo-api-cert.pem", True),
+    ("http://s3.amazonaws.com/echo.api/echo-api-cert.pem", False),
+    ("https://notamazon.com/echo.api/echo-api-cert.pem", False),
+    ("https://s3.amazonaws.com/EcHo.aPi/echo-api-cert.pem", False),
+    ("https://s3.amazonaws.com/invalid.path/echo-api-cert.pem", False),
+    ("https://s3.amazonaws.com:563/echo.api/echo-api-cert.pem", False),
+])
+def test_certificate_url(url, valid):
+    assert valid_certificate_url(url) == valid
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+def test_cache_expires_after_ttl(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(teachme_verification.time, "time", clock.time)
+    fetched = []
+    def fetch(url):
+        fetched.append(url)
+        return "cert-{}".format(len(fetched)), clock.now + 10000
+    cache = CertificateCache(ttl=60, fetch=fetch)
+
+    assert cache.get(CERT_URL) == "cert-1"
+    clock.now += 59
+    assert cache.get(CERT_URL) == "cert-1"
+    clock.now += 2
+    assert cache.get(CERT_URL) == "cert-2"
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_cache_expires_with_certificate(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(teachme_verification.time, "time", clock.time)
+    cache = CertificateCache(ttl=3600, fetch=lambda url: (object(), clock.now + 5))
+    first = cache.get(CERT_URL)
+    clock.now += 6
+    assert cache.get(CERT_URL) is not first
+
+
+def test_failures_are_not_cached():
+    calls = []
+    def fetch(url):
+        calls.append(url)
+        raise VerificationError("Certificate verification failed")
+    cache = CertificateCache(fetch=fetch)
+    for _ in range(2):
+        with pytest.raises(VerificationError):
+            cache.get(CERT_URL)
+    assert len(calls) == 2